@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Allows you to measure the conversion scripts with synthetic documents
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from lib.benchmark import (SCRIPTS, backend_error, compare, environment,
+                           run_script, script_backends)
+from lib.converters import BACKENDS, NATIVE
+from lib.corpus import write_corpus
+
+
+# -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
+
+
+class App(object):
+    """ Application main controller, this class has been defined following the
+    singleton pattern to ensures only one object can be instantiated.
+    """
+
+    __instance = None
+
+    def __new__(cls):
+        """ Prevent multiple instances from self (Singleton Pattern)
+        """
+
+        if cls.__instance == None:
+            cls.__instance = object.__new__(cls)
+            cls.__instance.name = "The one"
+        return cls.__instance
+
+    def __init__(self):
+        self.scripts = None
+        self.backends = None
+        self.count = None
+        self.size = None
+        self.sheets = None
+        self.seed = None
+        self.jobs = None
+        self.timeout = None
+        self.folder = None
+        self.output = None
+        self.previous = None
+
+    def _argparse(self):
+        """ Detines an user-friendly command-line interface and proccess its
+        arguments.
+        """
+
+        description = u'Measure the conversion scripts with synthetic ' \
+                      u'documents.'
+
+        parser = argparse.ArgumentParser(description)
+        parser.add_argument('script', metavar='script', type=str, nargs='*',
+                            help='conversion scripts will be measured, all of '
+                            'them by default: ' + ', '.join(sorted(SCRIPTS)))
+
+        parser.add_argument('-b', '--backend', type=str, dest='backends',
+                            action='append', choices=BACKENDS + (NATIVE,),
+                            help='backend will be measured, it can be given '
+                            'several times, all the available ones by default')
+
+        parser.add_argument('-n', '--files', type=int, dest='count',
+                            default=10, help='number of files of each corpus')
+
+        parser.add_argument('-s', '--size', type=int, dest='size', default=200,
+                            help='paragraphs of each document and rows of '
+                            'each sheet')
+
+        parser.add_argument('--sheets', type=int, dest='sheets', default=1,
+                            help='sheets of each workbook')
+
+        parser.add_argument('--seed', type=int, dest='seed', default=0,
+                            help='seed of the generated contents')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
+
+        parser.add_argument('-f', '--folder', type=str, dest='folder',
+                            default=None,
+                            help='folder where the corpora are generated and '
+                            'kept, a temporary one is used by default')
+
+        parser.add_argument('-o', '--output', type=str, dest='output',
+                            default=None,
+                            help='JSON file where the results are written, '
+                            'they are printed by default')
+
+        parser.add_argument('-c', '--compare', type=str, dest='previous',
+                            default=None,
+                            help='JSON file of a previous run whose results '
+                            'are compared with these ones')
+
+        args = parser.parse_args()
+
+        unknown = [name for name in args.script if name not in SCRIPTS]
+        if unknown:
+            parser.error(u'Unknown scripts: {}'.format(u', '.join(unknown)))
+
+        self.scripts = sorted(set(args.script)) or sorted(SCRIPTS)
+        self.backends = args.backends
+        self.count = args.count
+        self.size = args.size
+        self.sheets = args.sheets
+        self.seed = args.seed
+        self.jobs = args.jobs
+        self.timeout = args.timeout
+        self.folder = args.folder
+        self.output = args.output
+        self.previous = args.previous
+
+    def _corpus(self, folder, extension, corpora, doc_backends):
+        """ Return the files of the corpus with the given extension, it is
+        generated the first time it is needed or reused from a previous run
+        with the same arguments. Word 97-2003 documents are generated with
+        the first available backend.
+        """
+
+        if extension in corpora:
+            return corpora[extension]
+
+        path = os.path.join(folder, u'{}-{}x{}-{}-{}'.format(
+            extension[1:], self.count, self.size, self.sheets, self.seed))
+        try:
+            if os.path.isdir(path) and len(os.listdir(path)) == self.count:
+                files = [os.path.join(path, name)
+                         for name in sorted(os.listdir(path))]
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+                files = write_corpus(path, extension, self.count, self.size,
+                                     self.sheets, self.seed,
+                                     doc_backends[0] if doc_backends else None)
+            corpora[extension] = (files, None)
+        except Exception as ex:
+            corpora[extension] = (None, unicode(ex) or ex.__class__.__name__)
+
+        return corpora[extension]
+
+    def _benchmark(self):
+        """ Performs every run and returns the results
+        """
+
+        folder = self.folder or tempfile.mkdtemp(prefix='benchmark-')
+        corpora, results = {}, []
+        doc_backends = [name for name in BACKENDS if not backend_error(name)]
+
+        try:
+            for script in self.scripts:
+                for extension in SCRIPTS[script][2]:
+                    for backend in script_backends(script):
+                        if self.backends and backend not in self.backends:
+                            continue
+
+                        item = {'script': script, 'input': extension[1:],
+                                'backend': backend, 'jobs': self.jobs}
+                        item.update(self._run(folder, script, extension,
+                                              backend, corpora, doc_backends))
+                        results.append(item)
+                        if self.output:
+                            _print_result(item)
+        finally:
+            if not self.folder:
+                shutil.rmtree(folder, ignore_errors=True)
+
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment(),
+            'corpus': {'files': self.count, 'size': self.size,
+                       'sheets': self.sheets, 'seed': self.seed},
+            'results': results
+        }
+
+    def _run(self, folder, script, extension, backend, corpora, doc_backends):
+        """ Run one script with one backend over a copy of one corpus, so
+        the files converted by previous runs are not found.
+        """
+
+        error = backend_error(backend)
+        if error:
+            return {'error': error}
+
+        files, error = self._corpus(folder, extension, corpora, doc_backends)
+        if error:
+            return {'error': error}
+
+        workdir = tempfile.mkdtemp(prefix='run-', dir=folder)
+        try:
+            copies = []
+            for path in files:
+                copies.append(os.path.join(workdir, os.path.basename(path)))
+                shutil.copyfile(path, copies[-1])
+
+            return run_script(script, copies, backend, self.jobs,
+                              self.timeout)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _write(self, report):
+        """ Write the report and, if there is a previous one, compare them
+        """
+
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if self.output:
+            with io.open(self.output, 'w', encoding='utf-8') as fout:
+                fout.write(unicode(text))
+        else:
+            print text
+
+        if self.previous:
+            with io.open(self.previous, 'r', encoding='utf-8') as fin:
+                previous = json.load(fin)
+
+            if previous.get('corpus') != report['corpus']:
+                print u'\nWARNING: {} was measured with another ' \
+                      u'corpus'.format(self.previous)
+
+            print u'\n{:<32} {:<16} {:>10} {:>10} {:>8}'.format(
+                u'RUN', u'MEASURE', u'BEFORE', u'AFTER', u'CHANGE')
+            for key, field, before, after, change in compare(previous,
+                                                             report):
+                print u'{:<32} {:<16} {:>10.3f} {:>10.3f} {:>+7.1f}%'.format(
+                    key, field, before, after, change * 100)
+
+    def main(self):
+        """ The main application behavior, this method should be used to
+        start the application.
+        """
+
+        self._argparse()
+        try:
+            self._write(self._benchmark())
+        except Exception as ex:
+            print ex
+
+
+def _print_result(item):
+    """ Print the result of a run while the benchmark goes on, it is only
+    done when the results are not printed as JSON.
+    """
+
+    name = u'{} {} {}'.format(item['script'], item['input'], item['backend'])
+    if 'error' in item:
+        print u'{:<28} SKIPPED  {}'.format(name, item['error'])
+    else:
+        print u'{:<28} {:>6.2f} files/s  p95 {:>6.3f}s  {} failed'.format(
+            name, item['files_per_second'] or 0, item['p95'] or 0,
+            item['failed'])
+
+
+# --------------------------- SCRIPT ENTRY POINT ------------------------------
+
+if __name__ == '__main__':
+    App().main()
@@ -7,7 +7,10 @@
 
 import argparse
 import os
-import win32com.client
+
+from lib.batch import expand_paths
+from lib.converters import BACKENDS, TEXT, convert_files, default_backend
+from lib.watch import watch_folders
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -30,10 +33,12 @@ class App(object):
         return cls.__instance
 
     def __init__(self):
-        self.abspath = None
-        self.basename = None
-        self.dirname = None
-        self.filename = None
+        self.files = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
+        self.folders = None
+        self.delay = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -43,40 +48,68 @@ class App(object):
         description = u'Convert a Microsoft Word DOC format to DOCX document.'
 
         parser = argparse.ArgumentParser(description)
-        parser.add_argument('file', metavar='file', type=str,
-                            help='path of the .docx file will be converted')
+        parser.add_argument('file', metavar='file', type=str, nargs='*',
+                            help='path of the .docx file will be converted, '
+                            'folders and glob patterns are also allowed')
+
+        parser.add_argument('-l', '--list', type=str, dest='listfile',
+                            metavar='listfile', default=None,
+                            help='text file with one path to convert per line')
+
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=BACKENDS, default=default_backend(),
+                            help='application used to convert the files')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
+
+        parser.add_argument('-w', '--watch', action='store_true', dest='watch',
+                            help='keep watching the given folders converting '
+                            'new and changed files')
+
+        parser.add_argument('--delay', type=float, dest='delay', default=0.5,
+                            help='seconds a watched file must not change '
+                            'before it is converted')
 
         args = parser.parse_args()
 
-        self.abspath = os.path.abspath(args.file)
-        self.basename = os.path.basename(self.abspath)
-        self.dirname = os.path.dirname(self.abspath)
-        self.filename = self.basename and os.path.splitext(self.basename)[0]
+        if args.watch:
+            self.folders = args.file or ['.']
+            self.delay = args.delay
+            missing = [path for path in self.folders if not os.path.isdir(path)]
+            if missing:
+                parser.error(u'--watch needs existing folders: {}'.format(
+                    ', '.join(missing).decode('utf-8', 'replace')))
+        else:
+            self.files = expand_paths(args.file, ('.doc',), args.listfile)
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
 
     def _doc2docx(self):
         """ Performs the conversion from doc to docx
         """
 
-        new_path = os.path.join(self.dirname, self.filename+'.docx')
-
         try:
-
-            word = win32com.client.DispatchEx("Word.Application")
-            doc = word.Documents.Open(self.abspath)
-            doc.SaveAs(new_path, FileFormat=12)
-
-            doc.Close()
-            word.Quit()
-
+            convert_files(self.files, self.backend, TEXT, 'docx',
+                          self.jobs, self.timeout)
         except Exception as ex:
             print ex
-        else:
-            print u'New file %s has been written.' % new_path
 
-    def _is_file(self):
-        """ Check if given path is a valid file path
+    def _watch(self):
+        """ Keeps converting the files written in the watched folders
         """
-        return os.path.isfile(self.abspath)
+
+        try:
+            watch_folders(self.folders, ('.doc',), self.backend, TEXT, 'docx',
+                          self.delay)
+        except Exception as ex:
+            print ex
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -84,10 +117,13 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
+        if self.folders:
+            self._watch()
+        elif self.files:
             self._doc2docx()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
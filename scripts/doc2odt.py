@@ -6,8 +6,10 @@
 # --------------------------- REQUIRED LIBRARIES ------------------------------
 
 import argparse
-import os
-import win32com.client
+
+from lib.batch import expand_paths
+from lib.converters import BACKENDS, TEXT, convert_files, default_backend
+from lib.journal import Journal
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -30,10 +32,12 @@ class App(object):
         return cls.__instance
 
     def __init__(self):
-        self.abspath = None
-        self.basename = None
-        self.dirname = None
-        self.filename = None
+        self.files = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
+        self.journal = None
+        self.stats = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -43,41 +47,59 @@ class App(object):
         description = u'Convert a Microsoft Word DOCX format to a OpenDocument Text.'
 
         parser = argparse.ArgumentParser(description)
-        parser.add_argument('file', metavar='file', type=str,
-                            help='path of the .docx file will be converted')
+        parser.add_argument('file', metavar='file', type=str, nargs='*',
+                            help='path of the .docx file will be converted, '
+                            'folders and glob patterns are also allowed')
+
+        parser.add_argument('-l', '--list', type=str, dest='listfile',
+                            metavar='listfile', default=None,
+                            help='text file with one path to convert per line')
+
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=BACKENDS, default=default_backend(),
+                            help='application used to convert the files')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
+
+        parser.add_argument('-J', '--journal', type=str, dest='journal',
+                            metavar='journal', default=None,
+                            help='JSON lines file where the result of each '
+                            'file is recorded, files already converted are '
+                            'skipped when it is used again')
+
+        parser.add_argument('--stats', action='store_true', dest='stats',
+                            help='print the latency statistics recorded in '
+                            'the journal instead of converting')
 
         args = parser.parse_args()
 
-        self.abspath = os.path.abspath(args.file)
-        self.basename = os.path.basename(self.abspath)
-        self.dirname = os.path.dirname(self.abspath)
-        self.filename = self.basename and os.path.splitext(self.basename)[0]
+        self.files = expand_paths(args.file, ('.doc', '.docx'), args.listfile)
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
+        self.stats = args.stats
+
+        if args.journal:
+            self.journal = Journal(args.journal)
+        elif args.stats:
+            parser.error(u'--stats requires a journal given with -J')
 
     def _docx2odt(self):
         """ Performs the conversion from docx to odt
         """
 
-        new_path = os.path.join(self.dirname, self.filename+'.odt')
-
         try:
-
-            word = win32com.client.DispatchEx("Word.Application")
-            doc = word.Documents.Open(self.abspath)
-            doc.SaveAs(new_path, FileFormat=23)
-
-            doc.Close()
-            word.Quit()
-
+            convert_files(self.files, self.backend, TEXT, 'odt',
+                          self.jobs, self.timeout,
+                          journal=self.journal)
         except Exception as ex:
             print ex
-        else:
-            str_new_path = new_path.decode('utf-8', 'ignore')
-            print u'New file %s has been written.' % str_new_path
-
-    def _is_file(self):
-        """ Check if given path is a valid file path
-        """
-        return os.path.isfile(self.abspath)
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -85,10 +107,13 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
+        if self.stats:
+            self.journal.print_stats()
+        elif self.files:
             self._docx2odt()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
@@ -6,7 +6,12 @@
 # --------------------------- REQUIRED LIBRARIES ------------------------------
 
 import argparse
+import collections
 import os
+import sys
+import time
+
+from lib.renames import RenamePlan, walk_tree
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
 
@@ -33,6 +38,8 @@ class App(object):
         self.dirname = None
         self.filename = None
         self.case = None
+        self.recursive = None
+        self.dry_run = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -49,6 +56,16 @@ class App(object):
                             choices=['upper', 'lower', 'capitalize'], default=u'capitalize',
                             help='type of case: upper, lower or capitalize')
 
+        parser.add_argument('-r', '--recursive', action='store_true',
+                            dest='recursive',
+                            help='change the case of every file and folder '
+                            'under the given folder, which keeps its name')
+
+        parser.add_argument('-n', '--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only show the new names, nothing is '
+                            'renamed')
+
         args = parser.parse_args()
 
         self.abspath = os.path.abspath(args.file)
@@ -57,24 +74,123 @@ class App(object):
         self.filename = self.basename and os.path.splitext(self.basename)[0]
 
         self.case = args.case
+        self.recursive = args.recursive
+        self.dry_run = args.dry_run
+
+        if self.recursive and not os.path.isdir(self.abspath):
+            parser.error(u'--recursive needs a folder')
 
     def _is_file(self):
         """ Check if given path is a valid file path
         """
         return os.path.isfile(self.abspath) or os.path.isdir(self.abspath)
 
-    def _change_case(self):
-        """ Changes the case of the filename
+    def _new_name(self, name):
+        """ Return the name in the chosen case, or None when the name is not
+        UTF-8 text and its case can not be changed without losing bytes.
         """
 
+        try:
+            text = name.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
         if self.case == 'upper':
-            new_name = self.abspath.replace(self.basename, self.basename.upper())
+            text = text.upper()
         elif self.case == 'lower':
-            new_name = self.abspath.replace(self.basename, self.basename.lower())
+            text = text.lower()
+        else:
+            text = text.capitalize()
+
+        return text.encode('utf-8')
+
+    def _change_case(self):
+        """ Changes the case of the filename
+        """
+
+        new_name = self._new_name(self.basename)
+        if new_name is None:
+            sys.stdout.write(u'{} [SKIPPED] the name is not UTF-8 text\n'
+                             .format(_unicode(self.abspath)).encode('utf-8'))
+            return
+
+        new_name = os.path.join(self.dirname, new_name)
+
+        plan = RenamePlan([(self.abspath, new_name)])
+        if self.dry_run:
+            for old, new in plan.renames:
+                sys.stdout.write(u'{} ===> {}\n'.format(
+                    _unicode(old), _unicode(os.path.basename(new)))
+                                 .encode('utf-8'))
         else:
-            new_name = self.abspath.replace(self.basename, self.basename.capitalize())
+            plan.apply()
+
+    def _change_tree(self):
+        """ Changes the case of every name under the folder. The tree is read
+        once and renamed level by level, the deepest one first, so renaming a
+        folder never changes the path of a name which has not been renamed
+        yet. Names which would be equal, when case is ignored, to other ones
+        in the same folder are left as they are.
+        """
 
-        os.rename(self.abspath, new_name)
+        started = time.time()
+        report = []
+
+        # STEP 1: New names grouped by folder
+        folders = collections.defaultdict(list)
+        for depth, dirpath, name, _ in walk_tree(self.abspath):
+            folders[(depth, dirpath)].append((name, self._new_name(name)))
+
+        levels = collections.defaultdict(list)
+        skipped = 0
+
+        for (depth, dirpath), names in sorted(folders.items()):
+            taken = collections.defaultdict(list)
+            for name, new_name in names:
+                if new_name is not None:
+                    taken[new_name.lower()].append(name)
+
+            for name, new_name in names:
+                if new_name is None:
+                    report.append(u'{} [SKIPPED] the name is not UTF-8 text'
+                                  .format(_unicode(os.path.join(dirpath,
+                                                                name))))
+                    skipped += 1
+                elif len(taken[new_name.lower()]) > 1:
+                    report.append(u'{} [SKIPPED] same name as {}'.format(
+                        _unicode(os.path.join(dirpath, name)),
+                        u', '.join([_unicode(other) for other in
+                                    taken[new_name.lower()]
+                                    if other != name])))
+                    skipped += 1
+                elif name != new_name:
+                    levels[depth].append((os.path.join(dirpath, name),
+                                          os.path.join(dirpath, new_name)))
+
+        # STEP 2: Deepest level first, each one in two phases
+        renamed, error = 0, None
+        for depth in sorted(levels, reverse=True):
+            plan = RenamePlan(sorted(levels[depth]))
+            try:
+                if not self.dry_run:
+                    plan.apply()
+            except Exception as ex:
+                error = unicode(ex) or ex.__class__.__name__
+                break
+
+            renamed += len(plan.renames)
+            for old, new in plan.renames:
+                report.append(u'{} ===> {}'.format(
+                    _unicode(old), _unicode(os.path.basename(new))))
+
+        # STEP 3: Just one write for the whole report
+        if error:
+            report.append(u'[FAILED] {}, the names of this level have been '
+                          u'restored'.format(error))
+        report.append(u'{} names changed, {} skipped in {:.2f} seconds.'
+                      .format(renamed, skipped, time.time() - started))
+
+        sys.stdout.write((u'\n'.join(report) + u'\n').encode('utf-8'))
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -82,8 +198,21 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
-            self._change_case()
+
+        try:
+            if self.recursive:
+                self._change_tree()
+            elif self._is_file():
+                self._change_case()
+        except Exception as ex:
+            print ex
+
+
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+    return path.decode('utf-8', 'replace')
+
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+""" Shared libraries used by the scripts which can be executed directly
+"""
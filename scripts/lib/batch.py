@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Expands the paths given in command line and keeps track of the result of
+each processed file, this allows scripts to process a whole set of files
+using only one application session.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import glob
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def expand_paths(paths, extensions, listfile=None, unique=True):
+    """ Expand the given list of paths, folders are walked recursively and
+    only the files with one of the given extensions will be returned, glob
+    patterns will be expanded and explicit file paths are returned as they
+    are. When a list file is given, it will be read, one path per line.
+    Files found several times are returned once unless unique is False.
+    """
+
+    # STEP 1: Join the paths in list file with the command line paths
+    paths = list(paths or [])
+    if listfile:
+        with open(listfile, 'r') as fin:
+            paths.extend([line.strip() for line in fin if line.strip()])
+
+    # STEP 2: Expand all paths removing duplicates keeping the order
+    extensions = tuple([ext.lower() for ext in extensions])
+    result, seen = [], set()
+
+    for path in paths:
+        for abspath in _expand_path(path, extensions):
+            if not unique:
+                result.append(abspath)
+            elif abspath not in seen:
+                seen.add(abspath)
+                result.append(abspath)
+
+    return result
+
+
+def output_path(abspath, extension, folder=None):
+    """ Return the path of the new file, this will be placed in the same
+    folder as the source file replacing its extension. When another folder is
+    given, the name keeps the source extension and is prefixed with a digest
+    of the source folder, so files from several folders can share it.
+    """
+
+    dirname = os.path.dirname(abspath)
+    filename = os.path.splitext(os.path.basename(abspath))[0]
+
+    if folder:
+        digest = hashlib.md5(_unicode(dirname).encode('utf-8')).hexdigest()
+        filename = u'{}-{}'.format(digest[:8], _unicode(
+            os.path.basename(abspath)))
+        return os.path.join(folder, filename + extension)
+
+    return os.path.join(dirname, filename + extension)
+
+
+def temporary_path(new_path):
+    """ Return the path of a new empty file in the folder of new_path, with
+    the permissions any new file gets, to be renamed to new_path once it has
+    been written. Its name is unique, so processes writing the same new_path
+    at once never write the same temporary file.
+    """
+
+    handle, tmppath = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(new_path)), suffix='.tmp')
+    os.close(handle)
+
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmppath, 0o666 & ~umask)
+
+    return tmppath
+
+
+def _expand_path(path, extensions):
+    """ Expand just one path, it can be a folder, a glob pattern or a file
+    """
+
+    abspath = os.path.abspath(path)
+
+    if os.path.isdir(abspath):
+        for root, dirs, files in os.walk(abspath):
+            dirs.sort()
+            for name in sorted(files):
+                if name.startswith('~$'):
+                    continue # Office lock files
+                if os.path.splitext(name)[1].lower() in extensions:
+                    yield os.path.join(root, name)
+
+    elif os.path.isfile(abspath):
+        yield abspath
+
+    elif glob.has_magic(path):
+        for match in sorted(glob.glob(path)):
+            for item in _expand_path(match, extensions):
+                yield item
+
+
+# ------------------------------ BATCH CLASS ----------------------------------
+
+
+class Batch(object):
+    """ Keeps the result of each one of the files processed in a batch and
+    prints a summary when all of them have been processed. A quiet batch does
+    not print the result of each file as it is recorded, on_result is called
+    with the same arguments as append for each result.
+    """
+
+    def __init__(self, quiet=False, on_result=None):
+        self._results = []
+        self._started = time.time()
+        self._quiet = quiet
+        self._on_result = on_result
+
+    @property
+    def results(self):
+        """ Return the list of tuples (path, error, seconds, output, cached)
+        """
+        return self._results
+
+    @property
+    def failed(self):
+        """ Return the number of files which could not be processed
+        """
+        return len([item for item in self._results if item[1]])
+
+    def run(self, abspath, target, *args, **kwargs):
+        """ Calls target with the given arguments and records the result,
+        target must return the path of the new file.
+        """
+
+        started = time.time()
+        error, output = None, None
+
+        try:
+            output = target(*args, **kwargs)
+        except Exception as ex:
+            error = unicode(ex) if unicode(ex) else ex.__class__.__name__
+
+        self.append(abspath, error, time.time() - started, output)
+
+        return output
+
+    def append(self, abspath, error, seconds, output=None, cached=False):
+        """ Records the result of a file which has been processed outside
+        """
+
+        self._results.append((abspath, error, seconds, output, cached))
+
+        if self._on_result:
+            self._on_result(abspath, error, seconds, output, cached)
+
+        if self._quiet:
+            pass
+        elif error:
+            _print(u'{} [FAILED] {}'.format(_unicode(abspath), error))
+        elif cached:
+            _print(u'New file {} has been taken from cache.'.format(
+                _unicode(output)))
+        else:
+            _print(u'New file {} has been written.'.format(_unicode(output)))
+
+    def summary(self):
+        """ Prints the result of each file and the totals
+        """
+
+        total = len(self._results)
+        failed = self.failed
+        elapsed = time.time() - self._started
+
+        lines = [u'', u'{:<8} {:>9}  {}'.format(u'STATUS', u'SECONDS',
+                                                u'FILE')]
+
+        for abspath, error, seconds, _, cached in self._results:
+            status = u'FAILED' if error else (u'CACHED' if cached else u'OK')
+            lines.append(u'{:<8} {:>9.2f}  {}'.format(status, seconds,
+                                                      _unicode(abspath)))
+
+        cached = len([item for item in self._results if item[4]])
+
+        lines.append(u'')
+        lines.append(u'{} files, {} converted, {} failed in {:.2f} seconds.'
+                     .format(total, total - failed, failed, elapsed))
+
+        if cached:
+            lines.append(u'{} files have been taken from cache.'
+                         .format(cached))
+
+        _print(u'\n'.join(lines))
+
+
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'ignore') if path else u''
+
+
+def _print(text):
+    """ Write a line of the report encoded as UTF-8, names which are not
+    ASCII can be written to a pipe too. Results are recorded before they are
+    printed, so a report which can not be written does not stop the batch.
+    """
+
+    try:
+        sys.stdout.write((text + u'\n').encode('utf-8'))
+        sys.stdout.flush()
+    except IOError:
+        pass
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0914
+""" Benchmark of the conversion scripts. Every run executes the App of one
+script in a new process, with the same arguments it would receive from the
+command line, so each one starts with a cold converter and its peak memory is
+measured on its own. The time spent in each file is taken from the Batch
+returned by convert_files.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import importlib
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from lib.converters import SPREADSHEET, TEXT, backends_for, find_soffice
+from lib.journal import percentile
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Script name -> (document kind, target format, input extensions)
+SCRIPTS = {
+    'doc2docx': (TEXT, 'docx', ('.doc',)),
+    'doc2odt': (TEXT, 'odt', ('.docx', '.doc')),
+    'doc2pdf': (TEXT, 'pdf', ('.docx', '.doc')),
+    'xls2ods': (SPREADSHEET, 'ods', ('.xls', '.xlsx')),
+    'xls2pdf': (SPREADSHEET, 'pdf', ('.xls', '.xlsx')),
+    'xls2xlsx': (SPREADSHEET, 'xlsx', ('.xls',)),
+}
+
+# Fields of two results which are compared by compare()
+COMPARED = (('files_per_second', True), ('p50', False), ('p95', False),
+            ('max_rss_mb', False))
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def backend_error(backend):
+    """ Return why the given backend can not be used in this machine, or None
+    if it is available.
+    """
+
+    if backend == 'office':
+        try:
+            import win32com.client
+        except ImportError:
+            return u'Microsoft Office needs pywin32'
+
+    elif backend == 'soffice':
+        if not os.path.isfile(find_soffice()):
+            return u'LibreOffice was not found'
+        try:
+            import uno
+        except ImportError:
+            return u'The LibreOffice UNO bridge is not available'
+
+    return None
+
+
+def script_backends(script):
+    """ Return the backends which can be used by the given script
+    """
+
+    kind, fmt, _ = SCRIPTS[script]
+    return backends_for(kind, fmt)
+
+
+def run_script(script, files, backend, jobs=1, timeout=300):
+    """ Convert the files with the App of the given script in a new process
+    and return a dictionary with its measures. The run fails when the process
+    dies without them or does not finish in timeout seconds per file.
+    """
+
+    queue = multiprocessing.Queue()
+    argv = ['-b', backend, '-j', str(jobs), '-t', str(timeout)] + list(files)
+
+    sys.stdout.flush()
+    process = multiprocessing.Process(target=_run, args=(script, argv, queue))
+    process.start()
+    result = _wait_result(process, queue, timeout * (len(files) + 1))
+    process.join(5)
+
+    if 'error' in result:
+        return result
+
+    seconds = result.pop('latencies')
+    size = sum([os.path.getsize(path) for path in files])
+    wall = result['seconds']
+
+    result.update({
+        'files_per_second': result['converted'] / wall if wall else None,
+        'mb_per_second': size / 1048576.0 / wall if wall else None,
+        'mean': sum(seconds) / len(seconds) if seconds else None,
+        'p50': percentile(seconds, 0.50),
+        'p95': percentile(seconds, 0.95),
+        'max': max(seconds) if seconds else None,
+    })
+
+    return result
+
+
+def environment():
+    """ Return a description of the machine running the benchmark
+    """
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': multiprocessing.cpu_count(),
+    }
+
+
+def compare(previous, current):
+    """ Return the rows (key, field, before, after, change) comparing the
+    results of two benchmarks, change is the relative improvement: positive
+    when the current run is better.
+    """
+
+    before = dict([(_key(item), item) for item in previous['results']])
+
+    rows = []
+    for item in current['results']:
+        old = before.get(_key(item))
+        if not old or 'error' in old or 'error' in item:
+            continue
+
+        for field, higher_is_better in COMPARED:
+            if old.get(field) is None or item.get(field) is None:
+                continue
+            if not old[field]:
+                continue
+            change = (item[field] - old[field]) / float(old[field])
+            rows.append((_key(item), field, old[field], item[field],
+                         change if higher_is_better else -change))
+
+    return rows
+
+
+def _key(item):
+    """ Return the identity of a result used to compare runs
+    """
+    return u'{} {} {} j{}'.format(item['script'], item['input'],
+                                  item['backend'], item['jobs'])
+
+
+# ------------------------------ CHILD PROCESS --------------------------------
+
+
+def _run(script, argv, queue):
+    """ Run the App of a script in this process, its output is discarded and
+    the measures are sent back through the queue.
+    """
+
+    batches = []
+    try:
+        module = importlib.import_module(script)
+        convert_files = module.convert_files
+
+        def _convert_files(*args, **kwargs):
+            batch = convert_files(*args, **kwargs)
+            batches.append(batch)
+            return batch
+
+        module.convert_files = _convert_files
+        sys.argv = [script + '.py'] + argv
+
+        _silence()
+        started = time.time()
+        module.App().main()
+        seconds = time.time() - started
+
+    except BaseException as ex:
+        queue.put({'error': unicode(ex) or ex.__class__.__name__})
+        return
+
+    results = [item for batch in batches for item in batch.results]
+    queue.put({
+        'files': len(results),
+        'converted': len([item for item in results if not item[1]]),
+        'failed': len([item for item in results if item[1]]),
+        'errors': sorted(set([item[1] for item in results if item[1]])),
+        'seconds': seconds,
+        'latencies': [item[2] for item in results if not item[1]],
+        'max_rss_mb': _peak_rss(),
+    })
+
+
+def _wait_result(process, queue, timeout):
+    """ Return the measures sent by the process, or an error when it dies
+    without sending them or exceeds the timeout
+    """
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return queue.get(True, 1)
+        except Empty:
+            pass
+
+        if not process.is_alive():
+            # Its last message may arrive just after it has finished
+            try:
+                return queue.get(True, 1)
+            except Empty:
+                return {'error': u'script died with exit code {}'.format(
+                    process.exitcode)}
+
+        if time.time() > deadline:
+            process.terminate()
+            return {'error': u'script did not finish in {} seconds'.format(
+                timeout)}
+
+
+def _silence():
+    """ Send the output of this process, and the converters it launches, to
+    the null device.
+    """
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    null = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(null, 1)
+    os.dup2(null, 2)
+    os.close(null)
+
+
+def _peak_rss():
+    """ Return the peak resident memory, in megabytes, of this process or of
+    the largest of the children it has waited for, None if it is unknown.
+    """
+
+    if resource is None:
+        return None
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+
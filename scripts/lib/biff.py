@@ -0,0 +1,1414 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902,R0912,R0914,R0915
+""" Reader for Microsoft Excel 97-2003 workbooks (BIFF8 records stored in an
+OLE2 compound file). It has been written to convert workbooks without Excel,
+so sheets are read as a stream of rows and only the workbook globals (styles,
+sheet names and defined names) are kept in memory.
+
+The formulas are decompiled from their parsed tokens back to the A1 text used
+by OOXML, so they can be written again as formulas and not only as values.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import array
+import mmap
+import re
+import struct
+import sys
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+
+# Record types
+R_FORMULA = 0x0006
+R_EOF = 0x000A
+R_EXTERNSHEET = 0x0017
+R_NAME = 0x0018
+R_DATEMODE = 0x0022
+R_EXTERNNAME = 0x0023
+R_FONT = 0x0031
+R_CONTINUE = 0x003C
+R_COLINFO = 0x007D
+R_BOUNDSHEET = 0x0085
+R_PALETTE = 0x0092
+R_MULRK = 0x00BD
+R_MULBLANK = 0x00BE
+R_XF = 0x00E0
+R_MERGEDCELLS = 0x00E5
+R_SST = 0x00FC
+R_LABELSST = 0x00FD
+R_SUPBOOK = 0x01AE
+R_DIMENSIONS = 0x0200
+R_BLANK = 0x0201
+R_NUMBER = 0x0203
+R_LABEL = 0x0204
+R_BOOLERR = 0x0205
+R_STRING = 0x0207
+R_ROW = 0x0208
+R_ARRAY = 0x0221
+R_RK = 0x027E
+R_FORMAT = 0x041E
+R_SHRFMLA = 0x04BC
+R_BOF = 0x0809
+
+ERRORS = {
+    0x00: u'#NULL!', 0x07: u'#DIV/0!', 0x0F: u'#VALUE!', 0x17: u'#REF!',
+    0x1D: u'#NAME?', 0x24: u'#NUM!', 0x2A: u'#N/A'
+}
+
+BUILTIN_NAMES = {
+    0x00: u'Consolidate_Area', 0x01: u'Auto_Open', 0x02: u'Auto_Close',
+    0x03: u'Extract', 0x04: u'Database', 0x05: u'Criteria',
+    0x06: u'Print_Area', 0x07: u'Print_Titles', 0x08: u'Recorder',
+    0x09: u'Data_Form', 0x0A: u'Auto_Activate', 0x0B: u'Auto_Deactivate',
+    0x0C: u'Sheet_Title', 0x0D: u'_FilterDatabase'
+}
+
+DEFAULT_PALETTE = [
+    0x000000, 0xFFFFFF, 0xFF0000, 0x00FF00, 0x0000FF, 0xFFFF00, 0xFF00FF,
+    0x00FFFF, 0x800000, 0x008000, 0x000080, 0x808000, 0x800080, 0x008080,
+    0xC0C0C0, 0x808080, 0x9999FF, 0x993366, 0xFFFFCC, 0xCCFFFF, 0x660066,
+    0xFF8080, 0x0066CC, 0xCCCCFF, 0x000080, 0xFF00FF, 0xFFFF00, 0x00FFFF,
+    0x800080, 0x800000, 0x008080, 0x0000FF, 0x00CCFF, 0xCCFFFF, 0xCCFFCC,
+    0xFFFF99, 0x99CCFF, 0xFF99CC, 0xCC99FF, 0xFFCC99, 0x3366FF, 0x33CCCC,
+    0x99CC00, 0xFFCC00, 0xFF9900, 0xFF6600, 0x666699, 0x969696, 0x003366,
+    0x339966, 0x003300, 0x333300, 0x993300, 0x993366, 0x333399, 0x333333
+]
+
+# Operators by token, binary ones and unary ones
+BINARY_OPERATORS = {
+    0x03: u'+', 0x04: u'-', 0x05: u'*', 0x06: u'/', 0x07: u'^', 0x08: u'&',
+    0x09: u'<', 0x0A: u'<=', 0x0B: u'=', 0x0C: u'>=', 0x0D: u'>',
+    0x0E: u'<>', 0x0F: u' ', 0x10: u',', 0x11: u':'
+}
+
+# Built-in functions: index -> (name, number of arguments or None if the
+# function takes a variable number of them)
+FUNCTIONS = {
+    0: (u'COUNT', None), 1: (u'IF', None), 2: (u'ISNA', 1),
+    3: (u'ISERROR', 1), 4: (u'SUM', None), 5: (u'AVERAGE', None),
+    6: (u'MIN', None), 7: (u'MAX', None), 8: (u'ROW', None),
+    9: (u'COLUMN', None), 10: (u'NA', 0), 11: (u'NPV', None),
+    12: (u'STDEV', None), 13: (u'DOLLAR', None), 14: (u'FIXED', None),
+    15: (u'SIN', 1), 16: (u'COS', 1), 17: (u'TAN', 1), 18: (u'ATAN', 1),
+    19: (u'PI', 0), 20: (u'SQRT', 1), 21: (u'EXP', 1), 22: (u'LN', 1),
+    23: (u'LOG10', 1), 24: (u'ABS', 1), 25: (u'INT', 1), 26: (u'SIGN', 1),
+    27: (u'ROUND', 2), 28: (u'LOOKUP', None), 29: (u'INDEX', None),
+    30: (u'REPT', 2), 31: (u'MID', 3), 32: (u'LEN', 1), 33: (u'VALUE', 1),
+    34: (u'TRUE', 0), 35: (u'FALSE', 0), 36: (u'AND', None),
+    37: (u'OR', None), 38: (u'NOT', 1), 39: (u'MOD', 2), 40: (u'DCOUNT', 3),
+    41: (u'DSUM', 3), 42: (u'DAVERAGE', 3), 43: (u'DMIN', 3),
+    44: (u'DMAX', 3), 45: (u'DSTDEV', 3), 46: (u'VAR', None),
+    47: (u'DVAR', 3), 48: (u'TEXT', 2), 49: (u'LINEST', None),
+    50: (u'TREND', None), 51: (u'LOGEST', None), 52: (u'GROWTH', None),
+    56: (u'PV', None), 57: (u'FV', None), 58: (u'NPER', None),
+    59: (u'PMT', None), 60: (u'RATE', None), 61: (u'MIRR', 3),
+    62: (u'IRR', None), 63: (u'RAND', 0), 64: (u'MATCH', None),
+    65: (u'DATE', 3), 66: (u'TIME', 3), 67: (u'DAY', 1), 68: (u'MONTH', 1),
+    69: (u'YEAR', 1), 70: (u'WEEKDAY', None), 71: (u'HOUR', 1),
+    72: (u'MINUTE', 1), 73: (u'SECOND', 1), 74: (u'NOW', 0),
+    75: (u'AREAS', 1), 76: (u'ROWS', 1), 77: (u'COLUMNS', 1),
+    78: (u'OFFSET', None), 82: (u'SEARCH', None), 83: (u'TRANSPOSE', 1),
+    86: (u'TYPE', 1), 97: (u'ATAN2', 2), 98: (u'ASIN', 1), 99: (u'ACOS', 1),
+    100: (u'CHOOSE', None), 101: (u'HLOOKUP', None),
+    102: (u'VLOOKUP', None), 105: (u'ISREF', 1), 109: (u'LOG', None),
+    111: (u'CHAR', 1), 112: (u'LOWER', 1), 113: (u'UPPER', 1),
+    114: (u'PROPER', 1), 115: (u'LEFT', None), 116: (u'RIGHT', None),
+    117: (u'EXACT', 2), 118: (u'TRIM', 1), 119: (u'REPLACE', 4),
+    120: (u'SUBSTITUTE', None), 121: (u'CODE', 1), 124: (u'FIND', None),
+    125: (u'CELL', None), 126: (u'ISERR', 1), 127: (u'ISTEXT', 1),
+    128: (u'ISNUMBER', 1), 129: (u'ISBLANK', 1), 130: (u'T', 1),
+    131: (u'N', 1), 140: (u'DATEVALUE', 1), 141: (u'TIMEVALUE', 1),
+    142: (u'SLN', 3), 143: (u'SYD', 4), 144: (u'DDB', None),
+    148: (u'INDIRECT', None), 162: (u'CLEAN', 1), 163: (u'MDETERM', 1),
+    164: (u'MINVERSE', 1), 165: (u'MMULT', 2), 167: (u'IPMT', None),
+    168: (u'PPMT', None), 169: (u'COUNTA', None), 183: (u'PRODUCT', None),
+    184: (u'FACT', 1), 189: (u'DPRODUCT', 3), 190: (u'ISNONTEXT', 1),
+    193: (u'STDEVP', None), 194: (u'VARP', None), 195: (u'DSTDEVP', 3),
+    196: (u'DVARP', 3), 197: (u'TRUNC', None), 198: (u'ISLOGICAL', 1),
+    199: (u'DCOUNTA', 3), 204: (u'USDOLLAR', None), 205: (u'FINDB', None),
+    206: (u'SEARCHB', None), 207: (u'REPLACEB', 4), 208: (u'LEFTB', None),
+    209: (u'RIGHTB', None), 210: (u'MIDB', 3), 211: (u'LENB', 1),
+    212: (u'ROUNDUP', 2), 213: (u'ROUNDDOWN', 2), 214: (u'ASC', 1),
+    215: (u'DBCS', 1), 216: (u'RANK', None), 219: (u'ADDRESS', None),
+    220: (u'DAYS360', None), 221: (u'TODAY', 0), 222: (u'VDB', None),
+    227: (u'MEDIAN', None), 228: (u'SUMPRODUCT', None), 229: (u'SINH', 1),
+    230: (u'COSH', 1), 231: (u'TANH', 1), 232: (u'ASINH', 1),
+    233: (u'ACOSH', 1), 234: (u'ATANH', 1), 235: (u'DGET', 3),
+    244: (u'INFO', 1), 247: (u'DB', None), 252: (u'FREQUENCY', 2),
+    261: (u'ERROR.TYPE', 1), 269: (u'AVEDEV', None),
+    270: (u'BETADIST', None), 271: (u'GAMMALN', 1),
+    272: (u'BETAINV', None), 273: (u'BINOMDIST', 4), 274: (u'CHIDIST', 2),
+    275: (u'CHIINV', 2), 276: (u'COMBIN', 2), 277: (u'CONFIDENCE', 3),
+    278: (u'CRITBINOM', 3), 279: (u'EVEN', 1), 280: (u'EXPONDIST', 3),
+    281: (u'FDIST', 3), 282: (u'FINV', 3), 283: (u'FISHER', 1),
+    284: (u'FISHERINV', 1), 285: (u'FLOOR', 2), 286: (u'GAMMADIST', 4),
+    287: (u'GAMMAINV', 3), 288: (u'CEILING', 2), 289: (u'HYPGEOMDIST', 4),
+    290: (u'LOGNORMDIST', 3), 291: (u'LOGINV', 3),
+    292: (u'NEGBINOMDIST', 3), 293: (u'NORMDIST', 4),
+    294: (u'NORMSDIST', 1), 295: (u'NORMINV', 3), 296: (u'NORMSINV', 1),
+    297: (u'STANDARDIZE', 3), 298: (u'ODD', 1), 299: (u'PERMUT', 2),
+    300: (u'POISSON', 3), 301: (u'TDIST', 3), 302: (u'WEIBULL', 4),
+    303: (u'SUMXMY2', 2), 304: (u'SUMX2MY2', 2), 305: (u'SUMX2PY2', 2),
+    306: (u'CHITEST', 2), 307: (u'CORREL', 2), 308: (u'COVAR', 2),
+    309: (u'FORECAST', 3), 310: (u'FTEST', 2), 311: (u'INTERCEPT', 2),
+    312: (u'PEARSON', 2), 313: (u'RSQ', 2), 314: (u'STEYX', 2),
+    315: (u'SLOPE', 2), 316: (u'TTEST', 4), 317: (u'PROB', None),
+    318: (u'DEVSQ', None), 319: (u'GEOMEAN', None),
+    320: (u'HARMEAN', None), 321: (u'SUMSQ', None), 322: (u'KURT', None),
+    323: (u'SKEW', None), 324: (u'ZTEST', None), 325: (u'LARGE', 2),
+    326: (u'SMALL', 2), 327: (u'QUARTILE', 2), 328: (u'PERCENTILE', 2),
+    329: (u'PERCENTRANK', None), 330: (u'MODE', None),
+    331: (u'TRIMMEAN', 2), 332: (u'TINV', 2), 336: (u'CONCATENATE', None),
+    337: (u'POWER', 2), 342: (u'RADIANS', 1), 343: (u'DEGREES', 1),
+    344: (u'SUBTOTAL', None), 345: (u'SUMIF', None), 346: (u'COUNTIF', 2),
+    347: (u'COUNTBLANK', 1), 350: (u'ISPMT', 4), 351: (u'DATEDIF', 3),
+    352: (u'DATESTRING', 1), 353: (u'NUMBERSTRING', 2),
+    354: (u'ROMAN', None), 358: (u'GETPIVOTDATA', None),
+    359: (u'HYPERLINK', None), 360: (u'PHONETIC', 1),
+    361: (u'AVERAGEA', None), 362: (u'MAXA', None), 363: (u'MINA', None),
+    364: (u'STDEVPA', None), 365: (u'VARPA', None), 366: (u'STDEVA', None),
+    367: (u'VARA', None)
+}
+
+# Functions added in Excel 2007 which are stored as add-in names in BIFF8
+XLFN_FUNCTIONS = (
+    u'IFERROR', u'SUMIFS', u'COUNTIFS', u'AVERAGEIF', u'AVERAGEIFS'
+)
+
+MAX_ROW = 0xFFFF
+MAX_COL = 0xFF
+
+# Sheet names like these must be quoted because they look like references
+CELL_LIKE = re.compile(r'^([A-Za-z]{1,3}[0-9]+|[Rr][0-9]*[Cc][0-9]*)$')
+
+
+# ------------------------------- EXCEPTIONS ----------------------------------
+
+
+class BiffError(Exception):
+    """ The file is not a valid BIFF8 workbook
+    """
+    pass
+
+
+class FormulaError(Exception):
+    """ The formula uses a token which can not be decompiled
+    """
+    pass
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def cell_name(row, col, row_abs=False, col_abs=False):
+    """ Return the A1 name of the cell in the given zero based row and column
+    """
+    return u'{}{}{}{}'.format(u'$' if col_abs else u'', column_name(col),
+                              u'$' if row_abs else u'', row + 1)
+
+
+def column_name(col):
+    """ Return the letters of the given zero based column
+    """
+
+    name = u''
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        name = unichr(65 + rem) + name
+
+    return name
+
+
+def quote_sheet(name):
+    """ Quote the sheet name if it is needed to use it in a formula
+    """
+
+    if name and (name[0].isalpha() or name[0] == u'_') and \
+            all([char.isalnum() or char in u'._' for char in name]) and \
+            not CELL_LIKE.match(name):
+        return name
+
+    return u"'{}'".format(name.replace(u"'", u"''"))
+
+
+def _u8(data, pos):
+    return struct.unpack_from('<B', data, pos)[0]
+
+
+def _u16(data, pos):
+    return struct.unpack_from('<H', data, pos)[0]
+
+
+def _u32(data, pos):
+    return struct.unpack_from('<I', data, pos)[0]
+
+
+def _float(data, pos):
+    return struct.unpack_from('<d', data, pos)[0]
+
+
+def _rk(value):
+    """ Decode a RK number
+    """
+
+    if value & 0x02:
+        number = float(value >> 2 if value < 0x80000000 else
+                       (value >> 2) - 0x40000000)
+    else:
+        number = struct.unpack('<d', struct.pack('<Q', (value & ~0x03) << 32))[0]
+
+    if value & 0x01:
+        number /= 100.0
+
+    return number
+
+
+def _string(data, pos, length_size=2):
+    """ Read an unicode string with its length and option flags, returns the
+    string and the position after it.
+    """
+
+    if length_size == 1:
+        length = _u8(data, pos)
+    else:
+        length = _u16(data, pos)
+    pos += length_size
+
+    return _chars(data, pos, length)
+
+
+def _chars(data, pos, length):
+    """ Read length characters preceded by the option flags, returns the
+    string and the position after it (rich text and phonetic data skipped).
+    """
+
+    flags = _u8(data, pos)
+    pos += 1
+
+    runs, extra = 0, 0
+    if flags & 0x08:
+        runs = _u16(data, pos)
+        pos += 2
+    if flags & 0x04:
+        extra = _u32(data, pos)
+        pos += 4
+
+    if flags & 0x01:
+        text = data[pos:pos + 2 * length].decode('utf-16-le')
+        pos += 2 * length
+    else:
+        text = data[pos:pos + length].decode('latin-1')
+        pos += length
+
+    return text, pos + 4 * runs + extra
+
+
+# --------------------------- COMPOUND FILE CLASS -----------------------------
+
+
+class CompoundFile(object):
+    """ Minimal OLE2 compound file reader, streams are read from a memory
+    mapped view of the file following the sector chains.
+    """
+
+    def __init__(self, path):
+        self._fin = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._fin.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._fin.close()
+            raise BiffError(u'Empty file')
+
+        if self._mmap[0:8] != OLE_SIGNATURE:
+            self.close()
+            raise BiffError(u'It is not an OLE2 compound file')
+
+        header = self._mmap[0:512]
+        self._sector_size = 1 << _u16(header, 30)
+        self._mini_size = 1 << _u16(header, 32)
+        self._mini_cutoff = _u32(header, 56)
+
+        self._fat = self._read_fat(header)
+        self._minifat = None
+        self._ministream = None
+
+        self._entries = self._read_directory(_u32(header, 48))
+        self._header = header
+
+    def close(self):
+        """ Release the file
+        """
+        self._mmap.close()
+        self._fin.close()
+
+    def open_stream(self, names):
+        """ Return the first stream found with one of the given names
+        """
+
+        for name in names:
+            for entry_name, entry_type, start, size in self._entries:
+                if entry_type == 2 and entry_name.lower() == name.lower():
+                    return self._stream(start, size)
+
+        raise BiffError(u'Stream {} not found'.format(u'/'.join(names)))
+
+    def _offset(self, sector):
+        """ Return the file offset of the given sector
+        """
+        return (sector + 1) * self._sector_size
+
+    def _read_fat(self, header):
+        """ Return the FAT as an array of sector ids
+        """
+
+        per_sector = self._sector_size // 4
+
+        # STEP 1: Collect the FAT sectors from the header and DIFAT chain
+        sectors = [_u32(header, 76 + 4 * index) for index in range(109)]
+
+        difat, count = _u32(header, 68), _u32(header, 72)
+        while difat not in (ENDOFCHAIN, FREESECT) and count > 0:
+            offset = self._offset(difat)
+            block = self._mmap[offset:offset + self._sector_size]
+            sectors.extend([_u32(block, 4 * index)
+                            for index in range(per_sector - 1)])
+            difat = _u32(block, self._sector_size - 4)
+            count -= 1
+
+        # STEP 2: Read the FAT
+        fat = _sector_array()
+        for sector in sectors[:_u32(header, 44)]:
+            offset = self._offset(sector)
+            fat.fromstring(self._mmap[offset:offset + self._sector_size])
+
+        if sys.byteorder == 'big':
+            fat.byteswap()
+
+        return fat
+
+    def _chain(self, start, fat):
+        """ Return the list of sectors of the chain beginning in start
+        """
+
+        chain = []
+        sector = start
+        while sector < len(fat) and len(chain) <= len(fat):
+            chain.append(sector)
+            sector = fat[sector]
+
+        return chain
+
+    def _read_directory(self, start):
+        """ Return the list of directory entries (name, type, start, size)
+        """
+
+        data = b''.join([self._mmap[self._offset(sector):
+                                    self._offset(sector) + self._sector_size]
+                         for sector in self._chain(start, self._fat)])
+
+        entries = []
+        for pos in range(0, len(data) - 127, 128):
+            namelen = _u16(data, pos + 64)
+            name = data[pos:pos + max(0, namelen - 2)].decode('utf-16-le')
+            entries.append((name, _u8(data, pos + 66),
+                            _u32(data, pos + 116), _u32(data, pos + 120)))
+
+        return entries
+
+    def _stream(self, start, size):
+        """ Return the stream beginning in the given sector
+        """
+
+        if size >= self._mini_cutoff:
+            runs = []
+            for sector in self._chain(start, self._fat):
+                offset = self._offset(sector)
+                if runs and runs[-1][0] + runs[-1][1] == offset:
+                    runs[-1][1] += self._sector_size
+                else:
+                    runs.append([offset, self._sector_size])
+            return OleStream(self._mmap, runs, size)
+
+        # Small streams are stored in the mini stream, they are read at once
+        if self._ministream is None:
+            root = self._entries[0]
+            runs = [[self._offset(sector), self._sector_size]
+                    for sector in self._chain(root[2], self._fat)]
+            self._ministream = OleStream(self._mmap, runs, root[3])
+
+            minifat = _sector_array()
+            for sector in self._chain(_u32(self._header, 60), self._fat):
+                offset = self._offset(sector)
+                minifat.fromstring(
+                    self._mmap[offset:offset + self._sector_size])
+            if sys.byteorder == 'big':
+                minifat.byteswap()
+            self._minifat = minifat
+
+        data = []
+        for sector in self._chain(start, self._minifat):
+            self._ministream.seek(sector * self._mini_size)
+            data.append(self._ministream.read(self._mini_size))
+
+        return OleStream(b''.join(data), [[0, size]], size)
+
+
+def _sector_array():
+    """ Return an empty array of unsigned 32 bits integers, the type code
+    for them depends on the platform.
+    """
+
+    for code in ('I', 'L'):
+        if array.array(code).itemsize == 4:
+            return array.array(code)
+
+    raise BiffError(u'Unsupported platform')
+
+
+class OleStream(object):
+    """ File-like view of a stream made by runs of contiguous bytes
+    """
+
+    def __init__(self, source, runs, size):
+        self._source = source
+        self._runs = runs
+        self._size = size
+        self._pos = 0
+
+        self._starts = []
+        total = 0
+        for _, length in runs:
+            self._starts.append(total)
+            total += length
+
+    def seek(self, pos):
+        """ Move to the given position
+        """
+        self._pos = pos
+
+    def tell(self):
+        """ Return the current position
+        """
+        return self._pos
+
+    def read(self, size):
+        """ Read size bytes from the current position
+        """
+
+        size = max(0, min(size, self._size - self._pos))
+        chunks = []
+
+        while size > 0:
+            index = self._run(self._pos)
+            offset, length = self._runs[index]
+            skip = self._pos - self._starts[index]
+            count = min(size, length - skip)
+            chunks.append(self._source[offset + skip:offset + skip + count])
+            self._pos += count
+            size -= count
+
+        return b''.join(chunks)
+
+    def _run(self, pos):
+        """ Return the index of the run which contains pos
+        """
+
+        low, high = 0, len(self._starts) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._starts[middle] <= pos:
+                low = middle
+            else:
+                high = middle - 1
+
+        return low
+
+
+# ---------------------------- WORKBOOK CLASS ---------------------------------
+
+
+class Sheet(object):
+    """ Sheet declared in the workbook globals
+    """
+
+    def __init__(self, index, name, offset, state, kind):
+        self.index = index
+        self.name = name
+        self.offset = offset
+        self.state = state  # 0 visible, 1 hidden, 2 very hidden
+        self.kind = kind    # 0 worksheet, 2 chart, 6 VB module
+
+    @property
+    def is_worksheet(self):
+        """ Check if the sheet has cells
+        """
+        return self.kind == 0
+
+
+class DefinedName(object):
+    """ Name defined in the workbook
+    """
+
+    def __init__(self, name, scope, hidden, builtin, tokens):
+        self.name = name
+        self.scope = scope      # Sheet index or None for global names
+        self.hidden = hidden
+        self.builtin = builtin
+        self.tokens = tokens
+        self.formula = None
+
+
+class Workbook(object):
+    """ BIFF8 workbook, globals are read when the object is created and the
+    cells of each sheet are read on demand with rows().
+    """
+
+    def __init__(self, path, shared_string=None):
+        """ Open the workbook, every string in the shared string table is
+        passed to shared_string as it is read, so the table does not need to
+        be kept in memory.
+        """
+
+        self._ole = CompoundFile(path)
+        self._stream = self._ole.open_stream([u'Workbook', u'Book'])
+
+        self.date1904 = False
+        self.sheets = []
+        self.fonts = []
+        self.formats = {}
+        self.xfs = []
+        self.palette = list(DEFAULT_PALETTE)
+        self.names = []
+        self.strings = 0
+        self.lost_formulas = 0
+
+        self._supbooks = []
+        self._externsheets = []
+        self._shared_string = shared_string
+
+        self._read_globals()
+        self._decompiler = Decompiler(self)
+
+        for name in self.names:
+            try:
+                name.formula = self._decompiler.decompile(name.tokens)
+            except FormulaError:
+                name.formula = None
+
+    def close(self):
+        """ Release the file
+        """
+        self._ole.close()
+
+    # --------------------------- RECORD READING ------------------------------
+
+    def _records(self, offset):
+        """ Yield the records (type, data) beginning in offset, CONTINUE
+        records are returned joined to the previous record as a list of
+        chunks in the third item.
+        """
+
+        stream = self._stream
+        stream.seek(offset)
+
+        pending = None
+        while True:
+            header = stream.read(4)
+            if len(header) < 4:
+                break
+
+            rtype, length = struct.unpack('<HH', header)
+            data = stream.read(length)
+
+            if rtype == R_CONTINUE and pending:
+                pending[2].append(data)
+                continue
+
+            if pending:
+                yield pending
+                if pending[0] == R_EOF:
+                    pending = None
+                    break
+
+            pending = (rtype, data, [data])
+
+        if pending:
+            yield pending
+
+    # --------------------------- WORKBOOK GLOBALS ----------------------------
+
+    def _read_globals(self):
+        """ Read the workbook globals substream
+        """
+
+        records = self._records(0)
+        rtype, data, _ = next(records)
+        if rtype != R_BOF or _u16(data, 0) != 0x0600:
+            raise BiffError(u'Only Excel 97-2003 (BIFF8) files are supported')
+
+        for rtype, data, chunks in records:
+            if rtype == R_EOF:
+                break
+            elif rtype == R_DATEMODE:
+                self.date1904 = bool(_u16(data, 0))
+            elif rtype == R_FONT:
+                self._read_font(data)
+            elif rtype == R_FORMAT:
+                self.formats[_u16(data, 0)] = _string(data, 2)[0]
+            elif rtype == R_XF:
+                self._read_xf(data)
+            elif rtype == R_PALETTE:
+                count = _u16(data, 0)
+                for index in range(count):
+                    red, green, blue = struct.unpack_from(
+                        '<BBB', data, 2 + 4 * index)
+                    self.palette[8 + index] = (red << 16) | (green << 8) | blue
+            elif rtype == R_BOUNDSHEET:
+                name = _string(data, 6, 1)[0]
+                self.sheets.append(Sheet(len(self.sheets), name,
+                                         _u32(data, 0), _u8(data, 4) & 0x03,
+                                         _u8(data, 5)))
+            elif rtype == R_SST:
+                self._read_sst(chunks)
+            elif rtype == R_SUPBOOK:
+                self._read_supbook(data)
+            elif rtype == R_EXTERNNAME and self._supbooks:
+                self._read_externname(data)
+            elif rtype == R_EXTERNSHEET:
+                count = _u16(data, 0)
+                data = b''.join(chunks)
+                self._externsheets = [
+                    struct.unpack_from('<HHH', data, 2 + 6 * index)
+                    for index in range(count)]
+            elif rtype == R_NAME:
+                self._read_name(b''.join(chunks))
+
+    def _read_font(self, data):
+        """ Read a FONT record, font number 4 does not exist in BIFF files
+        """
+
+        height, flags, color, weight = struct.unpack_from('<HHHH', data, 0)
+        underline = _u8(data, 10)
+        name = _string(data, 14, 1)[0]
+
+        font = {
+            'name': name, 'size': height / 20.0, 'bold': weight >= 700,
+            'italic': bool(flags & 0x02), 'strike': bool(flags & 0x08),
+            'underline': underline, 'color': color
+        }
+
+        if len(self.fonts) == 4:
+            self.fonts.append(None)
+        self.fonts.append(font)
+
+    def _read_xf(self, data):
+        """ Read a XF record with the style of the cells
+        """
+
+        font, fmt, flags = struct.unpack_from('<HHH', data, 0)
+        align, _, indent = struct.unpack_from('<BBB', data, 6)
+        borders, colors = struct.unpack_from('<II', data, 10)
+        pattern_colors = _u16(data, 18)
+
+        self.xfs.append({
+            'font': font, 'format': fmt, 'style': bool(flags & 0x04),
+            'halign': align & 0x07, 'wrap': bool(align & 0x08),
+            'valign': (align >> 4) & 0x07, 'indent': indent & 0x0F,
+            'border': (borders & 0x0F, (borders >> 4) & 0x0F,
+                       (borders >> 8) & 0x0F, (borders >> 12) & 0x0F),
+            'border_color': ((borders >> 16) & 0x7F, (borders >> 23) & 0x7F,
+                             colors & 0x7F, (colors >> 7) & 0x7F),
+            'pattern': (colors >> 26) & 0x3F,
+            'fill_color': pattern_colors & 0x7F,
+            'back_color': (pattern_colors >> 7) & 0x7F
+        })
+
+    def _read_sst(self, chunks):
+        """ Read the shared string table, strings can be split between the
+        SST record and the following CONTINUE records; in that case the
+        characters in each CONTINUE begin with a new option flags byte.
+        """
+
+        reader = _ChunkReader(chunks)
+        reader.skip(4)
+        count = reader.u32()
+
+        for _ in range(count):
+            if reader.eof():
+                break
+            self.strings += 1
+            text = reader.string()
+            if self._shared_string:
+                self._shared_string(text)
+
+    def _read_supbook(self, data):
+        """ Read a SUPBOOK record, it can be this workbook, an add-in or an
+        external workbook.
+        """
+
+        count, marker = struct.unpack_from('<HH', data, 0)
+        if marker == 0x0401:
+            self._supbooks.append(('self', [], []))
+        elif marker == 0x3A01:
+            self._supbooks.append(('addin', [], []))
+        else:
+            self._supbooks.append(('external', [], []))
+
+    def _read_externname(self, data):
+        """ Read an EXTERNNAME record of the last SUPBOOK
+        """
+
+        name = _string(data, 6, 1)[0]
+        self._supbooks[-1][2].append(name)
+
+    def _read_name(self, data):
+        """ Read a NAME record
+        """
+
+        flags = _u16(data, 0)
+        length = _u8(data, 3)
+        size = _u16(data, 4)
+        scope = _u16(data, 8)
+
+        text, pos = _chars(data, 14, length)
+        tokens = data[pos:pos + size]
+
+        builtin = bool(flags & 0x20)
+        if builtin:
+            text = BUILTIN_NAMES.get(ord(text[0]) if text else 0, text)
+
+        self.names.append(DefinedName(
+            text, scope - 1 if scope else None, bool(flags & 0x01), builtin,
+            tokens))
+
+    # ------------------------------ SHEET CELLS ------------------------------
+
+    def rows(self, sheet):
+        """ Yield the content of the given sheet as a sequence of events:
+
+            ('columns', [(first, last, width, xf, hidden), ...])
+            ('row', index, attributes, [(col, xf, type, value, formula)])
+            ('merged', [(first_row, last_row, first_col, last_col), ...])
+
+        Rows are yielded in order, only one row is kept in memory. Cell type
+        is one of 'n' number, 's' shared string, 'str' string, 'b' boolean,
+        'e' error or None for empty cells which only have style.
+        """
+
+        columns, merged = [], []
+        row_attrs = {}
+        shared, arrays = {}, {}
+        current, cells = None, []
+        started = False
+
+        records = self._records(sheet.offset)
+        next(records)
+
+        for rtype, data, chunks in records:
+
+            # STEP 1: Records which come before the cells
+            if rtype == R_COLINFO:
+                first, last, width, xf, flags = struct.unpack_from(
+                    '<HHHHH', data, 0)
+                columns.append((first, last, width / 256.0, xf,
+                                bool(flags & 0x01)))
+                continue
+
+            if not started and rtype in (R_DIMENSIONS, R_ROW, R_EOF):
+                started = True
+                yield ('columns', columns)
+
+            if rtype == R_EOF:
+                break
+
+            if rtype == R_ROW:
+                row, _, _, height, _, _, flags, xf = struct.unpack_from(
+                    '<HHHHHHHH', data, 0)
+                row_attrs[row] = {
+                    'height': (height & 0x7FFF) / 20.0,
+                    'custom': bool(flags & 0x40), 'hidden': bool(flags & 0x20),
+                    'xf': (xf & 0x0FFF) if flags & 0x80 else None
+                }
+                continue
+
+            if rtype == R_MERGEDCELLS:
+                count = _u16(data, 0)
+                merged.extend([struct.unpack_from('<HHHH', data, 2 + 8 * index)
+                               for index in range(count)])
+                continue
+
+            if rtype == R_SHRFMLA:
+                first, last, first_col, last_col = struct.unpack_from(
+                    '<HHBB', data, 0)
+                size = _u16(data, 8)
+                shared[(first, first_col)] = (data[10:10 + size],
+                                              data[10 + size:])
+                continue
+
+            if rtype == R_ARRAY:
+                first, last, first_col, last_col = struct.unpack_from(
+                    '<HHBB', data, 0)
+                size = _u16(data, 12)
+                arrays[(first, first_col)] = (
+                    (first, last, first_col, last_col),
+                    data[14:14 + size], data[14 + size:])
+                continue
+
+            if rtype == R_STRING and cells and cells[-1][2] == 'str':
+                cells[-1][3] = _string(b''.join(chunks), 0)[0]
+                continue
+
+            # STEP 2: Cell records
+            new_cells = self._cells(rtype, data)
+            if not new_cells:
+                continue
+
+            row = new_cells[0][0]
+            if row != current:
+                if current is not None:
+                    yield self._row(current, row_attrs, cells, shared, arrays)
+                current, cells = row, []
+
+            cells.extend([cell[1:] for cell in new_cells])
+
+        if current is not None:
+            yield self._row(current, row_attrs, cells, shared, arrays)
+
+        if not started:
+            yield ('columns', columns)
+
+        yield ('merged', merged)
+
+    def _row(self, index, row_attrs, cells, shared, arrays):
+        """ Return the event for a full row decompiling its formulas
+        """
+
+        result = []
+        for col, xf, ctype, value, tokens in cells:
+            formula = None
+            if tokens is not None:
+                formula = self._formula(index, col, tokens, shared, arrays)
+            result.append((col, xf, ctype, value, formula))
+
+        result.sort(key=lambda cell: cell[0])
+
+        return ('row', index, row_attrs.pop(index, None), result)
+
+    def _formula(self, row, col, tokens, shared, arrays):
+        """ Decompile the formula of the given cell, it returns the formula
+        text, a tuple (ref, text) for array formulas, or None if the formula
+        can not be decompiled, it is counted in lost_formulas, or it belongs
+        to an array but it is not its first cell.
+        """
+
+        try:
+            if tokens and _u8(tokens, 0) == 0x01:
+                base = struct.unpack_from('<HH', tokens, 1)
+                if base in arrays:
+                    if base != (row, col):
+                        return None
+                    bounds, rgce, extra = arrays[base]
+                    ref = u'{}:{}'.format(cell_name(bounds[0], bounds[2]),
+                                          cell_name(bounds[1], bounds[3]))
+                    text = self._decompiler.decompile(rgce, row, col, extra)
+                    return (ref, text)
+                if base in shared:
+                    rgce, extra = shared[base]
+                    return self._decompiler.decompile(rgce, row, col, extra)
+                raise FormulaError(u'Missing shared formula')
+
+            return self._decompiler.decompile(tokens, row, col, b'')
+
+        except (FormulaError, struct.error, KeyError, IndexError):
+            self.lost_formulas += 1
+            return None
+
+    def _cells(self, rtype, data):
+        """ Return the cells in a cell record as mutable lists
+        [row, col, xf, type, value, tokens]
+        """
+
+        if rtype == R_NUMBER:
+            row, col, xf = struct.unpack_from('<HHH', data, 0)
+            return [[row, col, xf, 'n', _float(data, 6), None]]
+
+        if rtype == R_RK:
+            row, col, xf, value = struct.unpack_from('<HHHI', data, 0)
+            return [[row, col, xf, 'n', _rk(value), None]]
+
+        if rtype == R_MULRK:
+            row, first = struct.unpack_from('<HH', data, 0)
+            count = (len(data) - 6) // 6
+            result = []
+            for index in range(count):
+                xf, value = struct.unpack_from('<HI', data, 4 + 6 * index)
+                result.append([row, first + index, xf, 'n', _rk(value), None])
+            return result
+
+        if rtype == R_LABELSST:
+            row, col, xf, index = struct.unpack_from('<HHHI', data, 0)
+            return [[row, col, xf, 's', index, None]]
+
+        if rtype == R_LABEL:
+            row, col, xf = struct.unpack_from('<HHH', data, 0)
+            return [[row, col, xf, 'str', _string(data, 6)[0], None]]
+
+        if rtype == R_BLANK:
+            row, col, xf = struct.unpack_from('<HHH', data, 0)
+            return [[row, col, xf, None, None, None]]
+
+        if rtype == R_MULBLANK:
+            row, first = struct.unpack_from('<HH', data, 0)
+            count = (len(data) - 6) // 2
+            return [[row, first + index, _u16(data, 4 + 2 * index), None,
+                     None, None] for index in range(count)]
+
+        if rtype == R_BOOLERR:
+            row, col, xf, value, is_error = struct.unpack_from(
+                '<HHHBB', data, 0)
+            if is_error:
+                return [[row, col, xf, 'e', ERRORS.get(value, u'#N/A'), None]]
+            return [[row, col, xf, 'b', bool(value), None]]
+
+        if rtype == R_FORMULA:
+            row, col, xf = struct.unpack_from('<HHH', data, 0)
+            size = _u16(data, 20)
+            tokens = data[22:22 + size]
+            if _u16(data, 12) == 0xFFFF:
+                kind, value = _u8(data, 6), _u8(data, 8)
+                if kind == 0:
+                    return [[row, col, xf, 'str', u'', tokens]]
+                elif kind == 1:
+                    return [[row, col, xf, 'b', bool(value), tokens]]
+                elif kind == 2:
+                    return [[row, col, xf, 'e', ERRORS.get(value, u'#N/A'),
+                             tokens]]
+                return [[row, col, xf, 'str', u'', tokens]]
+            return [[row, col, xf, 'n', _float(data, 6), tokens]]
+
+        return None
+
+    # --------------------------- FORMULA CONTEXT -----------------------------
+
+    def externsheet(self, index):
+        """ Return the text prefix (with !) for the given EXTERNSHEET index
+        """
+
+        book, first, last = self._externsheets[index]
+        kind = self._supbooks[book][0] if book < len(self._supbooks) else None
+
+        if kind != 'self':
+            raise FormulaError(u'External references are not supported')
+
+        if first >= 0xFFFE or first >= len(self.sheets):
+            return u'#REF!'
+
+        name = self.sheets[first].name
+        if last != first and last < len(self.sheets):
+            name = u'{}:{}'.format(name, self.sheets[last].name)
+
+        return quote_sheet(name) + u'!'
+
+    def name(self, index):
+        """ Return the defined name for the given one based index
+        """
+        return self.names[index - 1].name
+
+    def externname(self, sheet_index, index):
+        """ Return the external name in the SUPBOOK of the given EXTERNSHEET
+        """
+
+        book = self._externsheets[sheet_index][0]
+        kind, _, names = self._supbooks[book]
+        if kind == 'external':
+            raise FormulaError(u'External names are not supported')
+
+        name = names[index - 1] if kind == 'addin' else self.name(index)
+        if name.startswith(u'_xlfn.') and name[6:] in XLFN_FUNCTIONS:
+            name = name[6:]
+
+        return name
+
+
+class _ChunkReader(object):
+    """ Reads the SST record and its CONTINUE records
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._index = 0
+        self._pos = 0
+
+    def eof(self):
+        """ Check if all chunks have been read
+        """
+        self._next()
+        return self._index >= len(self._chunks)
+
+    def _next(self):
+        """ Go to the next chunk if the current one has been read
+        """
+        while self._index < len(self._chunks) and \
+                self._pos >= len(self._chunks[self._index]):
+            self._index += 1
+            self._pos = 0
+
+    def read(self, size):
+        """ Read size bytes crossing chunk boundaries
+        """
+
+        result = []
+        while size > 0:
+            self._next()
+            if self._index >= len(self._chunks):
+                break
+            chunk = self._chunks[self._index]
+            data = chunk[self._pos:self._pos + size]
+            self._pos += len(data)
+            size -= len(data)
+            result.append(data)
+
+        return b''.join(result)
+
+    def skip(self, size):
+        """ Skip size bytes
+        """
+        self.read(size)
+
+    def u32(self):
+        """ Read an unsigned 32 bits number
+        """
+        return _u32(self.read(4), 0)
+
+    def string(self):
+        """ Read an unicode string, when characters continue in the next
+        chunk it begins with a new option flags byte.
+        """
+
+        length = _u16(self.read(2), 0)
+        flags = _u8(self.read(1), 0)
+
+        runs = _u16(self.read(2), 0) if flags & 0x08 else 0
+        extra = _u32(self.read(4), 0) if flags & 0x04 else 0
+
+        parts = []
+        wide = flags & 0x01
+        while length > 0:
+            self._next()
+            if self._index >= len(self._chunks):
+                break
+
+            available = len(self._chunks[self._index]) - self._pos
+            if wide:
+                count = min(length, available // 2)
+                parts.append(self.read(2 * count).decode('utf-16-le'))
+            else:
+                count = min(length, available)
+                parts.append(self.read(count).decode('latin-1'))
+            length -= count
+
+            if length > 0:
+                self._index += 1
+                self._pos = 0
+                if self._index < len(self._chunks):
+                    wide = _u8(self.read(1), 0) & 0x01
+
+        self.skip(4 * runs + extra)
+
+        return u''.join(parts)
+
+
+# --------------------------- DECOMPILER CLASS --------------------------------
+
+
+class Decompiler(object):
+    """ Translates BIFF8 formula tokens to A1 formula text
+    """
+
+    def __init__(self, workbook):
+        self._workbook = workbook
+
+    def decompile(self, tokens, row=0, col=0, extra=b''):
+        """ Return the text, without the leading =, of the formula in tokens.
+        Row and column of the cell are needed by the relative references of
+        shared formulas, extra has the constant arrays.
+        """
+
+        stack = []
+        arrays = _ArrayReader(extra)
+        pos, size = 0, len(tokens)
+
+        while pos < size:
+            ptg = _u8(tokens, pos)
+            pos += 1
+            base = ptg if ptg < 0x20 else (ptg & 0x1F) | 0x20
+
+            if base in BINARY_OPERATORS:
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(left + BINARY_OPERATORS[base] + right)
+
+            elif base == 0x12:
+                stack.append(u'+' + stack.pop())
+            elif base == 0x13:
+                stack.append(u'-' + stack.pop())
+            elif base == 0x14:
+                stack.append(stack.pop() + u'%')
+            elif base == 0x15:
+                stack.append(u'(' + stack.pop() + u')')
+            elif base == 0x16:
+                stack.append(u'')
+
+            elif base == 0x17:
+                text, pos = _string(tokens, pos, 1)
+                stack.append(u'"' + text.replace(u'"', u'""') + u'"')
+
+            elif base == 0x19:
+                flags, count = struct.unpack_from('<BH', tokens, pos)
+                pos += 3
+                if flags & 0x04:
+                    pos += 2 * (count + 1)
+                if flags & 0x10:
+                    stack.append(u'SUM(' + stack.pop() + u')')
+
+            elif base == 0x1C:
+                stack.append(ERRORS.get(_u8(tokens, pos), u'#N/A'))
+                pos += 1
+            elif base == 0x1D:
+                stack.append(u'TRUE' if _u8(tokens, pos) else u'FALSE')
+                pos += 1
+            elif base == 0x1E:
+                stack.append(unicode(_u16(tokens, pos)))
+                pos += 2
+            elif base == 0x1F:
+                stack.append(_number(_float(tokens, pos)))
+                pos += 8
+
+            elif base == 0x20:
+                stack.append(arrays.next())
+                pos += 7
+
+            elif base == 0x21:
+                index = _u16(tokens, pos)
+                pos += 2
+                name, count = FUNCTIONS.get(index, (None, None))
+                if name is None or count is None:
+                    raise FormulaError(u'Unknown function {}'.format(index))
+                stack.append(_call(name, stack, count))
+
+            elif base == 0x22:
+                count, index = struct.unpack_from('<BH', tokens, pos)
+                pos += 3
+                count &= 0x7F
+                index &= 0x7FFF
+                if index == 255:
+                    args = _pop(stack, count)
+                    stack.append(args[0] + u'(' + u','.join(args[1:]) + u')')
+                elif index in FUNCTIONS:
+                    stack.append(_call(FUNCTIONS[index][0], stack, count))
+                else:
+                    raise FormulaError(u'Unknown function {}'.format(index))
+
+            elif base == 0x23:
+                stack.append(self._workbook.name(_u16(tokens, pos)))
+                pos += 4
+
+            elif base in (0x24, 0x2C):
+                stack.append(_ref(tokens, pos, row, col, base == 0x2C))
+                pos += 4
+
+            elif base in (0x25, 0x2D):
+                stack.append(_area(tokens, pos, row, col, base == 0x2D))
+                pos += 8
+
+            elif base == 0x26:
+                arrays.skip_areas()
+                pos += 6
+            elif base in (0x27, 0x28):
+                pos += 6
+            elif base in (0x29, 0x2E, 0x2F):
+                pos += 2
+
+            elif base == 0x2A:
+                stack.append(u'#REF!')
+                pos += 4
+            elif base == 0x2B:
+                stack.append(u'#REF!')
+                pos += 8
+
+            elif base == 0x39:
+                sheet, index = struct.unpack_from('<HH', tokens, pos)
+                stack.append(self._workbook.externname(sheet, index))
+                pos += 6
+
+            elif base == 0x3A:
+                prefix = self._workbook.externsheet(_u16(tokens, pos))
+                stack.append(prefix + _ref(tokens, pos + 2, row, col, False))
+                pos += 6
+
+            elif base == 0x3B:
+                prefix = self._workbook.externsheet(_u16(tokens, pos))
+                stack.append(prefix + _area(tokens, pos + 2, row, col, False))
+                pos += 10
+
+            elif base == 0x3C:
+                stack.append(self._workbook.externsheet(_u16(tokens, pos)) +
+                             u'#REF!')
+                pos += 6
+            elif base == 0x3D:
+                stack.append(self._workbook.externsheet(_u16(tokens, pos)) +
+                             u'#REF!')
+                pos += 10
+
+            else:
+                raise FormulaError(u'Unsupported token 0x{:02X}'.format(ptg))
+
+        if len(stack) != 1:
+            raise FormulaError(u'Malformed formula')
+
+        return stack[0]
+
+
+class _ArrayReader(object):
+    """ Reads the constant arrays stored after the formula tokens
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def skip_areas(self):
+        """ Skip the list of areas stored for a ptgMemArea token
+        """
+        self._pos += 2 + 8 * _u16(self._data, self._pos)
+
+    def next(self):
+        """ Return the text of the next constant array
+        """
+
+        data = self._data
+        cols = _u8(data, self._pos) + 1
+        rows = _u16(data, self._pos + 1) + 1
+        self._pos += 3
+
+        lines = []
+        for _ in range(rows):
+            values = []
+            for _ in range(cols):
+                kind = _u8(data, self._pos)
+                self._pos += 1
+                if kind == 0x01:
+                    values.append(_number(_float(data, self._pos)))
+                    self._pos += 8
+                elif kind == 0x02:
+                    text, self._pos = _string(data, self._pos)
+                    values.append(u'"' + text.replace(u'"', u'""') + u'"')
+                elif kind == 0x04:
+                    values.append(u'TRUE' if _u8(data, self._pos) else u'FALSE')
+                    self._pos += 8
+                elif kind == 0x10:
+                    values.append(ERRORS.get(_u8(data, self._pos), u'#N/A'))
+                    self._pos += 8
+                else:
+                    values.append(u'')
+                    self._pos += 8
+            lines.append(u','.join(values))
+
+        return u'{' + u';'.join(lines) + u'}'
+
+
+def _number(value):
+    """ Return the shortest text for the given number
+    """
+
+    if value == int(value) and abs(value) < 1e15:
+        return unicode(int(value))
+
+    return unicode(repr(value))
+
+
+def _pop(stack, count):
+    """ Pop count arguments from the stack keeping their order
+    """
+
+    if count > len(stack):
+        raise FormulaError(u'Malformed formula')
+    if count == 0:
+        return []
+
+    args = stack[-count:]
+    del stack[-count:]
+
+    return args
+
+
+def _call(name, stack, count):
+    """ Return the text of a call to name with count arguments
+    """
+    return name + u'(' + u','.join(_pop(stack, count)) + u')'
+
+
+def _cell(row_field, col_field, row, col, relative):
+    """ Return the A1 text for a reference, relative is True in shared
+    formulas where relative rows and columns are offsets from the cell.
+    """
+
+    row_rel = bool(col_field & 0x8000)
+    col_rel = bool(col_field & 0x4000)
+    ref_row = row_field
+    ref_col = col_field & 0x00FF
+
+    if relative:
+        if row_rel:
+            offset = row_field - 0x10000 if row_field & 0x8000 else row_field
+            ref_row = (row + offset) & 0xFFFF
+        if col_rel:
+            offset = ref_col - 0x100 if ref_col & 0x80 else ref_col
+            ref_col = (col + offset) & 0xFF
+
+    return ref_row, ref_col, row_rel, col_rel
+
+
+def _ref(tokens, pos, row, col, relative):
+    """ Return the text for a single cell reference token
+    """
+
+    row_field, col_field = struct.unpack_from('<HH', tokens, pos)
+    ref_row, ref_col, row_rel, col_rel = _cell(row_field, col_field, row, col,
+                                               relative)
+
+    return cell_name(ref_row, ref_col, not row_rel, not col_rel)
+
+
+def _area(tokens, pos, row, col, relative):
+    """ Return the text for an area reference token, whole rows and whole
+    columns are written as 1:1 and A:A.
+    """
+
+    first_row, last_row, first_field, last_field = struct.unpack_from(
+        '<HHHH', tokens, pos)
+
+    row1, col1, row1_rel, col1_rel = _cell(first_row, first_field, row, col,
+                                           relative)
+    row2, col2, row2_rel, col2_rel = _cell(last_row, last_field, row, col,
+                                           relative)
+
+    if row1 == 0 and row2 == MAX_ROW and not (row1_rel or row2_rel):
+        return u'{}{}:{}{}'.format(u'' if col1_rel else u'$', column_name(col1),
+                                   u'' if col2_rel else u'$', column_name(col2))
+
+    if col1 == 0 and col2 == MAX_COL and not (col1_rel or col2_rel):
+        return u'{}{}:{}{}'.format(u'' if row1_rel else u'$', row1 + 1,
+                                   u'' if row2_rel else u'$', row2 + 1)
+
+    return u'{}:{}'.format(cell_name(row1, col1, not row1_rel, not col1_rel),
+                           cell_name(row2, col2, not row2_rel, not col2_rel))
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Content addressed cache for converted files. Entries are keyed on the
+hash of the source file contents plus the converter options, so a file which
+has not changed is served by a copy of the previous result, which can be
+changed without changing the cache.
+Small results computed from a file, like the headings of a PDF, can be kept
+as data entries too.
+The cache folder is kept under a maximum size removing the least recently
+used entries.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import hashlib
+import os
+import shutil
+
+from lib.batch import temporary_path
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+BLOCK_SIZE = 1024 * 1024
+
+DEFAULT_SIZE = 1024  # Megabytes
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def default_folder():
+    """ Return the cache folder will be used when no one has been given
+    """
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'academy-scripts', 'conversions')
+
+
+def file_hash(abspath):
+    """ Return the SHA-256 hex digest of the contents of the given file
+    """
+
+    digest = hashlib.sha256()
+
+    with open(abspath, 'rb') as fin:
+        block = fin.read(BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = fin.read(BLOCK_SIZE)
+
+    return digest.hexdigest()
+
+
+# ------------------------------ CACHE CLASS ----------------------------------
+
+
+class ConversionCache(object):
+    """ Stores converted files in a local folder, each entry is named with the
+    key built from the source hash and the options used to convert it.
+    """
+
+    def __init__(self, folder=None, max_size=DEFAULT_SIZE):
+        self._folder = os.path.abspath(folder or default_folder())
+        self._max_bytes = int(max_size * 1024 * 1024)
+
+        if not os.path.isdir(self._folder):
+            os.makedirs(self._folder)
+
+    @property
+    def folder(self):
+        """ Return the folder where entries are stored
+        """
+        return self._folder
+
+    @staticmethod
+    def key(abspath, *options):
+        """ Return the cache key for the given file converted with the given
+        options, options must be strings.
+        """
+
+        return ConversionCache.content_key(file_hash(abspath), *options)
+
+    @staticmethod
+    def content_key(digest, *options):
+        """ Return the cache key for some contents given by their hex digest,
+        like a page of a PDF, with the given options, options must be strings.
+        """
+
+        digest = hashlib.sha256(digest.encode('ascii'))
+        for option in options:
+            digest.update(b'\0' + unicode(option).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def fetch(self, key, new_path):
+        """ Write the cached entry for key in new_path, returns False when
+        there is no entry for the given key.
+        """
+
+        entry = self._entry(key)
+        if not os.path.isfile(entry):
+            return False
+
+        if os.path.lexists(new_path):
+            os.remove(new_path)
+        shutil.copyfile(entry, new_path)
+
+        _touch(entry)
+
+        return True
+
+    def fetch_data(self, key):
+        """ Return the contents of the entry for key, or None when there is
+        no entry for the given key. Entries of data, unlike files, are
+        stored by store_data.
+        """
+
+        entry = self._entry(key)
+
+        try:
+            with open(entry, 'rb') as fin:
+                data = fin.read()
+        except (IOError, OSError):
+            return None
+
+        _touch(entry)
+
+        return data
+
+    def store(self, key, new_path):
+        """ Save a copy of the converted file new_path as the entry for key
+        """
+        self._save(key, lambda tmppath: shutil.copyfile(new_path, tmppath))
+
+    def store_data(self, key, data):
+        """ Save the given bytes as the entry for key
+        """
+
+        def _write(tmppath):
+            """ Write data in the temporary entry
+            """
+            with open(tmppath, 'wb') as fout:
+                fout.write(data)
+
+        self._save(key, _write)
+
+    def _save(self, key, write):
+        """ Save the entry for key, write is called with the temporary path
+        where it must be written.
+        """
+
+        entry = self._entry(key)
+        folder = os.path.dirname(entry)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # Copy under a temporary name to never expose half written entries
+        tmppath = temporary_path(entry)
+
+        try:
+            write(tmppath)
+            if os.path.exists(entry):
+                os.remove(entry)
+            os.rename(tmppath, entry)
+        except Exception:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache folder is
+        not bigger than the maximum size.
+        """
+
+        entries, total = [], 0
+
+        for root, _, files in os.walk(self._folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        while entries and total > self._max_bytes:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _entry(self, key):
+        """ Return the path of the entry for key
+        """
+        return os.path.join(self._folder, key[:2], key)
+
+
+def _touch(path):
+    """ Update the modification time of path, it is used as last access time
+    because the access time is not reliable in many file systems.
+    """
+
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
@@ -0,0 +1,716 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,W0212
+""" Document conversion backends used by the doc2* and xls2* scripts, all of
+them share the same interface, so scripts do not need to know which one is
+being used:
+
+    - office: Microsoft Word and Microsoft Excel through COM (Windows only)
+    - soffice: LibreOffice in headless mode through an UNO socket listener
+    - native: pure Python, only some conversions, see NATIVE_CONVERSIONS
+
+Each converter keeps its application running between conversions, it must be
+started before the first conversion and stopped after the last one.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+from lib.batch import Batch, output_path
+from lib.sheets import export_pdf
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+BACKENDS = ('office', 'soffice')
+NATIVE = 'native'
+
+TEXT = 'text'
+SPREADSHEET = 'spreadsheet'
+IMAGE = 'image'
+
+# Microsoft Office FileFormat values used by SaveAs
+WORD_FORMATS = {'doc': 0, 'docx': 12, 'pdf': 17, 'odt': 23}
+EXCEL_FORMATS = {'xls': 56, 'xlsx': 51, 'ods': 60}
+
+# LibreOffice export filters by document kind and target format
+SOFFICE_FILTERS = {
+    (TEXT, 'doc'): 'MS Word 97',
+    (TEXT, 'docx'): 'MS Word 2007 XML',
+    (TEXT, 'odt'): 'writer8',
+    (TEXT, 'pdf'): 'writer_pdf_Export',
+    (SPREADSHEET, 'xls'): 'MS Excel 97',
+    (SPREADSHEET, 'xlsx'): 'Calc MS Excel 2007 XML',
+    (SPREADSHEET, 'ods'): 'calc8',
+    (SPREADSHEET, 'pdf'): 'calc_pdf_Export',
+}
+
+SOFFICE_NAMES = ('soffice', 'libreoffice', 'soffice.exe')
+
+# Conversions which can be done without any office application
+NATIVE_CONVERSIONS = set([(SPREADSHEET, 'xlsx'), (SPREADSHEET, 'ods'),
+                          (IMAGE, 'pdf')])
+
+# Conversions which can only be done without office applications
+NATIVE_ONLY = set([(IMAGE, 'pdf')])
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def default_backend(kind=None, fmt=None):
+    """ Return the backend will be used when no one has been given, the
+    native one is preferred outside Windows when it supports the conversion.
+    """
+
+    if (kind, fmt) in NATIVE_ONLY:
+        return NATIVE
+
+    if os.name == 'nt':
+        return 'office'
+
+    return NATIVE if (kind, fmt) in NATIVE_CONVERSIONS else 'soffice'
+
+
+def backends_for(kind, fmt):
+    """ Return the names of the backends which can do the given conversion
+    """
+
+    if (kind, fmt) in NATIVE_ONLY:
+        return (NATIVE,)
+
+    if (kind, fmt) in NATIVE_CONVERSIONS:
+        return BACKENDS + (NATIVE,)
+
+    return BACKENDS
+
+
+def new_converter(backend, kind, **kwargs):
+    """ Return a new, not started, converter for the given document kind
+    """
+
+    backend = backend or default_backend()
+
+    if backend == 'office':
+        converter = WordConverter if kind == TEXT else ExcelConverter
+        return converter(**kwargs)
+    elif backend == 'soffice':
+        return SofficeConverter(kind, **kwargs)
+    elif backend == NATIVE:
+        return NativeConverter(kind, **kwargs)
+
+    raise ValueError(u'Unknown conversion backend {}'.format(backend))
+
+
+def convert_files(files, backend, kind, fmt, jobs=1, timeout=None,
+                  cache=None, options=None, split=False, journal=None,
+                  folder=None, quiet=False):
+    """ Convert all the given files to the given format using only one
+    converter, or one per job when several jobs have been requested. The new
+    files will be written next to the source files. When a ConversionCache is
+    given, unchanged files are taken from it and new results are stored in it.
+    The options are passed to the converters, see Converter.convert, and
+    split exports each sheet of the workbooks on its own, see lib.sheets.
+    When a Journal is given, the files it has as converted are skipped and
+    the result of the others is recorded in it as soon as it is known.
+    When a folder is given the new files are written there, see output_path,
+    and a quiet conversion prints nothing. It returns the Batch with the
+    result of each file.
+    """
+
+    extension = '.' + fmt
+    options = options or {}
+
+    batch = Batch(quiet)
+    if journal:
+        files = journal.pending(files, fmt)
+        batch = Batch(quiet, on_result=journal.recorder(fmt))
+
+    # STEP 1: Only one of the files which would write the same new file is
+    # converted
+    files = _unique_outputs(files, extension, folder, batch)
+
+    # STEP 2: Serve the files which have been converted before from cache
+    keys = {}
+    if cache:
+        files = _fetch_cached(files, extension, folder, batch, cache, keys,
+                              backend, kind, fmt, *_option_keys(options))
+
+    # STEP 3: Convert the remaining files
+    if not files:
+        pass
+
+    elif split:
+        from lib.sheets import export_split
+        export_split(files, backend, jobs, timeout, options, batch)
+
+    else:
+        tasks = [(abspath, output_path(abspath, extension, folder), fmt,
+                  options) for abspath in files]
+        run_tasks(tasks, backend, kind, jobs, timeout, batch)
+
+    # STEP 4: Store the new results in cache
+    if cache:
+        for abspath, error, _, output, cached in batch.results:
+            if not error and not cached and abspath in keys:
+                cache.store(keys[abspath], output)
+        cache.evict()
+
+    if not quiet and (len(batch.results) > 1 or batch.failed):
+        batch.summary()
+
+    return batch
+
+
+def run_tasks(tasks, backend, kind, jobs, timeout, batch):
+    """ Run the given tasks, tuples (abspath, new_path, fmt, options), with
+    only one converter or with a pool of them when several jobs are given.
+    The result of each task is recorded in batch, which is returned.
+    """
+
+    if jobs > 1:
+        from lib.pool import ConverterPool
+        return ConverterPool(backend, kind, jobs, timeout).run(tasks, batch)
+
+    converter = new_converter(backend, kind)
+    converter.start()
+
+    try:
+        for abspath, new_path, fmt, options in tasks:
+            batch.run(abspath, converter.convert, abspath, new_path, fmt,
+                      **options)
+    finally:
+        converter.stop()
+
+    return batch
+
+
+def _option_keys(options):
+    """ Return the options as a sorted list of strings for the cache key
+    """
+
+    return sorted([u'{}={}'.format(key, u','.join(value))
+                   for key, value in options.items() if value])
+
+
+def _unique_outputs(files, extension, folder, batch):
+    """ Return the files whose new file is not the one of a file before them,
+    like book.xls and book.xlsx, the others are recorded as failed.
+    """
+
+    result, outputs = [], {}
+
+    for abspath in files:
+        new_path = os.path.normcase(output_path(abspath, extension, folder))
+        if new_path in outputs:
+            batch.append(abspath, u'{} is converted to the same file'.format(
+                _unicode(outputs[new_path])), 0)
+        else:
+            outputs[new_path] = abspath
+            result.append(abspath)
+
+    return result
+
+
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'ignore')
+
+
+def _fetch_cached(files, extension, folder, batch, cache, keys, *options):
+    """ Write the files found in cache and return those which were not found,
+    the cache key of each one of them is saved in keys.
+    """
+
+    missing = []
+
+    for abspath in files:
+        started = time.time()
+        new_path = output_path(abspath, extension, folder)
+
+        try:
+            key = cache.key(abspath, *options)
+        except (IOError, OSError):
+            missing.append(abspath) # Let the converter report the error
+            continue
+
+        if cache.fetch(key, new_path):
+            batch.append(abspath, None, time.time() - started, new_path, True)
+        else:
+            keys[abspath] = key
+            missing.append(abspath)
+
+    return missing
+
+
+# ---------------------------- CONVERTER CLASS --------------------------------
+
+
+class Converter(object):
+    """ Abstract converter, it defines the interface all backends must follow
+    """
+
+    name = None
+
+    # Process id of the application when it runs in its own process, the pool
+    # kills it when a conversion hangs, see lib.pool
+    pid = None
+
+    def __init__(self, profile=None):
+        self._profile = profile
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """ Launch the application will be used to convert the documents
+        """
+        raise NotImplementedError()
+
+    def stop(self):
+        """ Close the application, errors are ignored
+        """
+        raise NotImplementedError()
+
+    def convert(self, abspath, new_path, fmt, **options):
+        """ Convert the document in abspath writing new_path with the given
+        format, returns new_path. Workbooks exported to pdf accept the options
+        sheets, list of sheet names or positions, and ranges, list of named
+        ranges, the other converters ignore them.
+        """
+        raise NotImplementedError()
+
+    def is_alive(self):
+        """ Return False when the application has died and the converter must
+        be started again.
+        """
+        return True
+
+
+# ------------------------- MICROSOFT OFFICE CLASSES --------------------------
+
+
+class WordConverter(Converter):
+    """ Converts text documents using Microsoft Word through COM
+    """
+
+    name = 'office'
+
+    def __init__(self, profile=None):
+        super(WordConverter, self).__init__(profile)
+        self._word = None
+        self.pid = None
+
+    def start(self):
+        import win32com.client
+        import win32gui
+        self._word = win32com.client.DispatchEx('Word.Application')
+        self._word.Visible = False
+        self._word.DisplayAlerts = 0
+
+        # Word has no window handle, its window is found by a unique caption
+        caption = u'convert-{}-{}'.format(os.getpid(), id(self))
+        self._word.Caption = caption
+        self.pid = _window_pid(win32gui.FindWindow('OpusApp', caption))
+
+    def stop(self):
+        if self._word is not None:
+            try:
+                self._word.Quit()
+            except Exception:
+                pass
+            self._word = None
+            self.pid = None
+
+    def convert(self, abspath, new_path, fmt, **options):
+        doc = self._word.Documents.Open(abspath, ReadOnly=True)
+        try:
+            doc.SaveAs(new_path, FileFormat=WORD_FORMATS[fmt])
+        finally:
+            doc.Close(False)
+
+        return new_path
+
+
+class ExcelConverter(Converter):
+    """ Converts spreadsheets using Microsoft Excel through COM
+    """
+
+    name = 'office'
+
+    def __init__(self, profile=None):
+        super(ExcelConverter, self).__init__(profile)
+        self._excel = None
+        self.pid = None
+
+    def start(self):
+        import win32com.client
+        self._excel = win32com.client.DispatchEx('Excel.Application')
+        self._excel.Visible = False
+        self._excel.DisplayAlerts = False
+        self.pid = _window_pid(self._excel.Hwnd)
+
+    def stop(self):
+        if self._excel is not None:
+            try:
+                self._excel.Application.Quit()
+            except Exception:
+                pass
+            self._excel = None
+            self.pid = None
+
+    def convert(self, abspath, new_path, fmt, sheets=None, ranges=None):
+        workbook = self._excel.Workbooks.Open(abspath, ReadOnly=1)
+        try:
+            if fmt == 'pdf':
+                names = [sheet.Name for sheet in workbook.Worksheets]
+                export_pdf(new_path, names, sheets, ranges,
+                           lambda path, selected: _excel_sheets(
+                               workbook, path, selected),
+                           lambda path, name: _excel_range(
+                               workbook, path, name))
+            else:
+                workbook.SaveAs(new_path, FileFormat=EXCEL_FORMATS[fmt])
+        finally:
+            workbook.Close(False)
+
+        return new_path
+
+
+def _window_pid(hwnd):
+    """ Return the process id of the COM server which owns the given window,
+    or None when it can not be found
+    """
+
+    import win32process
+    if not hwnd:
+        return None
+
+    _, pid = win32process.GetWindowThreadProcessId(hwnd)
+    return pid or None
+
+
+def _excel_sheets(workbook, path, selected):
+    """ Export the given sheets, or all of them, of an Excel workbook
+    """
+
+    if selected is None:
+        workbook.Sheets.Select()
+    else:
+        workbook.Worksheets(selected).Select()
+
+    workbook.ActiveSheet.ExportAsFixedFormat(Type=0, Filename=path)
+
+
+def _excel_range(workbook, path, name):
+    """ Export a named range of an Excel workbook
+    """
+
+    try:
+        cells = workbook.Names(name).RefersToRange
+    except Exception:
+        raise ValueError(u'Named range {} not found'.format(name))
+
+    cells.ExportAsFixedFormat(Type=0, Filename=path)
+
+
+# ---------------------------- LIBREOFFICE CLASS ------------------------------
+
+
+class SofficeConverter(Converter):
+    """ Converts documents using one LibreOffice process which is launched in
+    headless mode listening in a local socket, every conversion is a request
+    sent to this process through the UNO bridge.
+    """
+
+    name = 'soffice'
+
+    def __init__(self, kind, profile=None, binary=None, timeout=60):
+        super(SofficeConverter, self).__init__(profile)
+        self._kind = kind
+        self._binary = binary or find_soffice()
+        self._timeout = timeout
+        self._process = None
+        self._desktop = None
+        self._tmpdir = None
+
+    @property
+    def pid(self):
+        """ Return the process id of the LibreOffice listener
+        """
+        return self._process.pid if self._process else None
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        import uno
+        from com.sun.star.connection import NoConnectException
+
+        # STEP 1: Each listener needs its own user profile to run in parallel
+        profile = self._profile
+        if not profile:
+            self._tmpdir = tempfile.mkdtemp(prefix='soffice-')
+            profile = self._tmpdir
+
+        # STEP 2: Launch the listener in a free local port
+        port = _free_port()
+        accept = 'socket,host=127.0.0.1,port={};urp;'.format(port)
+        command = [
+            self._binary, '--headless', '--invisible', '--nologo',
+            '--nodefault', '--norestore', '--nolockcheck',
+            '-env:UserInstallation=' + uno.systemPathToFileUrl(
+                os.path.abspath(profile)),
+            '--accept=' + accept + 'StarOffice.ComponentContext'
+        ]
+        self._process = subprocess.Popen(command)
+
+        # STEP 3: Connect to the listener, it needs some time to be ready
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local)
+        url = 'uno:' + accept + 'StarOffice.ComponentContext'
+
+        deadline = time.time() + self._timeout
+        while True:
+            try:
+                context = resolver.resolve(url)
+                break
+            except NoConnectException:
+                if self._process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError(u'LibreOffice listener did not start')
+                time.sleep(0.25)
+
+        self._desktop = context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.frame.Desktop', context)
+
+    def stop(self):
+        # STEP 1: Ask LibreOffice to finish, kill it if it does not
+        if self._desktop is not None:
+            try:
+                self._desktop.terminate()
+            except Exception:
+                pass
+            self._desktop = None
+
+        if self._process is not None:
+            try:
+                _wait(self._process, 10)
+            except Exception:
+                pass
+            self._process = None
+
+        # STEP 2: Remove the temporary user profile
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def convert(self, abspath, new_path, fmt, sheets=None, ranges=None):
+        import uno
+
+        filter_name = SOFFICE_FILTERS[(self._kind, fmt)]
+
+        src_url = uno.systemPathToFileUrl(os.path.abspath(abspath))
+        dst_url = uno.systemPathToFileUrl(os.path.abspath(new_path))
+
+        doc = self._desktop.loadComponentFromURL(
+            src_url, '_blank', 0, _properties(Hidden=True, ReadOnly=True))
+        if doc is None:
+            raise IOError(u'LibreOffice could not open {}'.format(abspath))
+
+        try:
+            if self._kind == SPREADSHEET and fmt == 'pdf':
+                names = list(doc.Sheets.ElementNames)
+                export_pdf(new_path, names, sheets, ranges,
+                           lambda path, selected: _soffice_sheets(
+                               doc, path, selected),
+                           lambda path, name: _soffice_range(
+                               doc, path, name))
+            else:
+                doc.storeToURL(dst_url, _properties(FilterName=filter_name))
+        finally:
+            try:
+                doc.close(True)
+            except Exception:
+                doc.dispose()
+
+        return new_path
+
+
+# ------------------------------ NATIVE CLASS ---------------------------------
+
+
+class NativeConverter(Converter):
+    """ Converts documents in pure Python, it has no application to launch,
+    so it is the fastest backend but it only supports NATIVE_CONVERSIONS.
+    """
+
+    name = NATIVE
+
+    def __init__(self, kind, profile=None):
+        super(NativeConverter, self).__init__(profile)
+        self._kind = kind
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def convert(self, abspath, new_path, fmt, **options):
+        if (self._kind, fmt) not in NATIVE_CONVERSIONS:
+            raise ValueError(u'The native backend can not convert to {}'
+                             .format(fmt))
+
+        if self._kind == IMAGE:
+            from lib.images import image_to_pdf
+            return image_to_pdf(abspath, new_path)
+
+        from lib.ods import convert_xlsx
+        from lib.xlsx import convert_xls
+
+        is_xls = os.path.splitext(abspath)[1].lower() == '.xls'
+
+        if fmt == 'xlsx':
+            lost = convert_xls(abspath, new_path)
+        elif not is_xls:
+            lost = convert_xlsx(abspath, new_path)
+        else:
+            # Old workbooks are translated to xlsx first
+            handle, tmppath = tempfile.mkstemp(suffix='.xlsx')
+            os.close(handle)
+            try:
+                lost = convert_xls(abspath, tmppath)
+                lost += convert_xlsx(tmppath, new_path)
+            finally:
+                os.remove(tmppath)
+
+        if lost:
+            print u'WARNING: {} formulas of {} have been kept only as ' \
+                  u'values'.format(lost, os.path.basename(abspath))
+
+        return new_path
+
+
+def _soffice_sheets(doc, path, selected):
+    """ Export the given sheets, or all of them, of a LibreOffice document,
+    the sheets which are not selected are hidden while it is exported.
+    """
+
+    import uno
+
+    sheets = [doc.Sheets.getByName(name) for name in doc.Sheets.ElementNames]
+    visible = [sheet.IsVisible for sheet in sheets]
+
+    try:
+        if selected is not None:
+            for sheet in sheets:
+                if sheet.Name in selected:
+                    sheet.IsVisible = True
+            for sheet in sheets:
+                if sheet.Name not in selected:
+                    sheet.IsVisible = False
+
+        doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(path)),
+                       _properties(FilterName='calc_pdf_Export'))
+    finally:
+        for sheet, state in zip(sheets, visible):
+            if state:
+                sheet.IsVisible = True
+        for sheet, state in zip(sheets, visible):
+            if not state:
+                sheet.IsVisible = False
+
+
+def _soffice_range(doc, path, name):
+    """ Export a named range of a LibreOffice document
+    """
+
+    import uno
+
+    if not doc.NamedRanges.hasByName(name):
+        raise ValueError(u'Named range {} not found'.format(name))
+
+    cells = doc.NamedRanges.getByName(name).getReferredCells()
+    if cells is None:
+        raise ValueError(u'Named range {} is not a range of cells'.format(
+            name))
+
+    filter_data = uno.Any('[]com.sun.star.beans.PropertyValue',
+                          _properties(Selection=cells))
+    uno.invoke(doc, 'storeToURL', (
+        uno.systemPathToFileUrl(os.path.abspath(path)),
+        _properties(FilterName='calc_pdf_Export', FilterData=filter_data)))
+
+
+def find_soffice():
+    """ Return the path of the LibreOffice executable, the SOFFICE environment
+    variable has precedence over the folders in PATH.
+    """
+
+    if os.environ.get('SOFFICE'):
+        return os.environ['SOFFICE']
+
+    for folder in os.environ.get('PATH', '').split(os.pathsep):
+        for name in SOFFICE_NAMES:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+
+    return 'soffice'
+
+
+def _properties(**kwargs):
+    """ Return a tuple of UNO PropertyValue from the given keyword arguments
+    """
+
+    from com.sun.star.beans import PropertyValue
+
+    result = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        result.append(prop)
+
+    return tuple(result)
+
+
+def _free_port():
+    """ Return a local TCP port which is not being used
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def _wait(process, timeout):
+    """ Wait for the given process, it will be killed after timeout seconds
+    """
+
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() > deadline:
+            process.kill()
+            process.wait()
+            break
+        time.sleep(0.1)
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0914
+""" Synthetic documents used to benchmark the conversion scripts. Word
+documents (docx) and Excel 97-2003 workbooks (BIFF8 records in an OLE2
+compound file) are written in pure Python, so a corpus can be generated on
+any machine; xlsx workbooks are converted from the xls ones with lib.xlsx and
+Word 97-2003 documents from the docx ones with a conversion backend.
+
+Contents come from a seeded random generator, the same arguments always
+produce the same files.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import os
+import random
+import struct
+import zipfile
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+WORDS = (
+    u'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    u'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+    u'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    u'consequat duis aute irure in reprehenderit voluptate velit esse cillum '
+    u'eu fugiat nulla pariatur excepteur sint occaecat cupidatat non proident '
+    u'sunt culpa qui officia deserunt mollit anim id est laborum').split()
+
+# Paragraphs between two headings of the generated documents
+SECTION_SIZE = 12
+
+# Different texts used in the first column of the generated workbooks
+LABELS = 500
+
+SECTOR_SIZE = 512
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+NOSTREAM = 0xFFFFFFFF
+
+# Streams smaller than this are padded, so they are not in the mini stream
+MINI_CUTOFF = 4096
+
+MAX_RECORD = 8224
+
+# Rows of a BIFF8 sheet without the header and the totals
+MAX_ROWS = 65534
+
+# Record types
+R_FORMULA = 0x0006
+R_EOF = 0x000A
+R_DATEMODE = 0x0022
+R_FONT = 0x0031
+R_CONTINUE = 0x003C
+R_WINDOW1 = 0x003D
+R_CODEPAGE = 0x0042
+R_BOUNDSHEET = 0x0085
+R_XF = 0x00E0
+R_SST = 0x00FC
+R_LABELSST = 0x00FD
+R_DIMENSIONS = 0x0200
+R_NUMBER = 0x0203
+R_WINDOW2 = 0x023E
+R_STYLE = 0x0293
+R_BOF = 0x0809
+
+# Cell styles written after the 15 style XFs
+XF_GENERAL, XF_DATE, XF_DECIMAL = 15, 16, 17
+
+DOCX_TYPES = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+    u'content-types">'
+    u'<Default Extension="rels" ContentType="application/vnd.openxmlformats-'
+    u'package.relationships+xml"/>'
+    u'<Default Extension="xml" ContentType="application/xml"/>'
+    u'<Override PartName="/word/document.xml" ContentType="application/'
+    u'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    u'<Override PartName="/word/styles.xml" ContentType="application/'
+    u'vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    u'</Types>')
+
+DOCX_RELS = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    u'relationships">'
+    u'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    u'officeDocument/2006/relationships/officeDocument" '
+    u'Target="word/document.xml"/>'
+    u'</Relationships>')
+
+DOCUMENT_RELS = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    u'relationships">'
+    u'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    u'officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    u'</Relationships>')
+
+DOCX_STYLES = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/'
+    u'2006/main">'
+    u'<w:style w:type="paragraph" w:default="1" w:styleId="Normal">'
+    u'<w:name w:val="Normal"/><w:rPr><w:sz w:val="22"/></w:rPr></w:style>'
+    u'<w:style w:type="paragraph" w:styleId="Heading1">'
+    u'<w:name w:val="heading 1"/><w:basedOn w:val="Normal"/>'
+    u'<w:pPr><w:outlineLvl w:val="0"/></w:pPr>'
+    u'<w:rPr><w:b/><w:sz w:val="32"/></w:rPr></w:style>'
+    u'</w:styles>')
+
+DOCUMENT_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    u'<w:document xmlns:w="http://schemas.openxmlformats.org/'
+    u'wordprocessingml/2006/main"><w:body>')
+
+DOCUMENT_FOOTER = (
+    u'<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    u'<w:pgMar w:top="1417" w:right="1701" w:bottom="1417" w:left="1701" '
+    u'w:header="708" w:footer="708" w:gutter="0"/></w:sectPr>'
+    u'</w:body></w:document>')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def write_corpus(folder, extension, count, size, sheets=1, seed=0,
+                 backend=None):
+    """ Write count files with the given extension (.docx, .doc, .xls or
+    .xlsx) in folder and return their paths. Size is the number of
+    paragraphs of each document or the number of rows of each sheet. Word
+    97-2003 documents need a backend to convert them from docx.
+    """
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    paths = [os.path.join(folder, u'sample-{:04d}{}'.format(index, extension))
+             for index in range(count)]
+
+    for index, path in enumerate(paths):
+        seed_index = seed * 1000003 + index
+
+        if extension == '.docx':
+            write_docx(path, size, seed_index)
+
+        elif extension == '.xls':
+            write_xls(path, size, sheets=sheets, seed=seed_index)
+
+        elif extension == '.xlsx':
+            from lib.xlsx import convert_xls
+            source = path[:-1]
+            write_xls(source, size, sheets=sheets, seed=seed_index)
+            convert_xls(source, path)
+            os.remove(source)
+
+        elif extension != '.doc':
+            raise ValueError(u'Unknown corpus format {}'.format(extension))
+
+    if extension == '.doc':
+        _write_doc(paths, size, seed, backend)
+
+    return paths
+
+
+def write_docx(path, paragraphs, seed=0):
+    """ Write a Word document with the given number of paragraphs, a heading
+    is written before each section of SECTION_SIZE paragraphs.
+    """
+
+    rnd = random.Random(seed)
+    parts = [DOCUMENT_HEADER]
+
+    for index in range(paragraphs):
+        if index % SECTION_SIZE == 0:
+            parts.append(
+                u'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r>'
+                u'<w:t>{} {}</w:t></w:r></w:p>'.format(
+                    index // SECTION_SIZE + 1, _sentence(rnd, 3, 6)))
+
+        parts.append(u'<w:p><w:r><w:t>{}</w:t></w:r></w:p>'.format(
+            u' '.join([_sentence(rnd, 8, 20)
+                       for _ in range(rnd.randint(2, 6))])))
+
+    parts.append(DOCUMENT_FOOTER)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zout:
+        zout.writestr('[Content_Types].xml', DOCX_TYPES.encode('utf-8'))
+        zout.writestr('_rels/.rels', DOCX_RELS.encode('utf-8'))
+        zout.writestr('word/_rels/document.xml.rels',
+                      DOCUMENT_RELS.encode('utf-8'))
+        zout.writestr('word/styles.xml', DOCX_STYLES.encode('utf-8'))
+        zout.writestr('word/document.xml', u''.join(parts).encode('utf-8'))
+
+
+def write_xls(path, rows, cols=8, sheets=1, seed=0):
+    """ Write an Excel 97-2003 workbook with the given number of sheets, each
+    one with a header and rows of text, dates, numbers and one formula.
+    The records of each sheet are written as they are built.
+    """
+
+    if rows > MAX_ROWS:
+        raise ValueError(u'Excel 97-2003 sheets have at most {} data '
+                         u'rows'.format(MAX_ROWS))
+
+    cols = max(cols, 4)
+    rnd = random.Random(seed)
+    labels = [_sentence(rnd, 1, 3) for _ in range(min(rows, LABELS))]
+    labels[:0] = [u'Item', u'Date'] + \
+        [u'Value {}'.format(col) for col in range(1, cols - 2)] + [u'Total']
+    names = [u'Sheet{}'.format(index + 1) for index in range(sheets)]
+
+    with open(path, 'wb') as fout:
+        fout.write(b'\0' * SECTOR_SIZE)
+
+        # STEP 1: Workbook globals, the sheet offsets are written later
+        offsets = []
+        globals_data = _globals(names, labels, offsets)
+        fout.write(globals_data)
+
+        # STEP 2: Sheets, one record at a time
+        positions = []
+        for index in range(sheets):
+            positions.append(fout.tell() - SECTOR_SIZE)
+            for record in _sheet_records(rnd, rows, cols, len(labels),
+                                         index == 0):
+                fout.write(record)
+
+        size = fout.tell() - SECTOR_SIZE
+        if size < MINI_CUTOFF:
+            fout.write(b'\0' * (MINI_CUTOFF - size))
+            size = MINI_CUTOFF
+
+        for offset, position in zip(offsets, positions):
+            fout.seek(SECTOR_SIZE + offset)
+            fout.write(struct.pack('<I', position))
+
+        # STEP 3: OLE2 structures after the stream
+        fout.seek(0, os.SEEK_END)
+        _write_compound(fout, size)
+
+
+# ---------------------------- DOCUMENT HELPERS -------------------------------
+
+
+def _sentence(rnd, minimum, maximum):
+    """ Return some random words, the first one capitalized
+    """
+
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(minimum, maximum))]
+    return u' '.join(words).capitalize()
+
+
+def _write_doc(paths, size, seed, backend):
+    """ Write Word 97-2003 documents converting docx documents with the
+    given backend, there is no way to write them in pure Python.
+    """
+
+    from lib.converters import TEXT, new_converter
+
+    if not backend:
+        raise ValueError(u'Word 97-2003 documents need a conversion backend')
+
+    converter = new_converter(backend, TEXT)
+    with converter:
+        for index, path in enumerate(paths):
+            source = path + 'x'
+            write_docx(source, size, seed * 1000003 + index)
+            try:
+                converter.convert(source, path, 'doc')
+            finally:
+                os.remove(source)
+
+
+# ---------------------------- WORKBOOK RECORDS -------------------------------
+
+
+def _record(rtype, data):
+    """ Return a BIFF record, long data is split in CONTINUE records
+    """
+
+    chunks = [data[pos:pos + MAX_RECORD]
+              for pos in range(0, len(data), MAX_RECORD)] or [b'']
+
+    result = [struct.pack('<HH', rtype, len(chunks[0])) + chunks[0]]
+    for chunk in chunks[1:]:
+        result.append(struct.pack('<HH', R_CONTINUE, len(chunk)) + chunk)
+
+    return b''.join(result)
+
+
+def _string(text, length_size=2):
+    """ Return a BIFF8 unicode string, compressed when it is latin-1
+    """
+
+    try:
+        data, flags = text.encode('latin-1'), 0
+    except UnicodeEncodeError:
+        data, flags = text.encode('utf-16-le'), 1
+
+    length = struct.pack('<B' if length_size == 1 else '<H', len(text))
+    return length + struct.pack('<B', flags) + data
+
+
+def _globals(names, labels, offsets):
+    """ Return the workbook globals substream, the position of the offset
+    of each sheet inside it is appended to offsets.
+    """
+
+    records = [
+        _record(R_BOF, struct.pack('<HHHHII', 0x0600, 0x0005, 0x0DBB,
+                                   0x07CC, 0, 6)),
+        _record(R_CODEPAGE, struct.pack('<H', 1200)),
+        _record(R_WINDOW1, struct.pack('<HHHHHHHHH', 0, 0, 0x3000, 0x2000,
+                                       0x38, 0, 0, 1, 0x258)),
+        _record(R_DATEMODE, struct.pack('<H', 0)),
+    ]
+
+    for bold in (False, False, False, False, True):
+        records.append(_record(R_FONT, struct.pack(
+            '<HHHHHBBBB', 200, 0, 0x7FFF, 700 if bold else 400, 0, 0, 0, 0,
+            0) + _string(u'Arial', 1)))
+
+    # 15 style XFs, the default cell XF and the cell styles used
+    for index in range(15):
+        records.append(_xf(0 if index == 0 else 1, 0, True))
+    records.append(_xf(0, 0, False))
+    records.append(_xf(0, 14, False))
+    records.append(_xf(0, 4, False))
+    records.append(_record(R_STYLE, struct.pack('<HBB', 0x8000, 0, 0xFF)))
+
+    position = sum([len(record) for record in records])
+    for name in names:
+        offsets.append(position + 4)
+        record = _record(R_BOUNDSHEET, struct.pack('<IBB', 0, 0, 0) +
+                         _string(name, 1))
+        records.append(record)
+        position += len(record)
+
+    records.append(_sst(labels))
+    records.append(_record(R_EOF, b''))
+
+    return b''.join(records)
+
+
+def _xf(font, fmt, style):
+    """ Return a XF record with the default alignment, borders and fill
+    """
+
+    flags = 0xFFF5 if style else 0x0001
+    return _record(R_XF, struct.pack('<HHHBBBBIIH', font, fmt, flags, 0x20,
+                                     0, 0, 0xF4 if style else 0, 0, 0,
+                                     0x20C0))
+
+
+def _sst(labels):
+    """ Return the shared string table, it is split in CONTINUE records
+    between two strings, so no string needs to be split.
+    """
+
+    header = struct.pack('<II', len(labels), len(labels))
+    chunks, current = [], header
+
+    for text in labels:
+        data = _string(text)
+        if len(current) + len(data) > MAX_RECORD:
+            chunks.append(current)
+            current = b''
+        current += data
+    chunks.append(current)
+
+    result = [struct.pack('<HH', R_SST, len(chunks[0])) + chunks[0]]
+    for chunk in chunks[1:]:
+        result.append(struct.pack('<HH', R_CONTINUE, len(chunk)) + chunk)
+
+    return b''.join(result)
+
+
+def _sheet_records(rnd, rows, cols, strings, first):
+    """ Yield the records of a sheet: a header row, the data rows and a last
+    row with the totals of each numeric column.
+    """
+
+    last_row = rows + 1
+    yield _record(R_BOF, struct.pack('<HHHHII', 0x0600, 0x0010, 0x0DBB,
+                                     0x07CC, 0, 6))
+    yield _record(R_DIMENSIONS, struct.pack('<IIHHH', 0, last_row + 1, 0,
+                                            cols, 0))
+
+    for col in range(cols):
+        yield _record(R_LABELSST, struct.pack('<HHHI', 0, col, XF_GENERAL,
+                                              col))
+
+    first_label = cols
+    for row in range(1, rows + 1):
+        yield _record(R_LABELSST, struct.pack(
+            '<HHHI', row, 0, XF_GENERAL,
+            first_label + rnd.randrange(strings - first_label)
+            if strings > first_label else 0))
+        yield _record(R_NUMBER, struct.pack(
+            '<HHHd', row, 1, XF_DATE, 40000 + rnd.randrange(4000)))
+        for col in range(2, cols - 1):
+            yield _record(R_NUMBER, struct.pack(
+                '<HHHd', row, col, XF_DECIMAL,
+                round(rnd.uniform(-1000, 1000), 2)))
+
+        # Total = SUM of the values of the row
+        tokens = struct.pack('<BHHHH', 0x25, row, row, 0xC002,
+                             0xC000 | (cols - 2)) + \
+            struct.pack('<BBH', 0x22, 1, 4)
+        yield _formula(row, cols - 1, tokens)
+
+    # Totals of the columns
+    for col in range(2, cols):
+        tokens = struct.pack('<BHHHH', 0x25, 1, rows, 0xC000 | col,
+                             0xC000 | col) + struct.pack('<BBH', 0x22, 1, 4)
+        yield _formula(last_row, col, tokens)
+
+    yield _record(R_WINDOW2, struct.pack('<HHHIHHI', 0x06B6 if first
+                                         else 0x04B6, 0, 0, 64, 0, 0, 0))
+    yield _record(R_EOF, b'')
+
+
+def _formula(row, col, tokens):
+    """ Return a FORMULA record without a cached value, it is calculated
+    when the workbook is opened.
+    """
+
+    return _record(R_FORMULA, struct.pack('<HHHdHIH', row, col, XF_DECIMAL,
+                                          0.0, 0x0002, 0, len(tokens)) +
+                   tokens)
+
+
+# ----------------------------- COMPOUND FILE ---------------------------------
+
+
+def _write_compound(fout, size):
+    """ Write the directory, FAT and DIFAT sectors of an OLE2 compound file
+    with just one stream, named Workbook, which has been written after the
+    header; finally the header is written.
+    """
+
+    per_sector = SECTOR_SIZE // 4
+    stream_sectors = (size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+    padding = stream_sectors * SECTOR_SIZE - size
+    fout.write(b'\0' * padding)
+
+    # STEP 1: Number of FAT and DIFAT sectors needed for all the sectors
+    fat_sectors, difat_sectors = 1, 0
+    while True:
+        total = stream_sectors + 1 + fat_sectors + difat_sectors
+        needed = (total + per_sector - 1) // per_sector
+        difat = max(0, (needed - 109 + per_sector - 2) // (per_sector - 1))
+        if (needed, difat) == (fat_sectors, difat_sectors):
+            break
+        fat_sectors, difat_sectors = needed, difat
+
+    directory = stream_sectors
+    first_fat = directory + 1
+    first_difat = first_fat + fat_sectors
+
+    # STEP 2: Directory with the root entry and the stream
+    fout.write(_directory_entry(u'Root Entry', 5, 1, ENDOFCHAIN, 0) +
+               _directory_entry(u'Workbook', 2, NOSTREAM, 0, size) +
+               _directory_entry(u'', 0, NOSTREAM, 0, 0) * 2)
+
+    # STEP 3: FAT
+    fat = [index + 1 for index in range(stream_sectors - 1)] + \
+        [ENDOFCHAIN, ENDOFCHAIN] + [FATSECT] * fat_sectors + \
+        [DIFSECT] * difat_sectors
+    fat += [FREESECT] * (fat_sectors * per_sector - len(fat))
+    for pos in range(0, len(fat), per_sector):
+        fout.write(struct.pack('<{}I'.format(per_sector),
+                               *fat[pos:pos + per_sector]))
+
+    # STEP 4: DIFAT, the first 109 FAT sectors are listed in the header
+    fat_ids = [first_fat + index for index in range(fat_sectors)]
+    extra = fat_ids[109:]
+    for index in range(difat_sectors):
+        ids = extra[index * (per_sector - 1):(index + 1) * (per_sector - 1)]
+        ids += [FREESECT] * (per_sector - 1 - len(ids))
+        following = first_difat + index + 1 \
+            if index + 1 < difat_sectors else ENDOFCHAIN
+        fout.write(struct.pack('<{}I'.format(per_sector), *(ids + [following])))
+
+    # STEP 5: Header
+    header_ids = fat_ids[:109] + [FREESECT] * (109 - len(fat_ids[:109]))
+    fout.seek(0)
+    fout.write(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 16 +
+               struct.pack('<HHHHH', 0x003E, 0x0003, 0xFFFE, 9, 6) +
+               b'\0' * 6 +
+               struct.pack('<IIIIIIIII', 0, fat_sectors, directory, 0,
+                           MINI_CUTOFF, ENDOFCHAIN, 0,
+                           first_difat if difat_sectors else ENDOFCHAIN,
+                           difat_sectors) +
+               struct.pack('<109I', *header_ids))
+
+
+def _directory_entry(name, entry_type, child, start, size):
+    """ Return a 128 bytes directory entry without siblings
+    """
+
+    encoded = (name + u'\0').encode('utf-16-le') if name else b''
+    return encoded.ljust(64, b'\0') + \
+        struct.pack('<HBBIII', len(encoded), entry_type, 1, NOSTREAM,
+                    NOSTREAM, child) + \
+        b'\0' * 16 + struct.pack('<I', 0) + b'\0' * 16 + \
+        struct.pack('<III', start, size, 0)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0914
+""" Converts images to one page PDF documents. JPEG images, and PNG images
+without transparency, are embedded as they are, without decoding them, so
+they do not lose quality and need no image library; other images need Pillow.
+
+The page takes the size of the image at its resolution, images without one,
+or whose resolution gives a page too small or too large, are fitted to the
+width of an A4 page.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import io
+import os
+import struct
+import zlib
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff')
+
+# A4 width in points, used for images without resolution
+A4_WIDTH = 595.0
+
+# Page sizes in points PDF readers accept, a resolution which gives a page
+# out of them is not taken into account
+MIN_PAGE_SIZE = 3.0
+MAX_PAGE_SIZE = 14400.0
+
+# TIFF tag of the unit of the resolution, 1 means it has none
+TIFF_RESOLUTION_UNIT = 296
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG markers which start a frame and have the image size
+SOF_MARKERS = set([0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA,
+                   0xCB, 0xCD, 0xCE, 0xCF])
+
+COLOR_SPACES = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def image_to_pdf(abspath, new_path):
+    """ Write a PDF with just one page showing the given image
+    """
+
+    with open(abspath, 'rb') as fin:
+        data = fin.read()
+
+    image = None
+    if data[:2] == b'\xff\xd8':
+        image = _jpeg(data)
+    elif data[:8] == PNG_SIGNATURE:
+        image = _png(data)
+
+    if image is None:
+        image = _pillow(abspath)
+
+    _write_pdf(new_path, image)
+
+    return new_path
+
+
+# ------------------------------ IMAGE READERS --------------------------------
+
+
+def _jpeg(data):
+    """ Return the image dictionary for a JPEG image, the data is kept as it
+    is and decoded by the viewer with DCTDecode.
+    """
+
+    pos, dpi, adobe = 2, None, False
+
+    while pos + 4 <= len(data):
+        if data[pos:pos + 1] != b'\xff':
+            pos += 1
+            continue
+
+        marker = ord(data[pos + 1:pos + 2])
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or \
+                marker == 0xFF:
+            pos += 2 if marker != 0xFF else 1
+            continue
+
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos + 4:pos + 2 + length]
+
+        if marker == 0xE0 and segment[:5] == b'JFIF\0' and len(segment) >= 12:
+            units, xdensity, ydensity = struct.unpack('>BHH', segment[7:12])
+            # Units are 1 for dots per inch and 2 for dots per centimetre
+            dpi = _dpi(xdensity, ydensity, {1: 1.0, 2: 2.54}.get(units))
+
+        elif marker == 0xEE and segment[:5] == b'Adobe':
+            adobe = True
+
+        elif marker in SOF_MARKERS:
+            bits, height, width, components = struct.unpack(
+                '>BHHB', segment[:6])
+            if components not in COLOR_SPACES:
+                return None
+
+            image = {
+                '/Width': width, '/Height': height,
+                '/ColorSpace': COLOR_SPACES[components],
+                '/BitsPerComponent': bits, '/Filter': '/DCTDecode',
+                'data': data, 'dpi': dpi
+            }
+
+            # Adobe CMYK JPEG images are stored inverted
+            if components == 4 and adobe:
+                image['/Decode'] = '[1 0 1 0 1 0 1 0]'
+            return image
+
+        elif marker == 0xDA:
+            break
+
+        pos += 2 + length
+
+    return None
+
+
+def _png(data):
+    """ Return the image dictionary for a PNG image, its compressed data is
+    used as it is through the PNG predictors of FlateDecode. Images with
+    transparency or interlacing are left to Pillow.
+    """
+
+    pos = 8
+    header, palette, chunks, dpi = None, None, [], None
+
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', body)
+        elif kind == b'PLTE':
+            palette = body
+        elif kind == b'IDAT':
+            chunks.append(body)
+        elif kind == b'pHYs':
+            xppu, yppu, unit = struct.unpack('>IIB', body)
+            # Unit 1 is pixels per metre, 0 gives only the aspect ratio
+            dpi = _dpi(xppu, yppu, 0.0254 if unit == 1 else None)
+        elif kind == b'tRNS':
+            return None
+        elif kind == b'IEND':
+            break
+
+    if header is None:
+        return None
+
+    width, height, bits, color, _, _, interlace = header
+    if interlace or color not in (0, 2, 3) or bits > 8 or \
+            (color == 3 and not palette):
+        return None
+
+    colors = 3 if color == 2 else 1
+    if color == 3:
+        space = '[/Indexed /DeviceRGB {} <{}>]'.format(
+            len(palette) // 3 - 1, _hex(palette))
+    else:
+        space = COLOR_SPACES[colors]
+
+    return {
+        '/Width': width, '/Height': height, '/ColorSpace': space,
+        '/BitsPerComponent': bits, '/Filter': '/FlateDecode',
+        '/DecodeParms': '<< /Predictor 15 /Colors {} /BitsPerComponent {} '
+                        '/Columns {} >>'.format(colors, bits, width),
+        'data': b''.join(chunks), 'dpi': dpi
+    }
+
+
+def _pillow(abspath):
+    """ Return the image dictionary for any other image, it is decoded with
+    Pillow and compressed again without loss. Transparent areas are painted
+    white.
+    """
+
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ValueError(u'Pillow is needed to convert {}'.format(
+            os.path.splitext(abspath)[1]))
+
+    image = Image.open(abspath)
+    dpi = image.info.get('dpi')
+
+    # A resolution without unit only gives the aspect ratio of the pixels
+    tags = getattr(image, 'tag_v2', None)
+    if tags is not None and tags.get(TIFF_RESOLUTION_UNIT) == 1:
+        dpi = None
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+    elif image.mode not in ('L', 'RGB', 'CMYK'):
+        image = image.convert('RGB')
+
+    components = {'L': 1, 'RGB': 3, 'CMYK': 4}[image.mode]
+
+    return {
+        '/Width': image.size[0], '/Height': image.size[1],
+        '/ColorSpace': COLOR_SPACES[components], '/BitsPerComponent': 8,
+        '/Filter': '/FlateDecode', 'data': zlib.compress(image.tobytes()),
+        'dpi': tuple(dpi) if dpi and dpi[0] and dpi[1] else None
+    }
+
+
+def _dpi(xdensity, ydensity, factor):
+    """ Return the resolution (x, y) in dots per inch, factor converts the
+    given densities to inches. None if the image has no resolution.
+    """
+
+    if not factor or not xdensity or not ydensity:
+        return None
+
+    return (xdensity * factor, ydensity * factor)
+
+
+def _hex(data):
+    """ Return data as an hexadecimal string
+    """
+    return ''.join(['{:02X}'.format(ord(char)) for char in data])
+
+
+# -------------------------------- PDF WRITER ---------------------------------
+
+
+def _write_pdf(new_path, image):
+    """ Write a one page PDF drawing the image over the whole page
+    """
+
+    width, height = image['/Width'], image['/Height']
+    page_width, page_height = 0.0, 0.0
+    if image.get('dpi'):
+        page_width = width * 72.0 / image['dpi'][0]
+        page_height = height * 72.0 / image['dpi'][1]
+
+    if not MIN_PAGE_SIZE <= page_width <= MAX_PAGE_SIZE or \
+            not MIN_PAGE_SIZE <= page_height <= MAX_PAGE_SIZE:
+        page_width = A4_WIDTH
+        page_height = height * A4_WIDTH / width
+
+    content = 'q {:.2f} 0 0 {:.2f} 0 0 cm /Im0 Do Q'.format(
+        page_width, page_height).encode('ascii')
+
+    entries = ' '.join(['{} {}'.format(key, value)
+                        for key, value in sorted(image.items())
+                        if key.startswith('/')])
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        ('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:.2f} {:.2f}] '
+         '/Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>'
+         .format(page_width, page_height)).encode('ascii'),
+        _stream('/Type /XObject /Subtype /Image ' + entries, image['data']),
+        _stream('', content),
+    ]
+
+    fout = io.BytesIO()
+    fout.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(fout.tell())
+        fout.write(b'%d 0 obj\n' % number + obj + b'\nendobj\n')
+
+    start = fout.tell()
+    fout.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        fout.write(b'%010d 00000 n \n' % offset)
+    fout.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (len(objects) + 1, start))
+
+    with open(new_path, 'wb') as out:
+        out.write(fout.getvalue())
+
+
+def _stream(entries, data):
+    """ Return a stream object with the given dictionary entries
+    """
+
+    return ('<< {} /Length {} >>\nstream\n'.format(entries, len(data))
+            .encode('ascii') + data + b'\nendstream')
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Journal of conversions, one JSON object per line with the result of each
+converted file. It is written as each file is finished, so a run which dies
+can be resumed skipping the files which were already converted, and it keeps
+the time spent in each file to get latency statistics.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import io
+import json
+import math
+import os
+import time
+
+from lib.cache import file_hash
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+OK = 'ok'
+CACHED = 'cached'
+FAILED = 'failed'
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def percentile(values, fraction):
+    """ Return the given percentile, fraction between 0 and 1, of the values
+    using linear interpolation between the closest ranks.
+    """
+
+    if not values:
+        return None
+
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower, upper = int(math.floor(position)), int(math.ceil(position))
+
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# ----------------------------- JOURNAL CLASS ---------------------------------
+
+
+class Journal(object):
+    """ JSON lines journal, only the last entry of each file and format is
+    taken into account to decide if the file must be converted again.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.abspath(path)
+        self._last = {}
+
+        if os.path.isfile(self._path):
+            self._load()
+
+    @property
+    def path(self):
+        """ Return the path of the journal file
+        """
+        return self._path
+
+    def pending(self, files, fmt):
+        """ Return the files which must be converted to the given format,
+        those whose last conversion succeeded, have not changed since then
+        and whose output still exists are left out.
+        """
+
+        result = []
+        for abspath in files:
+            if not self._is_done(abspath, fmt):
+                result.append(abspath)
+
+        skipped = len(files) - len(result)
+        if skipped:
+            print u'{} files were already converted, see {}'.format(
+                skipped, self._path)
+
+        return result
+
+    def recorder(self, fmt):
+        """ Return a function which records the results of a Batch for the
+        given format, see Batch on_result.
+        """
+
+        def _record(abspath, error, seconds, output, cached):
+            self.record(abspath, fmt, error, seconds, output, cached)
+
+        return _record
+
+    def record(self, abspath, fmt, error, seconds, output=None, cached=False):
+        """ Append the result of one file to the journal
+        """
+
+        entry = {
+            'path': _unicode(abspath), 'format': fmt,
+            'status': FAILED if error else (CACHED if cached else OK),
+            'seconds': round(seconds, 4), 'error': error,
+            'output': _unicode(output) if output else None,
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+        try:
+            stat = os.stat(abspath)
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+            entry['hash'] = file_hash(abspath)
+        except (IOError, OSError):
+            pass
+
+        line = json.dumps(entry, ensure_ascii=False)
+        if not isinstance(line, unicode):
+            line = line.decode('utf-8')
+
+        data = (line + u'\n').encode('utf-8')
+
+        with io.open(self._path, 'a+b') as fout:
+            # A run which died while it was writing leaves half a line
+            if fout.seek(0, os.SEEK_END):
+                fout.seek(-1, os.SEEK_END)
+                if fout.read(1) != b'\n':
+                    data = b'\n' + data
+                fout.seek(0, os.SEEK_END)
+            fout.write(data)
+
+        self._last[(entry['path'], fmt)] = entry
+
+    def stats(self):
+        """ Return a dictionary by format with the statistics of the files
+        which have been converted, not taken from cache: files, failed,
+        seconds, mean, p50, p95, max and megabytes per second.
+        """
+
+        groups = {}
+        for entry in self._last.values():
+            groups.setdefault(entry['format'], []).append(entry)
+
+        result = {}
+        for fmt, entries in groups.items():
+            done = [entry for entry in entries if entry['status'] == OK]
+            seconds = [entry['seconds'] for entry in done]
+            size = sum([entry.get('size', 0) for entry in done])
+
+            result[fmt] = {
+                'files': len(entries),
+                'converted': len(done),
+                'cached': len([item for item in entries
+                               if item['status'] == CACHED]),
+                'failed': len([item for item in entries
+                               if item['status'] == FAILED]),
+                'seconds': sum(seconds),
+                'mean': sum(seconds) / len(seconds) if seconds else None,
+                'p50': percentile(seconds, 0.50),
+                'p95': percentile(seconds, 0.95),
+                'max': max(seconds) if seconds else None,
+                'mb_per_second': size / 1048576.0 / sum(seconds)
+                                 if sum(seconds) else None
+            }
+
+        return result
+
+    def print_stats(self):
+        """ Print the statistics of the journal as a table
+        """
+
+        stats = self.stats()
+        if not stats:
+            print u'There are no conversions in {}'.format(self._path)
+            return
+
+        print u'{:<7} {:>6} {:>6} {:>6} {:>9} {:>7} {:>7} {:>7} {:>7} {:>7}' \
+            .format(u'FORMAT', u'FILES', u'CACHED', u'FAILED', u'SECONDS',
+                    u'MEAN', u'P50', u'P95', u'MAX', u'MB/S')
+
+        for fmt, item in sorted(stats.items()):
+            print u'{:<7} {:>6} {:>6} {:>6} {:>9.2f} {:>7} {:>7} {:>7} ' \
+                  u'{:>7} {:>7}'.format(
+                      fmt, item['files'], item['cached'], item['failed'],
+                      item['seconds'], _number(item['mean']),
+                      _number(item['p50']), _number(item['p95']),
+                      _number(item['max']), _number(item['mb_per_second']))
+
+    def _is_done(self, abspath, fmt):
+        """ Check if the last conversion of the file succeeded and the file
+        has not changed since then, the hash is only computed when the size
+        or the modification time do not match.
+        """
+
+        entry = self._last.get((_unicode(abspath), fmt))
+        if not entry or entry['status'] == FAILED:
+            return False
+
+        if not entry.get('output') or not os.path.exists(entry['output']):
+            return False
+
+        try:
+            stat = os.stat(abspath)
+            if stat.st_size == entry.get('size') and \
+                    stat.st_mtime == entry.get('mtime'):
+                return True
+            return file_hash(abspath) == entry.get('hash')
+        except (IOError, OSError):
+            return False
+
+    def _load(self):
+        """ Read the journal, broken lines from a run which died while it was
+        writing are ignored.
+        """
+
+        with io.open(self._path, 'r', encoding='utf-8') as fin:
+            for line in fin:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(entry, dict) or 'path' not in entry:
+                    continue
+                self._last[(entry['path'], entry.get('format'))] = entry
+
+
+def _unicode(path):
+    """ Return the given path as unicode text
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'ignore')
+
+
+def _number(value):
+    """ Return a statistic as text, with two decimals or as a dash
+    """
+    return u'-' if value is None else u'{:.2f}'.format(value)
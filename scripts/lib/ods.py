@@ -0,0 +1,1465 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902,R0912,R0914
+""" Converts Office Open XML workbooks (xlsx) to Open Document spreadsheets
+(ods) without any office application. The sheets are read with an incremental
+XML parser and every row is written to the new content.xml as soon as it has
+been read, so memory use does not grow with the number of rows.
+
+Values, formulas, column widths, row heights, merged cells, hidden sheets,
+named ranges, global or local to a sheet, and basic styles (number formats,
+fonts, fills, borders and alignment) are kept, everything else is left
+behind.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import codecs
+import collections
+import datetime
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+
+from xml.parsers import expat
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from lib.batch import temporary_path
+from lib.biff import DEFAULT_PALETTE
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+NS_REL = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+          'relationships')
+
+ODS_MIMETYPE = 'application/vnd.oasis.opendocument.spreadsheet'
+
+ODS_NAMESPACES = (
+    u'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+    u'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+    u'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+    u'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+    u'xmlns:number="urn:oasis:names:tc:opendocument:xmlns:datastyle:1.0" '
+    u'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:'
+    u'xsl-fo-compatible:1.0" '
+    u'xmlns:of="urn:oasis:names:tc:opendocument:xmlns:of:1.2" '
+    u'office:version="1.2"')
+
+XML_HEADER = u'<?xml version="1.0" encoding="UTF-8"?>\n'
+
+BLOCK_SIZE = 64 * 1024
+
+# Number formats which are not written in styles.xml
+BUILTIN_FORMATS = {
+    0: u'General', 1: u'0', 2: u'0.00', 3: u'#,##0', 4: u'#,##0.00',
+    9: u'0%', 10: u'0.00%', 11: u'0.00E+00', 12: u'# ?/?', 13: u'# ??/??',
+    14: u'mm-dd-yy', 15: u'd-mmm-yy', 16: u'd-mmm', 17: u'mmm-yy',
+    18: u'h:mm AM/PM', 19: u'h:mm:ss AM/PM', 20: u'h:mm', 21: u'h:mm:ss',
+    22: u'm/d/yy h:mm', 37: u'#,##0 ;(#,##0)', 38: u'#,##0 ;[Red](#,##0)',
+    39: u'#,##0.00;(#,##0.00)', 40: u'#,##0.00;[Red](#,##0.00)',
+    45: u'mm:ss', 46: u'[h]:mm:ss', 47: u'mmss.0', 48: u'##0.0E+0', 49: u'@'
+}
+
+BORDERS = {
+    'thin': u'0.75pt solid', 'medium': u'1.75pt solid', 'thick': u'2.5pt solid',
+    'double': u'2.25pt double', 'hair': u'0.5pt solid',
+    'dashed': u'0.75pt dashed', 'dotted': u'0.75pt dotted',
+    'mediumDashed': u'1.75pt dashed', 'dashDot': u'0.75pt dashed',
+    'mediumDashDot': u'1.75pt dashed', 'dashDotDot': u'0.75pt dotted',
+    'mediumDashDotDot': u'1.75pt dotted', 'slantDashDot': u'1.75pt dashed'
+}
+
+HORIZONTAL = {'left': u'start', 'center': u'center', 'right': u'end',
+              'justify': u'justify', 'distributed': u'justify',
+              'centerContinuous': u'center'}
+
+VERTICAL = {'top': u'top', 'center': u'middle', 'bottom': u'bottom',
+            'justify': u'middle', 'distributed': u'middle'}
+
+INVALID_XML = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+CELL_REF = re.compile(r'^\$?([A-Za-z]{1,3})\$?(\d+)$')
+
+# Tokens of Excel formulas which have to be translated to OpenFormula
+FORMULA_TOKEN = re.compile(r'''
+    (?P<string>"(?:[^"]|"")*")
+  | (?P<sheet>(?:'(?:[^']|'')+'|[A-Za-z_\\][\w.]*)!)
+  | (?P<area>(?<![\w.$])(?:
+        \$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?
+      | \$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}
+      | \$?\d+:\$?\d+
+    )(?![\w.(!]))
+  | (?P<external>\[\d+\])
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<comma>,)
+  | (?P<semicolon>;)
+''', re.VERBOSE)
+
+SIMPLE_SHEET = re.compile(r'^[A-Za-z_][\w.]*$')
+
+REF_PART = re.compile(r'(\$?)([A-Za-z]{1,3})?(\$?)(\d+)?')
+
+DATE_TOKEN = re.compile(r'''
+    "[^"]*" | \\. | \[[^\]]*\] | AM/PM | A/P
+  | y+ | m+ | d+ | h+ | s+ | \.0+ | .
+''', re.VERBOSE | re.IGNORECASE)
+
+
+class FormulaError(Exception):
+    """ The formula can not be translated to OpenFormula
+    """
+    pass
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def convert_xlsx(abspath, new_path):
+    """ Convert the xlsx workbook in abspath to the ods new_path, returns the
+    number of formulas which could not be translated and have been written
+    only with their values.
+    """
+
+    tmpdir = tempfile.mkdtemp(prefix='xlsx2ods-')
+
+    try:
+        with zipfile.ZipFile(abspath) as zin:
+            reader = _XlsxReader(zin)
+            writer = _ContentWriter(reader, tmpdir)
+
+            for sheet in reader.sheets:
+                writer.write_sheet(sheet)
+
+            content = writer.close()
+
+        _write_package(content, new_path)
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return writer.lost_formulas
+
+
+def _local(tag, _cache={}):
+    """ Return the tag without its namespace
+    """
+
+    try:
+        return _cache[tag]
+    except KeyError:
+        return _cache.setdefault(tag, tag.rpartition('}')[2])
+
+
+def _xml(text):
+    """ Escape text to be written inside XML
+    """
+
+    text = text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+    text = text.replace(u'>', u'&gt;').replace(u'"', u'&quot;')
+
+    return INVALID_XML.sub(u'', text)
+
+
+def _column(name, _cache={}):
+    """ Return the zero based index of the column with the given letters
+    """
+
+    if name in _cache:
+        return _cache[name]
+
+    index = 0
+    for char in name.upper():
+        index = index * 26 + ord(char) - 64
+
+    return _cache.setdefault(name, index - 1)
+
+
+def _column_name(index):
+    """ Return the letters of the column with the zero based index
+    """
+
+    name = u''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = unicode(chr(65 + rest)) + name
+
+    return name
+
+
+def _split_ref(ref):
+    """ Return the zero based (row, col) of a cell reference like B12
+    """
+
+    match = CELL_REF.match(ref)
+    if not match:
+        raise ValueError(u'Wrong cell reference {}'.format(ref))
+
+    return int(match.group(2)) - 1, _column(match.group(1))
+
+
+def _paragraphs(text):
+    """ Return text as ODF paragraphs keeping repeated spaces and tabs
+    """
+
+    result = []
+    for line in text.split(u'\n'):
+        line = _xml(line).replace(u'\t', u'<text:tab/>')
+        line = re.sub(u'  +', lambda match: u' <text:s text:c="{}"/>'.format(
+            len(match.group(0)) - 1), line)
+        result.append(u'<text:p>{}</text:p>'.format(line))
+
+    return u''.join(result)
+
+
+# ---------------------------- FORMULA TRANSLATOR -----------------------------
+
+
+def translate_formula(formula, row_offset=0, col_offset=0):
+    """ Return the OpenFormula text for the given Excel formula, without the
+    leading '=', the relative references are moved by the given offsets which
+    are used to expand shared formulas.
+    """
+
+    result, sheet, depth, pos = [], None, 0, 0
+    formula = formula.replace(u'_xlfn.', u'').replace(u'_xlws.', u'')
+
+    for match in FORMULA_TOKEN.finditer(formula):
+        result.append(formula[pos:match.start()])
+        pos = match.end()
+        kind, token = match.lastgroup, match.group(0)
+
+        if kind == 'sheet':
+            sheet = token[:-1]
+            if sheet.startswith(u'[') or (sheet.startswith(u"'") and
+                                          u'[' in sheet):
+                raise FormulaError(u'External references are not supported')
+            if u':' in sheet:
+                raise FormulaError(u'3D references are not supported')
+            if SIMPLE_SHEET.match(sheet) is None and \
+                    not sheet.startswith(u"'"):
+                raise FormulaError(u'Unexpected token {}'.format(token))
+            continue
+
+        if sheet is not None and kind != 'area':
+            raise FormulaError(u'Unsupported reference')
+
+        if kind == 'area':
+            result.append(_area(token, sheet, row_offset, col_offset))
+            sheet = None
+        elif kind == 'external':
+            raise FormulaError(u'External references are not supported')
+        elif kind == 'open':
+            depth += 1
+            result.append(token)
+        elif kind == 'close':
+            depth -= 1
+            result.append(token)
+        elif kind == 'comma':
+            result.append(u';')
+        elif kind == 'semicolon':
+            result.append(u'|' if depth else token)
+        else:
+            result.append(token)
+
+    if sheet is not None:
+        raise FormulaError(u'Unsupported reference')
+
+    result.append(formula[pos:])
+
+    return u''.join(result)
+
+
+def _area(token, sheet, row_offset, col_offset):
+    """ Return the OpenFormula reference of an A1 style cell or area
+    """
+
+    parts = [_move(part, row_offset, col_offset) for part in token.split(u':')]
+
+    prefix = u'.' if sheet is None else u'$' + sheet + u'.'
+
+    return u'[' + prefix + u':.'.join(parts) + u']'
+
+
+def _move(part, row_offset, col_offset):
+    """ Move the relative parts of a reference by the given offsets
+    """
+
+    match = REF_PART.match(part)
+    col_abs, col, row_abs, row = match.groups()
+
+    text = u''
+    if col:
+        index = _column(col) + (0 if col_abs else col_offset)
+        if index < 0:
+            raise FormulaError(u'Reference out of the sheet')
+        text += col_abs + _column_name(index)
+    if row:
+        index = int(row) + (0 if row_abs else row_offset)
+        if index < 1:
+            raise FormulaError(u'Reference out of the sheet')
+        text += row_abs + unicode(index)
+
+    return text
+
+
+# ------------------------------- XLSX READER ---------------------------------
+
+
+class _XlsxReader(object):
+    """ Reads the workbook parts of an xlsx file, sheets are not read here
+    """
+
+    def __init__(self, zin):
+        self.zin = zin
+        self.sheets = []
+        self.names = []
+        self.date1904 = False
+        self.strings = []
+        self.formats = dict(BUILTIN_FORMATS)
+        self.xfs = []
+        self.palette = [DEFAULT_PALETTE[index] for index in range(8)] + \
+            list(DEFAULT_PALETTE)
+
+        # STEP 1: Locate the workbook and its parts through relationships
+        path = self._office_document()
+        rels = self._rels(path)
+
+        # STEP 2: Workbook globals, shared strings and styles
+        self._read_workbook(path, rels)
+
+        for target in [target for kind, target in rels.values()
+                       if kind.endswith('/sharedStrings')]:
+            self._read_strings(target)
+
+        for target in [target for kind, target in rels.values()
+                       if kind.endswith('/styles')]:
+            self._read_styles(target)
+
+    def _office_document(self):
+        """ Return the path of the workbook part
+        """
+
+        try:
+            root = ElementTree.fromstring(self.zin.read('_rels/.rels'))
+        except KeyError:
+            return 'xl/workbook.xml'
+
+        for rel in root:
+            if rel.get('Type', '').endswith('/officeDocument'):
+                return rel.get('Target').lstrip('/')
+
+        return 'xl/workbook.xml'
+
+    def _rels(self, path):
+        """ Return the relationships of the given part by id
+        """
+
+        folder, name = posixpath.split(path)
+        rels_path = posixpath.join(folder, '_rels', name + '.rels')
+
+        try:
+            root = ElementTree.fromstring(self.zin.read(rels_path))
+        except KeyError:
+            return {}
+
+        rels = {}
+        for rel in root:
+            target = rel.get('Target', '')
+            if target.startswith('/'):
+                target = target.lstrip('/')
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            rels[rel.get('Id')] = (rel.get('Type', ''), target)
+
+        return rels
+
+    def _read_workbook(self, path, rels):
+        """ Read the sheets and the defined names
+        """
+
+        root = ElementTree.fromstring(self.zin.read(path))
+        position = 0 # Local names count every sheet, charts too
+
+        for elem in root.iter():
+            tag = _local(elem.tag)
+
+            if tag == 'workbookPr':
+                self.date1904 = elem.get('date1904') in ('1', 'true')
+
+            elif tag == 'sheet':
+                kind, target = rels.get(
+                    elem.get('{%s}id' % NS_REL), ('', None))
+                if target and kind.endswith('/worksheet'):
+                    self.sheets.append((elem.get('name'), target,
+                                        elem.get('state', 'visible'),
+                                        str(position)))
+                position += 1
+
+            elif tag == 'definedName':
+                self.names.append((elem.get('name'), elem.text or u'',
+                                   elem.get('localSheetId'),
+                                   elem.get('hidden') in ('1', 'true')))
+
+    def _read_strings(self, path):
+        """ Read the shared strings, rich text is kept only as plain text
+        """
+
+        with self.zin.open(path) as fin:
+            for _, elem in ElementTree.iterparse(fin):
+                if _local(elem.tag) != 'si':
+                    continue
+
+                text = []
+                for child in elem:
+                    tag = _local(child.tag)
+                    if tag == 't':
+                        text.append(child.text or u'')
+                    elif tag == 'r':
+                        text.extend([item.text or u'' for item in child
+                                     if _local(item.tag) == 't'])
+
+                self.strings.append(u''.join(text))
+                elem.clear()
+
+    def _read_styles(self, path):
+        """ Read the cell formats with their fonts, fills and borders
+        """
+
+        root = ElementTree.fromstring(self.zin.read(path))
+        fonts, fills, borders = [], [], []
+        palette = self.palette
+
+        for elem in root:
+            tag = _local(elem.tag)
+
+            if tag == 'numFmts':
+                for fmt in elem:
+                    self.formats[int(fmt.get('numFmtId'))] = \
+                        fmt.get('formatCode', u'')
+
+            elif tag == 'colors':
+                indexed = [item for item in elem.iter()
+                           if _local(item.tag) == 'rgbColor']
+                for index, item in enumerate(indexed[:len(palette)]):
+                    palette[index] = int(item.get('rgb', '0')[-6:], 16)
+
+            elif tag == 'fonts':
+                fonts = [_read_font(font) for font in elem]
+
+            elif tag == 'fills':
+                fills = [_read_fill(fill) for fill in elem]
+
+            elif tag == 'borders':
+                borders = [_read_border(border) for border in elem]
+
+        for elem in root:
+            if _local(elem.tag) != 'cellXfs':
+                continue
+
+            for xf in elem:
+                style = {'format': int(xf.get('numFmtId', 0)),
+                         'font': _item(fonts, xf.get('fontId')),
+                         'fill': _item(fills, xf.get('fillId')),
+                         'border': _item(borders, xf.get('borderId')),
+                         'align': {}}
+                for child in xf:
+                    if _local(child.tag) == 'alignment':
+                        style['align'] = dict(child.attrib)
+                self.xfs.append(style)
+
+    def color(self, color):
+        """ Return the #RRGGBB value of a color dictionary or None
+        """
+
+        if not color:
+            return None
+
+        if color.get('rgb'):
+            return u'#' + color['rgb'][-6:].upper()
+
+        if color.get('indexed'):
+            index = int(color['indexed'])
+            if index < len(self.palette):
+                return u'#{:06X}'.format(self.palette[index])
+
+        return None
+
+
+def _item(items, index):
+    """ Return the item in the given index or None
+    """
+
+    try:
+        return items[int(index)]
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _read_font(elem):
+    """ Return a dictionary with the font properties
+    """
+
+    font = {}
+    for child in elem:
+        tag = _local(child.tag)
+        if tag in ('b', 'i', 'strike'):
+            font[tag] = child.get('val', 'true') in ('1', 'true')
+        elif tag == 'u':
+            font['u'] = child.get('val', 'single')
+        elif tag == 'sz':
+            font['size'] = child.get('val')
+        elif tag == 'name':
+            font['name'] = child.get('val')
+        elif tag == 'color':
+            font['color'] = dict(child.attrib)
+
+    return font
+
+
+def _read_fill(elem):
+    """ Return the color of a solid fill or None
+    """
+
+    for child in elem:
+        if _local(child.tag) == 'patternFill' and \
+                child.get('patternType') not in (None, 'none', 'gray125'):
+            for color in child:
+                if _local(color.tag) == 'fgColor':
+                    return dict(color.attrib)
+
+    return None
+
+
+def _read_border(elem):
+    """ Return a dictionary side: (style, color) for the border
+    """
+
+    border = {}
+    for child in elem:
+        tag = _local(child.tag)
+        if tag in ('left', 'right', 'top', 'bottom') and child.get('style'):
+            color = None
+            for item in child:
+                color = dict(item.attrib)
+            border[tag] = (child.get('style'), color)
+
+    return border
+
+
+# ------------------------------ CONTENT WRITER -------------------------------
+
+
+class _ContentWriter(object):
+    """ Writes content.xml, the tables are written to a temporary file while
+    the automatic styles they need are collected, both are joined at the end.
+    """
+
+    def __init__(self, reader, tmpdir):
+        self.lost_formulas = 0
+
+        self._reader = reader
+        self._tmpdir = tmpdir
+        self._body_path = os.path.join(tmpdir, 'body.xml')
+        self._body = codecs.open(self._body_path, 'w', 'utf-8')
+
+        self._column_styles = {}
+        self._row_styles = {}
+        self._data_styles = {}
+        self._cell_styles = [self._cell_style(index, xf)
+                             for index, xf in enumerate(reader.xfs)]
+        self._kinds = [self._value_kind(xf['format']) for xf in reader.xfs]
+
+        epoch = (1904, 1, 1) if reader.date1904 else (1899, 12, 30)
+        self._epoch = datetime.datetime(*epoch)
+
+    # ---------------------------- SHEET WRITING ------------------------------
+
+    def write_sheet(self, sheet):
+        """ Write the table of the given sheet
+        """
+
+        name, path, state, position = sheet
+
+        table = _TableState(_merged_cells(self._reader.zin, path))
+
+        self._body.write(u'<table:table table:name="{}"{}>'.format(
+            _xml(name), u' table:style-name="ta2"'
+            if state != 'visible' else u' table:style-name="ta1"'))
+
+        parser = _SheetParser(self, table)
+        with self._reader.zin.open(path) as fin:
+            parser.parse(fin)
+
+        self._write_rows_until(table, None)
+        self._write_names(position)
+        self._body.write(u'</table:table>')
+
+    def _write_columns(self, columns, max_col):
+        """ Write the table columns with their widths
+        """
+
+        out = self._body
+        position = 0
+
+        for col in columns:
+            first, last = int(col.get('min', 1)) - 1, int(col.get('max', 1))
+            last = min(last, 16384)
+            if first > position:
+                out.write(u'<table:table-column table:style-name="co1" '
+                          u'table:number-columns-repeated="{}"/>'.format(
+                              first - position))
+
+            style = u'co1'
+            if col.get('width'):
+                width = (float(col['width']) * 7 + 5) / 96.0
+                style = self._column_styles.setdefault(
+                    u'{:.4f}in'.format(width),
+                    u'co{}'.format(len(self._column_styles) + 2))
+
+            attrs = u' table:style-name="{}"'.format(style)
+            if col.get('hidden') in ('1', 'true'):
+                attrs += u' table:visibility="collapse"'
+            if col.get('style') and int(col['style']) < len(self._cell_styles):
+                attrs += u' table:default-cell-style-name="ce{}"'.format(
+                    col['style'])
+            if last - first > 1:
+                attrs += u' table:number-columns-repeated="{}"'.format(
+                    last - first)
+
+            out.write(u'<table:table-column{}/>'.format(attrs))
+            position = max(position, last)
+
+        if max(max_col, 1) > position:
+            out.write(u'<table:table-column table:style-name="co1" '
+                      u'table:number-columns-repeated="{}"/>'.format(
+                          max(max_col, 1) - position))
+
+    def _cell(self, cell, row, col, shared):
+        """ Return the tuple (col, attributes, content) of a cell read by the
+        sheet parser.
+        """
+
+        ctype = cell.attrs.get('t', 'n')
+        xf = int(cell.attrs.get('s', 0))
+        value, inline = cell.value, cell.inline
+
+        formula = None
+        if cell.formula is not None:
+            formula = self._formula(cell.formula, cell.formula_text, row, col,
+                                    shared)
+
+        attrs = []
+        if xf and xf < len(self._cell_styles):
+            attrs.append(u'table:style-name="ce{}"'.format(xf))
+        if formula:
+            attrs.append(u'table:formula="of:={}"'.format(_xml(formula[0])))
+            if formula[1]:
+                attrs.append(u'table:number-matrix-rows-spanned="{}" '
+                             u'table:number-matrix-columns-spanned="{}"'
+                             .format(*formula[1]))
+
+        content = u''
+        if ctype == 's' and value is not None:
+            text = self._reader.strings[int(value)]
+            attrs.append(u'office:value-type="string"')
+            content = _paragraphs(text)
+        elif ctype == 'inlineStr' or (ctype == 'str' and value is not None):
+            text = inline if ctype == 'inlineStr' else value
+            attrs.append(u'office:value-type="string"')
+            content = _paragraphs(text or u'')
+        elif ctype == 'b' and value is not None:
+            value = value in ('1', 'true')
+            attrs.append(u'office:value-type="boolean" '
+                         u'office:boolean-value="{}"'.format(
+                             u'true' if value else u'false'))
+            content = u'<text:p>{}</text:p>'.format(
+                u'TRUE' if value else u'FALSE')
+        elif ctype == 'e' and value is not None:
+            attrs.append(u'office:value-type="string"')
+            content = _paragraphs(value)
+        elif ctype == 'd' and value is not None:
+            attrs.append(u'office:value-type="date" office:date-value="{}"'
+                         .format(_xml(value)))
+        elif value is not None:
+            number = self._number(value, xf)
+            if isinstance(number, tuple):
+                number, content = number
+            attrs.append(number)
+        elif not attrs:
+            return None
+
+        return (col, u' '.join(attrs), content)
+
+    def _formula(self, attrs, text, row, col, shared):
+        """ Return the translated formula of a cell and the size of its array
+        or None if it can not be translated.
+        """
+
+        kind = attrs.get('t')
+
+        try:
+            if kind == 'shared':
+                index = attrs.get('si')
+                if text:
+                    shared[index] = (row, col, text)
+                    return (translate_formula(text), None)
+                base_row, base_col, text = shared[index]
+                return (translate_formula(text, row - base_row,
+                                          col - base_col), None)
+
+            if not text:
+                return None
+
+            size = None
+            if kind == 'array' and attrs.get('ref'):
+                bounds = [_split_ref(ref) for ref in attrs['ref'].split(':')]
+                size = (bounds[-1][0] - bounds[0][0] + 1,
+                        bounds[-1][1] - bounds[0][1] + 1)
+
+            return (translate_formula(text), size)
+
+        except (FormulaError, KeyError, ValueError):
+            self.lost_formulas += 1
+            return None
+
+    def _number(self, value, xf):
+        """ Return the value attributes of a numeric cell
+        """
+
+        kind = self._kinds[xf] if xf < len(self._kinds) else None
+
+        try:
+            number = float(value)
+        except ValueError:
+            return u'office:value-type="string" office:string-value="{}"' \
+                .format(_xml(value))
+
+        if kind == 'date':
+            try:
+                date = self._epoch + datetime.timedelta(days=number)
+            except OverflowError:
+                date = None
+            if date is not None:
+                return u'office:value-type="date" office:date-value="{}"' \
+                    .format(date.strftime('%Y-%m-%dT%H:%M:%S')
+                            if date.year >= 1900 else date.isoformat())
+
+        if kind == 'time':
+            seconds = int(round(number * 86400))
+            return u'office:value-type="time" office:time-value=' \
+                   u'"PT{}H{:02d}M{:02d}S"'.format(
+                       seconds // 3600, seconds // 60 % 60, seconds % 60), \
+                u'<text:p>{:02d}:{:02d}:{:02d}</text:p>'.format(
+                    seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+        if kind == 'percentage':
+            return u'office:value-type="percentage" office:value="{}"'.format(
+                value)
+
+        return u'office:value-type="float" office:value="{}"'.format(value)
+
+    # ----------------------------- ROW WRITING -------------------------------
+
+    def _write_row(self, table, index, attrs, cells):
+        """ Write one row, including the rows before it which have only
+        covered cells of merged areas.
+        """
+
+        self._write_rows_until(table, index)
+
+        style = u''
+        if attrs.get('customHeight') in ('1', 'true') and attrs.get('ht'):
+            height = u'{}pt'.format(attrs['ht'])
+            style = u' table:style-name="{}"'.format(
+                self._row_styles.setdefault(
+                    height, u'ro{}'.format(len(self._row_styles) + 2)))
+        if attrs.get('hidden') in ('1', 'true'):
+            style += u' table:visibility="collapse"'
+
+        self._body.write(u'<table:table-row{}>{}</table:table-row>'.format(
+            style, _cells_xml(table, index, cells)))
+
+        table.next_row = index + 1
+
+    def _write_rows_until(self, table, index):
+        """ Write the empty rows from the next row until index, those which
+        have covered cells are written one by one.
+        """
+
+        out = self._body
+
+        for row in table.merged_before(index):
+            if row > table.next_row:
+                out.write(u'<table:table-row table:number-rows-repeated="{}">'
+                          u'<table:table-cell/></table:table-row>'.format(
+                              row - table.next_row))
+            out.write(u'<table:table-row>{}</table:table-row>'.format(
+                _cells_xml(table, row, [])))
+            table.next_row = row + 1
+
+        if index is not None and index > table.next_row:
+            out.write(u'<table:table-row table:number-rows-repeated="{}">'
+                      u'<table:table-cell/></table:table-row>'.format(
+                          index - table.next_row))
+            table.next_row = index
+
+    # -------------------------------- STYLES ---------------------------------
+
+    def _cell_style(self, index, xf):
+        """ Return the automatic style for the given cell format
+        """
+
+        reader = self._reader
+        cell, paragraph, text = [], [], []
+
+        # STEP 1: Number format
+        data_style = self._data_style(xf['format'])
+
+        # STEP 2: Fill, borders and alignment
+        fill = reader.color(xf['fill'])
+        if fill:
+            cell.append(u'fo:background-color="{}"'.format(fill))
+
+        for side, (style, color) in sorted((xf['border'] or {}).items()):
+            if style in BORDERS:
+                cell.append(u'fo:border-{}="{} {}"'.format(
+                    side, BORDERS[style], reader.color(color) or u'#000000'))
+
+        align = xf['align']
+        if align.get('wrapText') in ('1', 'true'):
+            cell.append(u'fo:wrap-option="wrap"')
+        if align.get('vertical') in VERTICAL:
+            cell.append(u'style:vertical-align="{}"'.format(
+                VERTICAL[align['vertical']]))
+        if align.get('horizontal') in HORIZONTAL:
+            cell.append(u'style:text-align-source="fix"')
+            paragraph.append(u'fo:text-align="{}"'.format(
+                HORIZONTAL[align['horizontal']]))
+        if align.get('indent'):
+            paragraph.append(u'fo:margin-left="{}pt"'.format(
+                int(align['indent']) * 9))
+
+        # STEP 3: Font
+        font = xf['font'] or {}
+        if font.get('b'):
+            text.append(u'fo:font-weight="bold"')
+        if font.get('i'):
+            text.append(u'fo:font-style="italic"')
+        if font.get('strike'):
+            text.append(u'style:text-line-through-style="solid"')
+        if font.get('u') and font['u'] != 'none':
+            text.append(u'style:text-underline-style="solid" '
+                        u'style:text-underline-type="{}" '
+                        u'style:text-underline-width="auto" '
+                        u'style:text-underline-color="font-color"'.format(
+                            u'double' if font['u'].startswith('double')
+                            else u'single'))
+        if font.get('size'):
+            text.append(u'fo:font-size="{}pt"'.format(font['size']))
+        if font.get('name'):
+            text.append(u'fo:font-family="{}"'.format(_xml(font['name'])))
+        if reader.color(font.get('color')):
+            text.append(u'fo:color="{}"'.format(reader.color(font['color'])))
+
+        parts = [u'<style:style style:name="ce{}" style:family="table-cell" '
+                 u'style:parent-style-name="Default"{}>'.format(
+                     index, u' style:data-style-name="{}"'.format(data_style)
+                     if data_style else u'')]
+        if cell:
+            parts.append(u'<style:table-cell-properties {}/>'.format(
+                u' '.join(cell)))
+        if paragraph:
+            parts.append(u'<style:paragraph-properties {}/>'.format(
+                u' '.join(paragraph)))
+        if text:
+            parts.append(u'<style:text-properties {}/>'.format(
+                u' '.join(text)))
+        parts.append(u'</style:style>')
+
+        return u''.join(parts)
+
+    def _value_kind(self, fmt):
+        """ Return the kind of value a number format shows: date, time,
+        percentage or None for plain numbers.
+        """
+
+        code = _first_section(self._reader.formats.get(fmt, u'General'))
+        plain = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', u'', code)
+
+        if re.search(r'[dy]', plain, re.I):
+            return 'date'
+        if re.search(r'[hs]', plain, re.I) or \
+                re.search(r'\[(h+|m+|s+)\]', code, re.I):
+            return 'time'
+        if re.search(r'm', plain, re.I):
+            return 'date'
+        if u'%' in plain:
+            return 'percentage'
+
+        return None
+
+    def _data_style(self, fmt):
+        """ Return the name of the data style for the given number format,
+        it is created the first time it is used.
+        """
+
+        if fmt in self._data_styles:
+            return self._data_styles[fmt][0]
+
+        code = _first_section(self._reader.formats.get(fmt, u'General'))
+        if code in (u'General', u''):
+            return None
+
+        name = u'N{}'.format(fmt)
+        kind = self._value_kind(fmt)
+
+        if kind in ('date', 'time'):
+            xml = _date_style(name, code, kind)
+        elif code == u'@':
+            xml = u'<number:text-style style:name="{}"><number:text-content/>' \
+                  u'</number:text-style>'.format(name)
+        else:
+            xml = _number_style(name, code, kind)
+
+        self._data_styles[fmt] = (name, xml)
+
+        return name
+
+    # ------------------------------- CLOSING ---------------------------------
+
+    def _write_names(self, local):
+        """ Write the named ranges of the sheet in the given position of the
+        workbook, or the global ones when local is None. Hidden names and
+        those which can not be translated are left behind.
+        """
+
+        named = []
+        for name, text, sheet, hidden in self._reader.names:
+            if sheet != local or hidden or name.startswith(u'_xlnm.'):
+                continue
+            try:
+                expression = translate_formula(text.lstrip(u'='))
+            except FormulaError:
+                continue
+            if not re.match(r"^\[\$('(?:[^']|'')+'|[\w.]+)\.[^\]]*\]$",
+                            expression):
+                named.append(u'<table:named-expression table:name="{}" '
+                             u'table:expression="of:={}"/>'.format(
+                                 _xml(name), _xml(expression)))
+            else:
+                address = expression[1:-1]
+                named.append(u'<table:named-range table:name="{}" '
+                             u'table:base-cell-address="{}" '
+                             u'table:cell-range-address="{}"/>'.format(
+                                 _xml(name), _xml(address.split(u':')[0]),
+                                 _xml(address)))
+
+        if named:
+            self._body.write(u'<table:named-expressions>{}'
+                             u'</table:named-expressions>'.format(
+                                 u''.join(named)))
+
+    def close(self):
+        """ Write the named ranges, close the body and return the path of the
+        complete content.xml
+        """
+
+        self._write_names(None)
+        self._body.close()
+
+        path = os.path.join(self._tmpdir, 'content.xml')
+        with codecs.open(path, 'w', 'utf-8') as fout:
+            fout.write(XML_HEADER)
+            fout.write(u'<office:document-content {}>'.format(ODS_NAMESPACES))
+            fout.write(u'<office:automatic-styles>')
+
+            for _, xml in sorted(self._data_styles.values()):
+                fout.write(xml)
+            fout.write(u'<style:style style:name="ta1" style:family="table">'
+                       u'<style:table-properties table:display="true"/>'
+                       u'</style:style>'
+                       u'<style:style style:name="ta2" style:family="table">'
+                       u'<style:table-properties table:display="false"/>'
+                       u'</style:style>'
+                       u'<style:style style:name="co1" '
+                       u'style:family="table-column"><style:table-column-'
+                       u'properties style:column-width="0.8925in"/>'
+                       u'</style:style>')
+            for width, name in self._column_styles.items():
+                fout.write(u'<style:style style:name="{}" style:family='
+                           u'"table-column"><style:table-column-properties '
+                           u'style:column-width="{}"/></style:style>'.format(
+                               name, width))
+            for height, name in self._row_styles.items():
+                fout.write(u'<style:style style:name="{}" style:family='
+                           u'"table-row"><style:table-row-properties '
+                           u'style:row-height="{}" style:use-optimal-row-'
+                           u'height="false"/></style:style>'.format(
+                               name, height))
+            for style in self._cell_styles:
+                fout.write(style)
+
+            fout.write(u'</office:automatic-styles>')
+            fout.write(u'<office:body><office:spreadsheet>')
+
+        with open(path, 'ab') as fout:
+            with open(self._body_path, 'rb') as fin:
+                shutil.copyfileobj(fin, fout)
+            fout.write(b'</office:spreadsheet></office:body>'
+                       b'</office:document-content>')
+
+        return path
+
+
+class _SheetParser(object):
+    """ Reads a worksheet with expat, cells are passed to the writer as soon
+    as they are read and rows are written as soon as they end, no tree is
+    built so memory use does not depend on the size of the sheet.
+    """
+
+    def __init__(self, writer, table):
+        self._writer = writer
+        self._table = table
+        self._shared = {}
+
+        self._columns, self._max_col = [], 0
+        self._columns_written = False
+
+        self._row, self._row_attrs, self._cells = -1, {}, []
+        self._col = -1
+        self._cell = None
+        self._text = None
+        self._phonetic = False
+
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def parse(self, fin):
+        """ Parse the sheet XML read from the given file object
+        """
+
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            self._parser.Parse(block, not block)
+            if not block:
+                break
+
+        if not self._columns_written:
+            self._write_columns()
+
+    def _write_columns(self):
+        """ Write the columns before the first row
+        """
+        self._writer._write_columns(self._columns, self._max_col)
+        self._columns_written = True
+
+    def _start(self, tag, attrs):
+        """ Expat handler for the beginning of an element
+        """
+
+        tag = _local_name(tag)
+
+        if tag == 'c':
+            ref = attrs.get('r')
+            self._col = _split_ref(ref)[1] if ref else self._col + 1
+            self._cell = _Cell(attrs)
+        elif tag in ('v', 'f') or (tag == 't' and not self._phonetic):
+            if self._cell is not None:
+                self._text = []
+                if tag == 'f':
+                    self._cell.formula = attrs
+        elif tag == 'row':
+            if not self._columns_written:
+                self._write_columns()
+            self._row = int(attrs.get('r', self._row + 2)) - 1
+            self._row_attrs, self._cells, self._col = attrs, [], -1
+        elif tag == 'rPh':
+            self._phonetic = True
+        elif tag == 'col':
+            self._columns.append(attrs)
+        elif tag == 'dimension':
+            try:
+                self._max_col = _split_ref(
+                    attrs.get('ref', 'A1').split(':')[-1])[1] + 1
+            except ValueError:
+                pass
+        elif tag == 'sheetData' and not self._columns_written:
+            self._write_columns()
+
+    def _end(self, tag):
+        """ Expat handler for the end of an element
+        """
+
+        tag = _local_name(tag)
+
+        if self._text is not None and tag in ('v', 'f', 't'):
+            text = u''.join(self._text)
+            self._text = None
+            if tag == 'v':
+                self._cell.value = text
+            elif tag == 'f':
+                self._cell.formula_text = text
+            else:
+                self._cell.inline = (self._cell.inline or u'') + text
+        elif tag == 'c':
+            cell = self._writer._cell(self._cell, self._row, self._col,
+                                      self._shared)
+            if cell:
+                self._cells.append(cell)
+            self._cell = None
+        elif tag == 'row':
+            self._writer._write_row(self._table, self._row, self._row_attrs,
+                                    self._cells)
+            self._cells = []
+        elif tag == 'rPh':
+            self._phonetic = False
+
+    def _data(self, data):
+        """ Expat handler for text
+        """
+
+        if self._text is not None:
+            self._text.append(data)
+
+
+class _Cell(object):
+    """ Cell being read by the sheet parser
+    """
+
+    __slots__ = ('attrs', 'value', 'formula', 'formula_text', 'inline')
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.value = None
+        self.formula = None
+        self.formula_text = None
+        self.inline = None
+
+
+def _local_name(tag, _cache={}):
+    """ Return an expat tag without its namespace prefix
+    """
+
+    try:
+        return _cache[tag]
+    except KeyError:
+        return _cache.setdefault(tag, tag.rpartition(':')[2])
+
+
+class _TableState(object):
+    """ Merged areas of a sheet and the next row will be written
+    """
+
+    def __init__(self, merged):
+        self.next_row = 0
+        self.merged_rows = {}
+
+        for first_row, first_col, last_row, last_col in merged:
+            for row in range(first_row, last_row + 1):
+                self.merged_rows.setdefault(row, []).append(
+                    (first_row, first_col, last_row, last_col))
+
+        self._pending = collections.deque(sorted(self.merged_rows))
+
+    def merged_before(self, index):
+        """ Return the rows with merged cells from the next row until index,
+        all the remaining ones when index is None.
+        """
+
+        rows = []
+        while self._pending and (index is None or self._pending[0] < index):
+            row = self._pending.popleft()
+            if row >= self.next_row:
+                rows.append(row)
+
+        return rows
+
+    def merges(self, row):
+        """ Return the spans by column of the areas beginning in the row and
+        the set of columns covered by areas in the given row.
+        """
+
+        spans, covered = {}, set()
+
+        for first_row, first_col, last_row, last_col in \
+                self.merged_rows.get(row, ()):
+            if row == first_row:
+                spans[first_col] = (last_row - first_row + 1,
+                                    last_col - first_col + 1)
+                covered.update(range(first_col + 1, last_col + 1))
+            else:
+                covered.update(range(first_col, last_col + 1))
+
+        return spans, covered
+
+
+def _cells_xml(table, row, cells):
+    """ Return the XML of the cells of a row adding the spans of the merged
+    areas and the empty cells between them.
+    """
+
+    spans, covered = table.merges(row)
+    position, result = 0, []
+
+    if spans or covered:
+        present = set([cell[0] for cell in cells])
+        cells = cells + [(col, u'', u'') for col in set(spans) | covered
+                         if col not in present]
+        cells.sort(key=lambda cell: cell[0])
+
+    if not cells:
+        return u'<table:table-cell/>'
+
+    for col, attrs, content in cells:
+        if col < position:
+            continue # Repeated cell reference
+        if col > position + 1:
+            result.append(u'<table:table-cell table:number-columns-repeated='
+                          u'"{}"/>'.format(col - position))
+        elif col > position:
+            result.append(u'<table:table-cell/>')
+
+        tag = u'table:covered-table-cell' if col in covered \
+            else u'table:table-cell'
+        if col in spans:
+            attrs += u' table:number-rows-spanned="{}" ' \
+                     u'table:number-columns-spanned="{}"'.format(*spans[col])
+
+        attrs = u' ' + attrs.strip() if attrs else u''
+        result.append(u'<{0}{1}>{2}</{0}>'.format(tag, attrs, content)
+                      if content else u'<{}{}/>'.format(tag, attrs))
+        position = col + 1
+
+    return u''.join(result)
+
+
+def _merged_cells(zin, path):
+    """ Return the merged areas of a sheet, they are at the end of the sheet
+    so its raw XML is scanned for them without parsing it.
+    """
+
+    marker, tail, found = b'<mergeCells', b'', []
+
+    with zin.open(path) as fin:
+        while True:
+            block = fin.read(1024 * 1024)
+            if not block:
+                break
+            data = tail + block
+            if found or marker in data:
+                found.append(data[data.find(marker):] if not found else block)
+                tail = b''
+            else:
+                tail = data[-len(marker):]
+
+    areas = []
+    for ref in re.findall(br'<mergeCell\s[^>]*ref="([^"]+)"', b''.join(found)):
+        bounds = [_split_ref(item.decode('ascii')) for item in ref.split(b':')]
+        areas.append(bounds[0] + bounds[-1])
+
+    return areas
+
+
+# ------------------------------ NUMBER STYLES --------------------------------
+
+
+def _first_section(code):
+    """ Return the format used for positive numbers
+    """
+
+    in_quotes = False
+    for pos, char in enumerate(code):
+        if char == u'"':
+            in_quotes = not in_quotes
+        elif char == u';' and not in_quotes:
+            return code[:pos]
+
+    return code
+
+
+def _number_style(name, code, kind):
+    """ Return a number or percentage data style for the given format code
+    """
+
+    plain = re.sub(r'"([^"]*)"|\\(.)|\[[^\]]*\]|_.|\*.',
+                   lambda match: match.group(1) or match.group(2) or u'', code)
+    match = re.search(r'[0#?][0#?,]*(\.[0#?]+)?', plain)
+    if not match:
+        return u'<number:number-style style:name="{}"><number:number/>' \
+               u'</number:number-style>'.format(name)
+
+    number = match.group(0)
+    decimals = len(match.group(1)) - 1 if match.group(1) else 0
+    integer = number.split(u'.')[0]
+    attrs = u'number:decimal-places="{}" number:min-integer-digits="{}"{}' \
+        .format(decimals, integer.count(u'0'),
+                u' number:grouping="true"' if u',' in integer else u'')
+
+    if re.search(r'E[+-]', plain, re.I):
+        element = u'<number:scientific-number {} number:min-exponent-digits=' \
+                  u'"2"/>'.format(attrs.replace(u' number:grouping="true"',
+                                                u''))
+    else:
+        element = u'<number:number {}/>'.format(attrs)
+
+    prefix = plain[:match.start()]
+    suffix = plain[match.end():].replace(u'%', u'')
+    suffix = re.sub(r'E[+-]0+', u'', suffix, flags=re.I)
+
+    parts = []
+    if prefix.strip():
+        parts.append(u'<number:text>{}</number:text>'.format(_xml(prefix)))
+    parts.append(element)
+    if kind == 'percentage':
+        parts.append(u'<number:text>%</number:text>')
+    elif suffix.strip():
+        parts.append(u'<number:text>{}</number:text>'.format(_xml(suffix)))
+
+    tag = u'number:percentage-style' if kind == 'percentage' \
+        else u'number:number-style'
+
+    return u'<{0} style:name="{1}">{2}</{0}>'.format(tag, name, u''.join(parts))
+
+
+def _date_style(name, code, kind):
+    """ Return a date or time data style for the given format code
+    """
+
+    tokens = DATE_TOKEN.findall(code)
+    parts, elapsed = [], False
+
+    for pos, token in enumerate(tokens):
+        lower = token.lower()
+        first = lower[:1]
+
+        # Minutes use the same letter as months, they follow hours or
+        # precede seconds
+        is_minute = first == u'm' and (
+            any([item.lower()[:1] == u'h' for item in tokens[max(0, pos - 2):
+                                                              pos]]) or
+            any([item.lower()[:1] == u's' for item in tokens[pos + 1:
+                                                              pos + 3]]))
+
+        if lower.startswith(u'[') and lower.strip(u'[]')[:1] in u'hms':
+            elapsed = True
+            lower = lower.strip(u'[]')
+            first = lower[:1]
+            is_minute = first == u'm'
+
+        style = u' number:style="long"' if len(lower) > 1 else u''
+
+        if first == u'y':
+            parts.append(u'<number:year{}/>'.format(
+                u' number:style="long"' if len(lower) > 2 else u''))
+        elif first == u'm' and is_minute:
+            parts.append(u'<number:minutes{}/>'.format(style))
+        elif first == u'm':
+            if len(lower) > 2:
+                parts.append(u'<number:month number:textual="true"{}/>'.format(
+                    u' number:style="long"' if len(lower) > 3 else u''))
+            else:
+                parts.append(u'<number:month{}/>'.format(style))
+        elif first == u'd':
+            if len(lower) > 2:
+                parts.append(u'<number:day-of-week{}/>'.format(
+                    u' number:style="long"' if len(lower) > 3 else u''))
+            else:
+                parts.append(u'<number:day{}/>'.format(style))
+        elif first == u'h':
+            parts.append(u'<number:hours{}/>'.format(style))
+        elif first == u's':
+            parts.append(u'<number:seconds{}/>'.format(style))
+        elif lower.startswith(u'.0') and parts and \
+                parts[-1].startswith(u'<number:seconds'):
+            parts[-1] = parts[-1].replace(
+                u'/>', u' number:decimal-places="{}"/>'.format(len(lower) - 1))
+        elif lower in (u'am/pm', u'a/p'):
+            parts.append(u'<number:am-pm/>')
+        elif lower.startswith(u'['):
+            continue
+        else:
+            text = token
+            if text.startswith(u'"'):
+                text = text[1:-1]
+            elif text.startswith(u'\\'):
+                text = text[1:]
+            elif text in (u'_', u'*'):
+                continue
+            if parts and parts[-1].startswith(u'<number:text>'):
+                parts[-1] = parts[-1][:-len(u'</number:text>')] + _xml(text) + \
+                    u'</number:text>'
+            else:
+                parts.append(u'<number:text>{}</number:text>'.format(
+                    _xml(text)))
+
+    tag = u'number:time-style' if kind == 'time' else u'number:date-style'
+    extra = u' number:truncate-on-overflow="false"' if elapsed else u''
+
+    return u'<{0} style:name="{1}"{2}>{3}</{0}>'.format(
+        tag, name, extra, u''.join(parts))
+
+
+# ----------------------------- PACKAGE WRITER --------------------------------
+
+
+def _write_package(content, new_path):
+    """ Write the ods zip with the given content.xml
+    """
+
+    tmppath = temporary_path(new_path)
+
+    try:
+        with zipfile.ZipFile(tmppath, 'w', zipfile.ZIP_DEFLATED,
+                             True) as zout:
+            # The mimetype must be the first entry and it must not be
+            # compressed
+            zout.writestr(zipfile.ZipInfo('mimetype'), ODS_MIMETYPE,
+                          zipfile.ZIP_STORED)
+            zout.write(content, 'content.xml')
+            zout.writestr('styles.xml', _styles_xml())
+            zout.writestr('META-INF/manifest.xml', _manifest_xml())
+
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.rename(tmppath, new_path)
+
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
+def _styles_xml():
+    """ Return styles.xml with the default cell style
+    """
+
+    return (XML_HEADER + u'<office:document-styles {}><office:styles>'
+            u'<style:style style:name="Default" style:family="table-cell"/>'
+            u'</office:styles></office:document-styles>'.format(
+                ODS_NAMESPACES)).encode('utf-8')
+
+
+def _manifest_xml():
+    """ Return META-INF/manifest.xml
+    """
+
+    return (XML_HEADER + u'<manifest:manifest xmlns:manifest="urn:oasis:'
+            u'names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">'
+            u'<manifest:file-entry manifest:full-path="/" manifest:version='
+            u'"1.2" manifest:media-type="{}"/>'
+            u'<manifest:file-entry manifest:full-path="content.xml" '
+            u'manifest:media-type="text/xml"/>'
+            u'<manifest:file-entry manifest:full-path="styles.xml" '
+            u'manifest:media-type="text/xml"/>'
+            u'</manifest:manifest>'.format(ODS_MIMETYPE)).encode('utf-8')
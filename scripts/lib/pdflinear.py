@@ -0,0 +1,685 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" Linearized PDF output, also known as fast web view. The document is
+written again so a viewer reading it while it is downloaded can show the
+first page as soon as it has the first bytes: the catalog, the first page and
+everything it uses come first, with their own cross reference section, then
+the other pages, each one followed by the objects only it uses, the objects
+shared by several pages and the rest. A hint stream tells where each page and
+each shared object starts, see Annex F of the PDF specification.
+
+Objects are sorted as qpdf does, so its --check-linearization agrees with the
+hint tables. Object streams are not used, the whole file has plain cross
+reference tables.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import collections
+import os
+import shutil
+import tempfile
+import zlib
+
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject,
+                            DictionaryObject, EncodedStreamObject,
+                            IndirectObject, NameObject, NullObject,
+                            NumberObject, StreamObject)
+
+from lib.pdfreader import MappedReader
+from lib.pdfupdate import serialize
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+ENDOBJ = b'\nendobj\n'
+
+# Keys of the catalog whose objects are needed to open the document
+OPEN_DOCUMENT_KEYS = ('/ViewerPreferences', '/PageMode', '/Threads',
+                      '/OpenAction', '/AcroForm')
+
+# Objects of the input which are written again: the page tree becomes one
+# node and the catalog points to it
+NODE_TYPES = ('/Page', '/Pages', '/Catalog')
+
+# Key of the new page tree node among the keys of the input objects
+PAGES = 'pages'
+
+# Largest offset written, offsets are padded to its width until known
+MAX_OFFSET = 9999999999
+
+# Bytes copied at once from the spool file
+CHUNK_SIZE = 1 << 20
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def linearize_pdf(path, new_path):
+    """ Write a linearized copy of the PDF in path to new_path, which can be
+    path itself. It returns new_path.
+    """
+
+    tmppath = new_path + '.tmp'
+
+    try:
+        with MappedReader(path) as reader:
+            if reader.isEncrypted:
+                raise ValueError(u'Encrypted files can not be linearized')
+
+            layout = _Layout(reader)
+            spool = tempfile.TemporaryFile()
+            try:
+                with open(tmppath, 'wb') as fout:
+                    layout.write(spool, fout)
+            finally:
+                spool.close()
+
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.rename(tmppath, new_path)
+
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return new_path
+
+
+# ----------------------------- LAYOUT CLASS ----------------------------------
+
+
+class _Layout(object):
+    """ Finds which pages and document parts use each object of a reader,
+    sorts the objects in the parts of a linearized file and writes them.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._root = _key(reader.trailer.raw_get('/Root'))
+
+        self._pages = [reader.page(index)
+                       for index in range(reader.page_count())]
+        if not self._pages:
+            raise ValueError(u'Documents without pages can not be '
+                             u'linearized')
+
+        self._page_keys = {}
+        for page in self._pages:
+            key = _key(page.indirectRef)
+            if key in self._page_keys:
+                raise ValueError(u'Documents using a page twice can not be '
+                                 u'linearized')
+            self._page_keys[key] = page
+
+        self._users = collections.OrderedDict()   # key: set of users
+        self._used = [[] for _ in self._pages]    # keys used by each page
+
+        self._outlines = None
+        self._find_users()
+
+        self._parts = None
+        self._numbers = None
+        self._first_number = None
+        self._hint_number = None
+        self._size = None
+        self._sort()
+
+    # ------------------------------ OBJECT USE -------------------------------
+
+    def _find_users(self):
+        """ Find the users of every object: each page, each key of the
+        catalog, the document information and the catalog itself.
+        """
+
+        for index, page in enumerate(self._pages):
+            self._visit(('page', index), page.indirectRef)
+
+        if '/Info' in self._reader.trailer:
+            self._visit(('trailer', '/Info'),
+                        self._reader.trailer.raw_get('/Info'))
+
+        catalog = self._resolve(self._root)
+        for key, value in catalog.items():
+            if key != '/Pages':
+                self._visit(('key', key), value)
+
+        outlines = catalog.get('/Outlines')
+        if isinstance(outlines, IndirectObject) and \
+                _key(outlines) in self._users:
+            self._outlines = _key(outlines)
+
+        self._users.setdefault(self._root, set()).add(('root',))
+        self._users.setdefault(PAGES, set()).add(('key', '/Pages'))
+
+    def _visit(self, user, value):
+        """ Add user to the users of every object reached from value. Other
+        pages and the page tree are not followed, nor the parent of a page.
+        """
+
+        visited = set()
+        stack = [(value, True)]
+
+        while stack:
+            value, top = stack.pop()
+            page = False
+
+            if isinstance(value, IndirectObject):
+                key = _key(value)
+                if key in visited:
+                    continue
+
+                if top and user[0] == 'page' and key in self._page_keys:
+                    value, page = self._page_keys[key], True
+                else:
+                    value = self._resolve(key)
+                    if isinstance(value, DictionaryObject) and \
+                            value.get('/Type') in NODE_TYPES:
+                        continue
+
+                visited.add(key)
+                self._users.setdefault(key, set()).add(user)
+                if user[0] == 'page':
+                    self._used[user[1]].append(key)
+
+            if isinstance(value, ArrayObject):
+                stack.extend([(item, False) for item in reversed(value)])
+
+            elif isinstance(value, DictionaryObject):
+                items = [(key, item) for key, item in value.items()
+                         if not (page and key == '/Parent') and
+                         not (isinstance(value, StreamObject) and
+                              key == '/Length')]
+                for key, item in reversed(items):
+                    if page and key == '/Thumb':
+                        self._visit(('thumb', user[1]), item)
+                    else:
+                        stack.append((item, False))
+
+    def _resolve(self, key):
+        """ Return the input object with the given key, broken objects are
+        null as readers take them.
+        """
+
+        try:
+            obj = self._reader.getObject(IndirectObject(key[0], key[1],
+                                                        self._reader))
+        except Exception:
+            obj = None
+
+        return NullObject() if obj is None else obj
+
+    # ------------------------------- SORTING ---------------------------------
+
+    def _sort(self):
+        """ Sort the objects in the parts of the file and number them, the
+        objects of the first page part have the last numbers.
+        """
+
+        first = [_key(self._pages[0].indirectRef)]
+        first_shared = []
+        pages = [[_key(page.indirectRef)] for page in self._pages]
+        open_document = [self._root]
+        shared = []
+        other = [PAGES]
+        outlines = []
+        private = {}
+
+        # STEP 1: Each object goes where its users say
+        for key, users in self._users.items():
+            if key in self._page_keys or key in (self._root, PAGES):
+                continue
+
+            part = _part(users)
+            if isinstance(part, tuple):
+                private[key] = part[1]
+            elif part == 'outlines':
+                outlines.append(key)
+            elif part == 'open':
+                open_document.append(key)
+            elif part == 'first':
+                first.append(key)
+            elif part == 'first-shared':
+                first_shared.append(key)
+            elif part == 'shared':
+                shared.append(key)
+            elif part == 'other':
+                other.append(key)
+
+        # Objects used by just one page follow it, in the order it uses them
+        for index in range(1, len(self._pages)):
+            for key in self._used[index]:
+                if private.get(key) == index:
+                    pages[index].append(key)
+
+        if self._outlines in outlines:
+            outlines.remove(self._outlines)
+            outlines.insert(0, self._outlines)
+
+        first.extend(first_shared)
+        catalog = self._resolve(self._root)
+        if catalog.get('/PageMode') == '/UseOutlines':
+            first.extend(outlines)
+        else:
+            other[1:1] = outlines
+
+        self._parts = {
+            'open': open_document,
+            'first': first,
+            'pages': pages[1:],
+            'shared': shared,
+            'other': other,
+            'outlines': outlines
+        }
+
+        # STEP 2: The main cross reference table has the objects after the
+        # first page, the first one has the linearization dictionary and the
+        # objects before the end of the first page
+        self._numbers = {}
+        for key in sum(pages[1:], []) + shared + other:
+            self._numbers[key] = len(self._numbers) + 1
+
+        self._first_number = len(self._numbers) + 1
+        self._hint_number = self._first_number + 1 + len(open_document)
+        number = self._first_number + 1
+        for key in open_document:
+            self._numbers[key] = number
+            number += 1
+        number += 1
+        for key in first:
+            self._numbers[key] = number
+            number += 1
+
+        self._size = number
+
+    # ------------------------------- WRITING ---------------------------------
+
+    def write(self, spool, fout):
+        """ Write the linearized file to fout, the objects are serialized to
+        spool first, in the same order, so their lengths are known.
+        """
+
+        parts = self._parts
+        rest = parts['first'] + sum(parts['pages'], []) + parts['shared'] + \
+            parts['other']
+
+        # STEP 1: Serialize the objects
+        lengths = {}
+        for key in parts['open'] + rest:
+            number = self._numbers[key]
+            start = spool.tell()
+            spool.write(b'%d 0 obj\n' % number)
+            self._remap(self._object(key)).writeToStream(spool, None)
+            spool.write(ENDOBJ)
+            lengths[number] = spool.tell() - start
+
+        # STEP 2: Offsets of the objects, those after the hint stream as if
+        # it was not there, which is what the hint tables need
+        linearized = len(_linearization(self._first_number,
+                                        self._values())) + len(ENDOBJ)
+        first_xref = len(self._first_xref({}, MAX_OFFSET))
+
+        offsets = {}
+        position = len(HEADER) + linearized + first_xref
+        for key in parts['open']:
+            offsets[self._numbers[key]] = position
+            position += lengths[self._numbers[key]]
+        hint_offset = position
+        for key in rest:
+            offsets[self._numbers[key]] = position
+            position += lengths[self._numbers[key]]
+
+        hint = self._hint_stream(offsets, lengths)
+
+        for key in rest:
+            offsets[self._numbers[key]] += len(hint)
+        last = self._numbers[parts['first'][-1]]
+        main_xref = position + len(hint)
+
+        # STEP 3: The linearization dictionary and the cross references
+        offsets[self._first_number] = len(HEADER)
+        offsets[self._hint_number] = hint_offset
+
+        head = b'xref\n0 %d\n' % self._first_number
+        xref = [head, b'0000000000 65535 f \n']
+        for number in range(1, self._first_number):
+            xref.append(b'%010d 00000 n \n' % offsets[number])
+        xref.append(b'trailer\n<< /Size %d >>\nstartxref\n%d\n%%%%EOF\n' %
+                    (self._first_number, len(HEADER) + linearized))
+        xref = b''.join(xref)
+
+        values = self._values(
+            length=main_xref + len(xref),
+            hint=(hint_offset, len(hint)),
+            end=offsets[last] + lengths[last],
+            xref=main_xref + len(head) - 1)
+
+        fout.write(HEADER)
+        fout.write(_linearization(self._first_number, values).ljust(
+            linearized - len(ENDOBJ)) + ENDOBJ)
+        fout.write(self._first_xref(offsets, main_xref).ljust(first_xref))
+
+        spool.seek(0)
+        _copy(spool, fout, hint_offset - len(HEADER) - linearized -
+              first_xref)
+        fout.write(hint)
+        shutil.copyfileobj(spool, fout, CHUNK_SIZE)
+        fout.write(xref)
+
+    def _values(self, length=MAX_OFFSET, hint=(MAX_OFFSET, MAX_OFFSET),
+                end=MAX_OFFSET, xref=MAX_OFFSET):
+        """ Return the values of the linearization dictionary, the offsets
+        are the largest ones until they are known.
+        """
+
+        return {
+            'L': length,
+            'H': hint,
+            'O': self._numbers[self._parts['first'][0]],
+            'E': end,
+            'N': len(self._pages),
+            'T': xref
+        }
+
+    def _first_xref(self, offsets, main_xref):
+        """ Return the cross reference table of the first page part and its
+        trailer, with the last startxref, whose value is unused, as 0.
+        """
+
+        lines = [b'xref\n%d %d\n' % (self._first_number,
+                                     self._size - self._first_number)]
+        for number in range(self._first_number, self._size):
+            lines.append(b'%010d 00000 n \n' % offsets.get(number, 0))
+
+        trailer = DictionaryObject({
+            NameObject('/Size'): NumberObject(self._size),
+            NameObject('/Root'): IndirectObject(self._numbers[self._root], 0,
+                                                None),
+            NameObject('/Prev'): NumberObject(main_xref)
+        })
+        for key in ('/Info', '/ID'):
+            if key in self._reader.trailer:
+                trailer[NameObject(key)] = self._remap(
+                    self._reader.trailer.raw_get(key))
+
+        lines.append(b'trailer\n')
+        lines.append(serialize(trailer))
+        lines.append(b'\nstartxref\n0\n%%EOF\n')
+
+        return b''.join(lines)
+
+    def _object(self, key):
+        """ Return the object which is written with the given key
+        """
+
+        if key == PAGES:
+            return DictionaryObject({
+                NameObject('/Type'): NameObject('/Pages'),
+                NameObject('/Kids'): ArrayObject(
+                    [page.indirectRef for page in self._pages]),
+                NameObject('/Count'): NumberObject(len(self._pages))
+            })
+
+        if key in self._page_keys:
+            return self._page_keys[key]
+
+        return self._resolve(key)
+
+    def _remap(self, value):
+        """ Return a copy of value whose indirect references point to the new
+        object numbers, page tree nodes point to the new one.
+        """
+
+        if isinstance(value, IndirectObject):
+            key = _key(value)
+            if key not in self._numbers:
+                obj = self._resolve(key)
+                if isinstance(obj, DictionaryObject) and \
+                        obj.get('/Type') == '/Pages':
+                    key = PAGES
+                elif isinstance(obj, DictionaryObject) and \
+                        obj.get('/Type') == '/Catalog':
+                    key = self._root
+            if key in self._numbers:
+                return IndirectObject(self._numbers[key], 0, None)
+            return NullObject()
+
+        if isinstance(value, StreamObject):
+            result = EncodedStreamObject() if '/Filter' in value \
+                else DecodedStreamObject()
+            result._data = value._data #pylint: disable=W0212
+        elif isinstance(value, DictionaryObject):
+            result = DictionaryObject()
+        elif isinstance(value, ArrayObject):
+            return ArrayObject([self._remap(item) for item in value])
+        elif value is None:
+            return NullObject()
+        else:
+            return value
+
+        for key, item in value.items():
+            if not (isinstance(value, StreamObject) and key == '/Length'):
+                result[NameObject(key)] = self._remap(item)
+
+        return result
+
+    # ------------------------------ HINT TABLES ------------------------------
+
+    def _hint_stream(self, offsets, lengths):
+        """ Return the primary hint stream object: the page offset hint
+        table, the shared object hint table and the outline hint table.
+        """
+
+        parts = self._parts
+        numbers = self._numbers
+
+        # STEP 1: Page offset hint table, the first page is the whole first
+        # page part and the other ones each page and its own objects
+        groups = [[numbers[key] for key in parts['first']]] + \
+            [[numbers[key] for key in keys] for keys in parts['pages']]
+        sizes = [sum([lengths[number] for number in group])
+                 for group in groups]
+
+        index = {}
+        for key in parts['first'] + parts['shared']:
+            index[key] = len(index)
+
+        references = [[]]
+        for used in self._used[1:]:
+            references.append([index[key] for key in used if key in index
+                               and len(self._users[key]) > 1])
+
+        least_objects = min([len(group) for group in groups])
+        objects_bits = _nbits(max([len(group) for group in groups]) -
+                              least_objects)
+        least_size = min(sizes)
+        size_bits = _nbits(max(sizes) - least_size)
+        count_bits = _nbits(max([len(items) for items in references]))
+        index_bits = _nbits(len(index))
+
+        bits = _Bits()
+        for value, width in ((least_objects, 32), (offsets[groups[0][0]], 32),
+                             (objects_bits, 16), (least_size, 32),
+                             (size_bits, 16), (0, 32), (0, 16),
+                             (least_size, 32), (size_bits, 16),
+                             (count_bits, 16), (index_bits, 16), (0, 16),
+                             (4, 16)):
+            bits.write(value, width)
+
+        bits.write_all([len(group) - least_objects for group in groups],
+                       objects_bits)
+        bits.write_all([size - least_size for size in sizes], size_bits)
+        bits.write_all([len(items) for items in references], count_bits)
+        bits.write_all(sum(references, []), index_bits)
+        bits.write_all([], 0) # Numerators of the shared references
+        bits.write_all([0] * len(groups), 0) # Offsets of the contents
+        bits.write_all([size - least_size for size in sizes], size_bits)
+
+        # STEP 2: Shared object hint table, one object in each group, the
+        # objects of the first page part and those shared by other pages
+        shared = [numbers[key] for key in parts['first'] + parts['shared']]
+        first_shared = numbers[parts['shared'][0]] if parts['shared'] else 0
+        shared_sizes = [lengths[number] for number in shared]
+        least_size = min(shared_sizes)
+        size_bits = _nbits(max(shared_sizes) - least_size)
+
+        data = bits.getvalue()
+        shared_offset = len(data)
+
+        bits = _Bits()
+        for value, width in ((first_shared, 32),
+                             (offsets.get(first_shared, 0), 32),
+                             (len(parts['first']), 32), (len(shared), 32),
+                             (0, 16), (least_size, 32), (size_bits, 16)):
+            bits.write(value, width)
+
+        bits.write_all([size - least_size for size in shared_sizes],
+                       size_bits)
+        bits.write_all([0] * len(shared), 1) # No signatures
+        bits.write_all([0] * len(shared), 0) # One object each
+
+        data += bits.getvalue()
+
+        stream = EncodedStreamObject()
+        stream[NameObject('/S')] = NumberObject(shared_offset)
+
+        # STEP 3: Outline hint table
+        if self._outlines:
+            outlines = [numbers[key] for key in parts['outlines']]
+            stream[NameObject('/O')] = NumberObject(len(data))
+
+            bits = _Bits()
+            for value in (outlines[0], offsets[outlines[0]], len(outlines),
+                          sum([lengths[number] for number in outlines])):
+                bits.write(value, 32)
+            data += bits.getvalue()
+
+        stream._data = zlib.compress(data) #pylint: disable=W0212
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+
+        return b'%d 0 obj\n' % self._hint_number + serialize(stream) + ENDOBJ
+
+
+class _Bits(object):
+    """ Bit writer for the hint tables, values are written most significant
+    bit first.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._value = 0
+        self._count = 0
+
+    def write(self, value, width):
+        """ Write value in width bits
+        """
+
+        for shift in reversed(range(width)):
+            self._value = (self._value << 1) | ((value >> shift) & 1)
+            self._count += 1
+            if self._count == 8:
+                self._data.append(self._value)
+                self._value, self._count = 0, 0
+
+    def write_all(self, values, width):
+        """ Write one item of every entry of a table, the next item starts
+        in a new byte.
+        """
+
+        for value in values:
+            self.write(value, width)
+        self.flush()
+
+    def flush(self):
+        """ Fill the current byte with zeros
+        """
+
+        if self._count:
+            self._data.append(self._value << (8 - self._count))
+            self._value, self._count = 0, 0
+
+    def getvalue(self):
+        """ Return the bytes written
+        """
+
+        self.flush()
+        return bytes(self._data)
+
+
+def _part(users):
+    """ Return the part of the file where an object goes given its users:
+    'root', 'outlines', 'open', 'first', 'first-shared', ('page', index),
+    'shared' or 'other'.
+    """
+
+    first, pages, others = False, set(), 0
+    root = outlines = open_document = False
+
+    for user in users:
+        if user[0] == 'root':
+            root = True
+        elif user[0] == 'key' and user[1] in OPEN_DOCUMENT_KEYS:
+            open_document = True
+        elif user[0] == 'key' and user[1] == '/Outlines':
+            outlines = True
+        elif user[0] == 'page' and user[1] == 0:
+            first = True
+        elif user[0] == 'page':
+            pages.add(user[1])
+        else:
+            others += 1
+
+    if root:
+        return 'root'
+    if outlines:
+        return 'outlines'
+    if open_document:
+        return 'open'
+    if first:
+        return 'first' if not pages and not others else 'first-shared'
+    if len(pages) == 1 and not others:
+        return ('page', pages.pop())
+    if len(pages) > 1:
+        return 'shared'
+    return 'other'
+
+
+def _linearization(number, values):
+    """ Return the linearization dictionary object, without its end
+    """
+
+    return (b'%d 0 obj\n<< /Linearized 1 /L %d /H [ %d %d ] /O %d /E %d '
+            b'/N %d /T %d >>') % (number, values['L'], values['H'][0],
+                                  values['H'][1], values['O'], values['E'],
+                                  values['N'], values['T'])
+
+
+def _nbits(value):
+    """ Return the number of bits needed to write value
+    """
+
+    bits = 0
+    while value:
+        bits += 1
+        value >>= 1
+    return bits
+
+
+def _copy(fin, fout, size):
+    """ Copy size bytes from fin to fout
+    """
+
+    while size > 0:
+        data = fin.read(min(size, CHUNK_SIZE))
+        if not data:
+            break
+        fout.write(data)
+        size -= len(data)
+
+
+def _key(ref):
+    """ Return the key of an indirect reference
+    """
+    return (ref.idnum, ref.generation)
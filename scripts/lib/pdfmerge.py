@@ -0,0 +1,756 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" Streaming PDF merge. The pages of each input, and every object they
+reference, are written to the output as soon as they are read, with new
+object numbers, and the input is closed before the next one is opened. Only
+the object numbers of the pages and the bookmarks are kept until the end, so
+memory use depends on the largest input instead of on all of them.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import collections
+import hashlib
+import io
+import os
+import re
+import time
+
+from PyPDF2.generic import (ArrayObject, ByteStringObject,
+                            DecodedStreamObject, DictionaryObject,
+                            EncodedStreamObject, IndirectObject, NameObject,
+                            NullObject, NumberObject, StreamObject,
+                            createStringObject)
+
+from lib.pdfreader import MappedReader
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+
+# Objects which belong to the document structure of an input and are never
+# copied, the new document has its own ones
+EXCLUDED_TYPES = ('/Catalog', '/Pages')
+
+# Objects which can be shared by several inputs besides streams, resources
+# drawn by the pages. Annotations and form fields belong to just one page.
+SHARED_TYPES = ('/Font', '/FontDescriptor', '/Encoding', '/ExtGState',
+                '/Pattern', '/Shading')
+
+# Page selections, like 1-3,5,z or r3-r1, see page_numbers
+PAGE = r'(?:[0-9]+|z|r[0-9]+)'
+SELECTION = re.compile(r'^{0}(?:-{0})?(?:,{0}(?:-{0})?)*$'.format(PAGE))
+
+# Titles set by the applications instead of a real one, like Untitled,
+# Document1 or Microsoft Word - report.docx
+PLACEHOLDER_TITLE = re.compile(
+    u'^(?:untitled|sin t\xedtulo|sans titre|ohne titel|document|documento|'
+    u'presentation|book|libro)[0-9 ]*$|^microsoft [a-z]+ - |^[-_. ]*$',
+    re.IGNORECASE | re.UNICODE)
+
+# Page attributes which change the way a page looks
+APPEARANCE = ('/Contents', '/Resources', '/MediaBox', '/CropBox', '/Rotate',
+              '/Group', '/UserUnit')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def merge_pdfs(paths, new_path, metadata=None, import_bookmarks=True):
+    """ Merge the given PDF files in new_path, metadata is a dictionary with
+    document information like {'/Title': u'...'}. It returns the number of
+    pages written.
+    """
+
+    merger = StreamingMerger(new_path)
+    try:
+        for path in paths:
+            merger.append(path, import_bookmarks=import_bookmarks)
+        merger.add_metadata(metadata or {})
+        merger.close()
+    except BaseException:
+        merger.abort()
+        raise
+
+    return merger.pages
+
+
+def page_digests(path):
+    """ Return the hex digest of the appearance of each page of the PDF in
+    path: its contents, its resources and its boxes, annotations are left
+    out. Equal pages, in this file or in any other, have the same digest.
+    Pages whose resources reach another page have None.
+    """
+
+    with MappedReader(path) as reader:
+        if reader.isEncrypted and not reader.decrypt(''):
+            raise ValueError(u'{} is encrypted'.format(path))
+
+        source = _Source(reader)
+        return [source.page_digest(reader.page(index))
+                for index in range(reader.page_count())]
+
+
+def split_selection(arg):
+    """ Split a file argument like 'book.pdf:3-10' in its path and its page
+    selection, which is None when the argument is just a path.
+    """
+
+    path, _, selection = arg.rpartition(':')
+    if not path or os.path.exists(arg) or not SELECTION.match(selection):
+        return arg, None
+
+    return path, selection
+
+
+def page_numbers(selection, count):
+    """ Return the positions, counting from 0, of the pages of a document
+    with count pages given by a selection: page numbers and ranges separated
+    by commas, z is the last page and rN the Nth page from the end, so 3-10,z
+    are the pages 3 to 10 and the last one and r1-1 all of them in reverse
+    order. Pages can be repeated.
+    """
+
+    if not selection or not SELECTION.match(selection):
+        raise ValueError(u'Wrong page selection {}'.format(selection))
+
+    def _number(text):
+        """ Return the position of a page given as in the selection
+        """
+
+        if text == 'z':
+            number = count
+        elif text.startswith('r'):
+            number = count + 1 - int(text[1:])
+        else:
+            number = int(text)
+
+        if not 1 <= number <= count:
+            raise ValueError(u'Page {} is not in a document with {} pages'
+                             .format(text, count))
+        return number - 1
+
+    result = []
+    for item in selection.split(','):
+        first, _, last = item.partition('-')
+        first = _number(first)
+        last = _number(last) if last else first
+        step = 1 if last >= first else -1
+        result.extend(range(first, last + step, step))
+
+    return result
+
+
+# ---------------------------- STREAMING MERGER -------------------------------
+
+
+class StreamingMerger(object):
+    """ Writes a new PDF appending the pages of other ones, the output is
+    written to a temporary file which replaces new_path when it is closed.
+    Objects identical to others already written, like the fonts and images
+    every input embeds, are not written again unless dedup is False.
+    """
+
+    def __init__(self, new_path, dedup=True):
+        self._new_path = new_path
+        self._tmppath = new_path + '.tmp'
+        self._fout = open(self._tmppath, 'wb')
+        self._fout.write(HEADER)
+
+        self._offsets = {}
+        self._next = 1
+        self._kids = []
+        self._bookmarks = []
+        self._info = {}
+
+        # Digests of the objects written which can be shared
+        self._dedup = dedup
+        self._shared = {}
+        self.shared_objects = 0
+        self.shared_bytes = 0
+
+        # Objects written when the document is closed
+        self._pages_number = self._allocate()
+        self._catalog_number = self._allocate()
+
+    @property
+    def pages(self):
+        """ Return the number of pages which have been appended
+        """
+        return len(self._kids)
+
+    def append(self, path, import_bookmarks=True, selection=None,
+               headings=None):
+        """ Append all the pages of the given PDF file, or those given by a
+        selection, see page_numbers. Only the selected pages are read. Its
+        bookmarks to the appended pages are appended too unless
+        import_bookmarks is False.
+
+        When headings, as lib.pdftext.find_headings returns them, are given
+        the file gets a bookmark to its first page, titled with its title or
+        its name, and its own bookmarks go under it, or the headings of the
+        appended pages when it has none.
+        """
+
+        with MappedReader(path) as reader:
+            if reader.isEncrypted and not reader.decrypt(''):
+                raise ValueError(u'{} is encrypted'.format(path))
+
+            count = reader.page_count()
+            numbers = page_numbers(selection, count) if selection \
+                else range(count)
+
+            pages = [reader.page(index) for index in numbers]
+            copied = self._copy_pages(reader, pages)
+
+            bookmarks = []
+            if import_bookmarks or headings is not None:
+                try:
+                    outlines = reader.getOutlines()
+                except Exception:
+                    outlines = []
+                bookmarks = _bookmarks(outlines, copied)
+
+            if headings is None:
+                self._bookmarks.extend(bookmarks)
+            elif pages:
+                # Pages repeated by the selection point to their first copy
+                first = {}
+                for index, page in zip(numbers, pages):
+                    first.setdefault(index, copied[_key(page.indirectRef)])
+
+                self._bookmarks.append((
+                    _file_title(reader, path),
+                    ArrayObject([IndirectObject(first[numbers[0]], 0, None),
+                                 NameObject('/Fit')]),
+                    bookmarks or _heading_bookmarks(headings, first)))
+
+    def add_metadata(self, metadata):
+        """ Set the document information, empty values are left out
+        """
+
+        for key, value in metadata.items():
+            if value:
+                self._info[NameObject(key)] = createStringObject(
+                    value if isinstance(value, unicode) else
+                    value.decode('utf-8', 'ignore'))
+
+    def close(self):
+        """ Write the page tree, the bookmarks, the catalog and the cross
+        reference table, and move the result to its final path.
+        """
+
+        pages_ref = IndirectObject(self._pages_number, 0, None)
+
+        # STEP 1: One flat page tree
+        self._write(self._pages_number, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(
+                [IndirectObject(number, 0, None) for number in self._kids]),
+            NameObject('/Count'): NumberObject(len(self._kids))
+        }))
+
+        # STEP 2: Catalog, bookmarks and document information
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): pages_ref
+        })
+        if self._bookmarks:
+            catalog[NameObject('/Outlines')] = self._write_outlines()
+        self._write(self._catalog_number, catalog)
+
+        info_number = None
+        if self._info:
+            info_number = self._allocate()
+            self._write(info_number, DictionaryObject(self._info))
+
+        # STEP 3: Cross reference table and trailer
+        self._write_xref(info_number)
+        self._fout.close()
+
+        if os.path.exists(self._new_path):
+            os.remove(self._new_path)
+        os.rename(self._tmppath, self._new_path)
+
+    def abort(self):
+        """ Discard the output which has been written until now
+        """
+
+        self._fout.close()
+        if os.path.exists(self._tmppath):
+            os.remove(self._tmppath)
+
+    # ----------------------------- OBJECT COPY -------------------------------
+
+    def _copy_pages(self, reader, pages):
+        """ Copy the given pages of the reader and everything they reference,
+        it returns the new numbers of the pages copied by their input ids.
+        Pages which are not copied are never written, links to them are left
+        out and other references to them are null.
+        """
+
+        source = _Source(reader)
+
+        # STEP 1: Pages have their numbers before anything is copied, so the
+        # references between pages, like links, are kept. Links to a page
+        # which is repeated point to its first copy.
+        numbers = []
+        for page in pages:
+            numbers.append(self._allocate())
+            source.pages.setdefault(_key(page.indirectRef), numbers[-1])
+        source.mapping.update(source.pages)
+
+        # STEP 2: Each page is written and then the objects it needs
+        pages_ref = IndirectObject(self._pages_number, 0, None)
+
+        for page, number in zip(pages, numbers):
+            data = DictionaryObject()
+            for key, value in page.items():
+                if key == '/Annots':
+                    value = _links_kept(value, source)
+                    if source.pages[_key(page.indirectRef)] != number:
+                        data[NameObject(key)] = self._copy_annots(
+                            value, source, number)
+                        continue
+                if key != '/Parent':
+                    data[NameObject(key)] = self._remap(value, source)
+            data[NameObject('/Parent')] = pages_ref
+
+            self._write(number, data)
+            self._kids.append(number)
+
+            while source.pending:
+                key = source.pending.popleft()
+                obj = source.resolve(key)
+                if isinstance(obj, DictionaryObject) and \
+                        obj.get('/Type') in EXCLUDED_TYPES + ('/Page',):
+                    obj = NullObject()
+                self._write(source.mapping[key], self._remap(obj, source))
+
+        return source.pages
+
+    def _copy_annots(self, annots, source, number):
+        """ Return the annotations of a page which is repeated, each copy of
+        the page gets its own copy of them, see _copy_pages.
+        """
+
+        result = ArrayObject()
+        for ref in annots:
+            if not isinstance(ref, IndirectObject):
+                result.append(ref)
+                continue
+
+            data = DictionaryObject()
+            for key, value in source.resolve(_key(ref)).items():
+                data[NameObject(key)] = self._remap(value, source)
+            if '/P' in data:
+                data[NameObject('/P')] = IndirectObject(number, 0, None)
+
+            result.append(IndirectObject(self._allocate(), 0, None))
+            self._write(result[-1].idnum, data)
+
+        return result
+
+    def _remap(self, value, source):
+        """ Return a copy of value whose indirect references point to the new
+        object numbers. Objects which have not been seen yet are looked up by
+        their contents among the ones already written, and if they are new
+        they get a number and are queued to be copied.
+        """
+
+        if isinstance(value, IndirectObject):
+            key = _key(value)
+            if key not in source.mapping:
+                if _is_page(source.resolve(key)):
+                    return NullObject() # A page which is not copied
+                self._map(key, source)
+            return IndirectObject(source.mapping[key], 0, None)
+
+        if isinstance(value, StreamObject):
+            result = EncodedStreamObject() if '/Filter' in value \
+                else DecodedStreamObject()
+            result._data = value._data
+        elif isinstance(value, DictionaryObject):
+            result = DictionaryObject()
+        elif isinstance(value, ArrayObject):
+            return ArrayObject([self._remap(item, source) for item in value])
+        elif value is None:
+            return NullObject()
+        else:
+            return value
+
+        for key, item in value.items():
+            result[NameObject(key)] = self._remap(item, source)
+
+        return result
+
+    def _map(self, key, source):
+        """ Give a new object number to an input object, unless an identical
+        one has been written before: fonts, images or forms shared by several
+        inputs are written once and every input points to the same copy.
+        Only streams and resources, see SHARED_TYPES, are shared.
+        """
+
+        digest = None
+        if self._dedup:
+            obj = source.resolve(key)
+            if isinstance(obj, StreamObject) or \
+                    (isinstance(obj, DictionaryObject) and
+                     obj.get('/Type') in SHARED_TYPES):
+                digest = source.digest(key)
+        if digest is not None and digest in self._shared:
+            source.mapping[key] = self._shared[digest]
+            obj = source.resolve(key)
+            self.shared_objects += 1
+            if isinstance(obj, StreamObject):
+                self.shared_bytes += len(obj._data)
+            return
+
+        source.mapping[key] = self._allocate()
+        source.pending.append(key)
+        if digest is not None:
+            self._shared[digest] = source.mapping[key]
+
+    # ------------------------------- WRITING ---------------------------------
+
+    def _allocate(self):
+        """ Return a new object number
+        """
+
+        number = self._next
+        self._next += 1
+        return number
+
+    def _write(self, number, obj):
+        """ Write an indirect object with the given number
+        """
+
+        buf = io.BytesIO()
+        obj.writeToStream(buf, None)
+
+        self._offsets[number] = self._fout.tell()
+        self._fout.write(b'%d 0 obj\n' % number)
+        self._fout.write(buf.getvalue())
+        self._fout.write(b'\nendobj\n')
+
+    def _write_outlines(self):
+        """ Write the bookmarks and return the reference to their root
+        """
+
+        root = self._allocate()
+        first, last, count = self._write_items(self._bookmarks, root)
+
+        self._write(root, DictionaryObject({
+            NameObject('/Type'): NameObject('/Outlines'),
+            NameObject('/First'): IndirectObject(first, 0, None),
+            NameObject('/Last'): IndirectObject(last, 0, None),
+            NameObject('/Count'): NumberObject(count)
+        }))
+
+        return IndirectObject(root, 0, None)
+
+    def _write_items(self, items, parent):
+        """ Write a level of bookmarks, items are (title, destination,
+        children) tuples. It returns the first and last object numbers and
+        the number of items, all the descendants included.
+        """
+
+        numbers = [self._allocate() for _ in items]
+        total = len(items)
+
+        for index, (title, dest, children) in enumerate(items):
+            data = DictionaryObject({
+                NameObject('/Title'): createStringObject(title),
+                NameObject('/Parent'): IndirectObject(parent, 0, None),
+                NameObject('/Dest'): dest
+            })
+            if index > 0:
+                data[NameObject('/Prev')] = IndirectObject(
+                    numbers[index - 1], 0, None)
+            if index + 1 < len(items):
+                data[NameObject('/Next')] = IndirectObject(
+                    numbers[index + 1], 0, None)
+
+            if children:
+                first, last, count = self._write_items(children,
+                                                       numbers[index])
+                data[NameObject('/First')] = IndirectObject(first, 0, None)
+                data[NameObject('/Last')] = IndirectObject(last, 0, None)
+                data[NameObject('/Count')] = NumberObject(-count)
+                total += count
+
+            self._write(numbers[index], data)
+
+        return numbers[0], numbers[-1], total
+
+    def _write_xref(self, info_number):
+        """ Write the cross reference table and the trailer
+        """
+
+        start = self._fout.tell()
+        size = self._next
+
+        lines = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for number in range(1, size):
+            if number in self._offsets:
+                lines.append(b'%010d 00000 n \n' % self._offsets[number])
+            else:
+                lines.append(b'0000000000 65535 f \n')
+        self._fout.write(b''.join(lines))
+
+        trailer = DictionaryObject({
+            NameObject('/Size'): NumberObject(size),
+            NameObject('/Root'): IndirectObject(self._catalog_number, 0, None),
+            NameObject('/ID'): ArrayObject([_file_id(self._new_path)] * 2)
+        })
+        if info_number:
+            trailer[NameObject('/Info')] = IndirectObject(info_number, 0,
+                                                          None)
+
+        buf = io.BytesIO()
+        trailer.writeToStream(buf, None)
+        self._fout.write(b'trailer\n' + buf.getvalue() +
+                         b'\nstartxref\n%d\n%%%%EOF\n' % start)
+
+
+class _Source(object):
+    """ An input being copied: its object mapping, the objects waiting to be
+    written and the digests of its objects.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.mapping = {}
+        self.pages = {}
+        self.pending = collections.deque()
+        self._digests = {}
+
+    def resolve(self, key):
+        """ Return the input object with the given key
+        """
+        return self.reader.getObject(IndirectObject(key[0], key[1],
+                                                    self.reader))
+
+    def digest(self, key, stack=None):
+        """ Return the digest of the contents of an object and everything it
+        references, or None if it can not be shared: it reaches a page, an
+        annotation, a form field, the document structure or itself.
+        """
+
+        if key in self._digests:
+            return self._digests[key]
+
+        stack = stack if stack is not None else set()
+        if key in stack:
+            return None
+
+        obj = self.resolve(key)
+        digest = None
+        if not (isinstance(obj, DictionaryObject) and
+                (obj.get('/Type') in EXCLUDED_TYPES + ('/Page', '/Annot') or
+                 '/FT' in obj or obj.get('/Subtype') == '/Widget')):
+            stack.add(key)
+            try:
+                digest = hashlib.sha1(self._canonical(obj, stack)).digest()
+            except _Unshareable:
+                pass
+            stack.discard(key)
+
+        self._digests[key] = digest
+        return digest
+
+    def page_digest(self, page):
+        """ Return the hex digest of the attributes of a page which change
+        the way it looks, see page_digests.
+        """
+
+        value = DictionaryObject()
+        for key in APPEARANCE:
+            if key in page:
+                value[NameObject(key)] = page.raw_get(key)
+
+        try:
+            return hashlib.sha1(self._canonical(value, set())).hexdigest()
+        except _Unshareable:
+            return None
+
+    def _canonical(self, value, stack):
+        """ Return a byte string which is equal for equal objects, referenced
+        objects are represented by their digests.
+        """
+
+        if isinstance(value, IndirectObject):
+            digest = self.digest(_key(value), stack)
+            if digest is None:
+                raise _Unshareable()
+            return b'R' + digest
+
+        if isinstance(value, DictionaryObject):
+            items = sorted([(key, self._canonical(item, stack))
+                            for key, item in value.items()])
+            data = b'<' + b''.join([b'%s %s\0' % (key, item)
+                                    for key, item in items]) + b'>'
+            if isinstance(value, StreamObject):
+                data += b'S' + hashlib.sha1(value._data).digest()
+            return data
+
+        if isinstance(value, ArrayObject):
+            return b'[' + b''.join([self._canonical(item, stack) + b'\0'
+                                    for item in value]) + b']'
+
+        buf = io.BytesIO()
+        if value is None:
+            value = NullObject()
+        value.writeToStream(buf, None)
+        return value.__class__.__name__.encode('ascii') + b':' + \
+            buf.getvalue()
+
+
+class _Unshareable(Exception):
+    """ Raised while an object digest is computed if it can not be shared
+    """
+
+
+def _key(ref):
+    """ Return the key of an indirect reference in the object mappings
+    """
+    return (ref.idnum, ref.generation)
+
+
+def _is_page(obj):
+    """ Check if an input object is a page
+    """
+    return isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Page'
+
+
+def _links_kept(annots, source):
+    """ Return the annotations of a page without the links to pages which
+    are not copied, annots is the value of its /Annots entry.
+    """
+
+    if isinstance(annots, IndirectObject):
+        annots = source.resolve(_key(annots))
+    if not isinstance(annots, ArrayObject):
+        return annots
+
+    result = ArrayObject()
+    for ref in annots:
+        annot = source.resolve(_key(ref)) \
+            if isinstance(ref, IndirectObject) else ref
+
+        dest = None
+        if isinstance(annot, DictionaryObject):
+            dest = annot.get('/Dest')
+            action = annot.get('/A')
+            if dest is None and isinstance(action, DictionaryObject) and \
+                    action.get('/S') == '/GoTo':
+                dest = action.get('/D')
+
+        page = dest[0] if isinstance(dest, ArrayObject) and dest else None
+        if isinstance(page, IndirectObject) and \
+                _key(page) not in source.pages and \
+                _is_page(source.resolve(_key(page))):
+            continue
+
+        result.append(ref)
+
+    return result
+
+
+def _bookmarks(outlines, copied):
+    """ Return the bookmarks of an input as (title, destination, children)
+    tuples pointing to the new page numbers, copied maps the input ids of
+    the pages which have been copied to their numbers. Bookmarks to other
+    pages are left out, their children take their place.
+    """
+
+    result = []
+    for item in outlines:
+        if isinstance(item, list):
+            children = _bookmarks(item, copied)
+            if result and result[-1][1] is not None:
+                result[-1][2].extend(children)
+            else:
+                result.extend(children)
+            continue
+
+        page = item.raw_get('/Page') if '/Page' in item else None
+        if not isinstance(page, IndirectObject) or \
+                _key(page) not in copied:
+            result.append((item.title, None, []))
+            continue
+
+        dest = item.getDestArray()
+        dest[0] = IndirectObject(copied[_key(page)], 0, None)
+        result.append((item.title, dest, []))
+
+    # Bookmarks without destination are replaced by their children
+    flat = []
+    for title, dest, children in result:
+        if dest is None:
+            flat.extend(children)
+        else:
+            flat.append((title, dest, children))
+
+    return flat
+
+
+def _heading_bookmarks(headings, first):
+    """ Return the bookmarks of the headings of an input, nested by their
+    level, first maps the positions of the copied pages to their numbers.
+    Headings of pages which have not been copied are left out, the others
+    follow the new order of the pages.
+    """
+
+    headings = sorted([item for item in headings if item[0] in first],
+                      key=lambda item: first[item[0]])
+
+    result, parents = [], {}
+    for index, level, top, title in headings:
+
+        dest = ArrayObject([IndirectObject(first[index], 0, None),
+                            NameObject('/XYZ'), NullObject(),
+                            NumberObject(int(round(top))), NullObject()])
+        item = (title, dest, [])
+
+        parent = max([number for number in parents if number < level] or
+                     [None])
+        (parents[parent][2] if parent is not None else result).append(item)
+
+        parents[level] = item
+        for number in list(parents):
+            if number > level:
+                del parents[number]
+
+    return result
+
+
+def _file_title(reader, path):
+    """ Return the title of an input, or its file name when it has none or
+    it is a placeholder, see PLACEHOLDER_TITLE
+    """
+
+    try:
+        title = reader.getDocumentInfo().title
+    except Exception:
+        title = None
+
+    if isinstance(title, bytes):
+        title = title.decode('utf-8', 'ignore')
+
+    if isinstance(title, unicode) and \
+            not PLACEHOLDER_TITLE.search(title.strip()):
+        return title.strip()
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name if isinstance(name, unicode) else \
+        name.decode('utf-8', 'ignore')
+
+
+def _file_id(path):
+    """ Return a file identifier for the trailer
+    """
+
+    digest = hashlib.md5(('%s %f' % (path, time.time())).encode('utf-8'))
+    return ByteStringObject(digest.digest())
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" PDF optimization. A document is written again with only the objects its
+catalog reaches and new object numbers: the contents of each page are joined
+in one stream, content streams and forms are compressed again with Flate at
+the given level, the objects which are not streams are packed in compressed
+object streams and the cross reference table is a compressed stream too, so
+the file is smaller and readers parse fewer and shorter objects to open it.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import collections
+import io
+import os
+import zlib
+
+from PyPDF2.filters import decodeStreamData
+from PyPDF2.generic import (ArrayObject, DictionaryObject,
+                            EncodedStreamObject, IndirectObject, NameObject,
+                            NullObject, NumberObject, StreamObject)
+
+from lib.pdfreader import MappedReader
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+
+DEFAULT_LEVEL = 6
+
+# Objects packed in each object stream
+OBJECTS_PER_STREAM = 100
+
+FLATE = NameObject('/FlateDecode')
+
+# Keys of a stream dictionary which depend on its data
+STREAM_KEYS = ('/Length', '/Filter', '/DecodeParms', '/DL')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def optimize_pdf(path, new_path, level=DEFAULT_LEVEL):
+    """ Write an optimized copy of the PDF in path to new_path, which can be
+    path itself, level is the zlib compression level from 1 to 9. It returns
+    the size in bytes of the input and of the output.
+    """
+
+    size = os.path.getsize(path)
+    tmppath = new_path + '.tmp'
+
+    try:
+        with MappedReader(path) as reader:
+            if reader.isEncrypted:
+                raise ValueError(u'Encrypted files can not be optimized')
+
+            with open(tmppath, 'wb') as fout:
+                fout.write(HEADER)
+                _Optimizer(reader, fout, level).run()
+
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.rename(tmppath, new_path)
+
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return size, os.path.getsize(new_path)
+
+
+# ---------------------------- OPTIMIZER CLASS --------------------------------
+
+
+class _Optimizer(object):
+    """ Copies the objects reached from the trailer of a reader to fout, the
+    streams as soon as they are read and the other objects packed in object
+    streams at the end, followed by the cross reference stream.
+    """
+
+    def __init__(self, reader, fout, level):
+        self._reader = reader
+        self._fout = fout
+        self._level = level
+
+        self._next = 1
+        self._mapping = {}    # (number, generation) of the input: number
+        self._contents = {}   # keys of the contents of a page: number
+        self._pending = collections.deque()
+        self._packed = []     # (number, bytes) of the objects not written
+        self._entries = {0: (0, 0, 65535)}
+
+    def run(self):
+        """ Copy the whole document
+        """
+
+        trailer = DictionaryObject()
+        for key in ('/Root', '/Info', '/ID'):
+            if key in self._reader.trailer:
+                trailer[NameObject(key)] = self._remap(
+                    self._reader.trailer.raw_get(key))
+
+        # STEP 1: Streams are written as they are found
+        while self._pending:
+            self._copy(*self._pending.popleft())
+
+        # STEP 2: Object streams and the cross reference stream
+        self._write_packed()
+        self._write_xref(trailer)
+
+    # ----------------------------- OBJECT COPY -------------------------------
+
+    def _allocate(self):
+        """ Return a new object number
+        """
+
+        number = self._next
+        self._next += 1
+        return number
+
+    def _copy(self, number, keys, contents):
+        """ Copy one input object, or join the content streams of a page when
+        contents is True.
+        """
+
+        if contents:
+            stream = EncodedStreamObject()
+            stream._data = zlib.compress(b'\n'.join( #pylint: disable=W0212
+                [bytes(_decoded(self._resolve(key))) for key in keys]),
+                                         self._level)
+            stream[NameObject('/Filter')] = FLATE
+            self._write(number, stream)
+            return
+
+        obj = self._resolve(keys[0])
+
+        if isinstance(obj, StreamObject):
+            self._write(number, self._stream(obj))
+        else:
+            buf = io.BytesIO()
+            self._remap(obj).writeToStream(buf, None)
+            self._packed.append((number, buf.getvalue()))
+
+    def _resolve(self, key):
+        """ Return the input object with the given key, broken objects are
+        null as readers take them.
+        """
+
+        try:
+            obj = self._reader.getObject(IndirectObject(key[0], key[1],
+                                                        self._reader))
+        except Exception:
+            obj = None
+
+        return NullObject() if obj is None else obj
+
+    def _remap(self, value):
+        """ Return a copy of value whose indirect references point to the new
+        object numbers, objects which have not been seen yet get a number and
+        are queued to be copied.
+        """
+
+        if isinstance(value, IndirectObject):
+            key = (value.idnum, value.generation)
+            if key not in self._mapping:
+                self._mapping[key] = self._allocate()
+                self._pending.append((self._mapping[key], (key,), False))
+            return IndirectObject(self._mapping[key], 0, None)
+
+        if isinstance(value, ArrayObject):
+            return ArrayObject([self._remap(item) for item in value])
+
+        if not isinstance(value, DictionaryObject):
+            return NullObject() if value is None else value
+
+        result = DictionaryObject()
+        for key, item in value.items():
+            if key == '/Contents' and value.get('/Type') == '/Page':
+                result[NameObject(key)] = self._page_contents(item)
+            else:
+                result[NameObject(key)] = self._remap(item)
+
+        return result
+
+    def _page_contents(self, value):
+        """ Return the reference to the stream joining the contents of a
+        page, pages with the same contents share it.
+        """
+
+        items = value.getObject() if isinstance(value, IndirectObject) \
+            else value
+        if not isinstance(items, ArrayObject):
+            items = [value]
+
+        keys = tuple([(item.idnum, item.generation) for item in items
+                      if isinstance(item, IndirectObject)])
+        if not keys:
+            return self._remap(value)
+
+        if keys not in self._contents:
+            self._contents[keys] = self._allocate()
+            self._pending.append((self._contents[keys], keys, True))
+
+        return IndirectObject(self._contents[keys], 0, None)
+
+    def _stream(self, obj):
+        """ Return the copy of a stream, forms are compressed again and
+        other streams without filters are compressed, unless that makes them
+        larger. XMP metadata is left readable.
+        """
+
+        result = EncodedStreamObject()
+        for key, item in obj.items():
+            if key != '/Length':
+                result[NameObject(key)] = self._remap(item)
+        result._data = obj._data #pylint: disable=W0212
+
+        if obj.get('/Subtype') == '/Form':
+            try:
+                data = _decoded(obj)
+            except Exception:
+                return result # Unknown filters are left as they are
+        elif '/Filter' not in obj and obj.get('/Type') != '/Metadata':
+            data = obj._data #pylint: disable=W0212
+        else:
+            return result
+
+        data = zlib.compress(data, self._level)
+        if len(data) < len(obj._data): #pylint: disable=W0212
+            for key in STREAM_KEYS:
+                if key in result:
+                    del result[key]
+            result[NameObject('/Filter')] = FLATE
+            result._data = data #pylint: disable=W0212
+
+        return result
+
+    # ------------------------------- WRITING ---------------------------------
+
+    def _write(self, number, obj):
+        """ Write an indirect object with the given number
+        """
+
+        self._entries[number] = (1, self._fout.tell(), 0)
+        self._fout.write(b'%d 0 obj\n' % number)
+        obj.writeToStream(self._fout, None)
+        self._fout.write(b'\nendobj\n')
+
+    def _write_packed(self):
+        """ Write the objects which are not streams in object streams
+        """
+
+        for begin in range(0, len(self._packed), OBJECTS_PER_STREAM):
+            chunk = self._packed[begin:begin + OBJECTS_PER_STREAM]
+            number = self._allocate()
+
+            index, position = [], 0
+            for item, (packed, data) in enumerate(chunk):
+                index.append(b'%d %d' % (packed, position))
+                position += len(data) + 1
+                self._entries[packed] = (2, number, item)
+
+            head = b' '.join(index) + b'\n'
+
+            stream = EncodedStreamObject()
+            stream._data = zlib.compress( #pylint: disable=W0212
+                head + b'\n'.join([data for _, data in chunk]), self._level)
+            stream.update({
+                NameObject('/Type'): NameObject('/ObjStm'),
+                NameObject('/N'): NumberObject(len(chunk)),
+                NameObject('/First'): NumberObject(len(head)),
+                NameObject('/Filter'): FLATE
+            })
+            self._write(number, stream)
+
+        self._packed = []
+
+    def _write_xref(self, trailer):
+        """ Write the cross reference stream, it holds the trailer too
+        """
+
+        number = self._allocate()
+        start = self._fout.tell()
+        self._entries[number] = (1, start, 0)
+
+        # Offsets and object stream numbers share the second field
+        width = max(_width(start), _width(number))
+        rows = []
+        for item in range(self._next):
+            kind, field, extra = self._entries.get(item, (0, 0, 0))
+            rows.append(chr(kind) + _pack(field, width) + _pack(extra, 2))
+
+        stream = EncodedStreamObject()
+        stream._data = zlib.compress(b''.join(rows), #pylint: disable=W0212
+                                     self._level)
+        stream.update(trailer)
+        stream.update({
+            NameObject('/Type'): NameObject('/XRef'),
+            NameObject('/Size'): NumberObject(self._next),
+            NameObject('/W'): ArrayObject([NumberObject(1),
+                                           NumberObject(width),
+                                           NumberObject(2)]),
+            NameObject('/Filter'): FLATE
+        })
+        self._write(number, stream)
+
+        self._fout.write(b'startxref\n%d\n%%%%EOF\n' % start)
+
+
+def _decoded(stream):
+    """ Return the decoded data of a stream, it is not kept by the reader
+    """
+
+    if '/Filter' not in stream:
+        return stream._data #pylint: disable=W0212
+    return decodeStreamData(stream)
+
+
+def _width(value):
+    """ Return the number of bytes needed to write value
+    """
+
+    width = 1
+    while value >= 1 << (8 * width):
+        width += 1
+    return width
+
+
+def _pack(value, width):
+    """ Return value as a big endian number of width bytes
+    """
+
+    return b''.join([chr((value >> (8 * shift)) & 0xff)
+                     for shift in reversed(range(width))])
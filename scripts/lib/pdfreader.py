@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Memory mapped PDF reader used by the PDF scripts. The file is mapped
+instead of read through a buffered file, the cross reference table or stream
+is parsed when the reader is created and every object is parsed only when it
+is dereferenced. The data of the streams is not copied: it is a read-only
+buffer over the mapped file, which can be written to the output, hashed or
+inflated without decoding or copying it first.
+
+The buffers are only valid while the reader is open, so every object must be
+written, or copied, before it is closed.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import mmap
+import os
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.pdf import PageObject
+from PyPDF2.generic import NameObject
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Reads longer than this are stream data, PyPDF2 reads at most 20 bytes at
+# once for anything else
+VIEW_SIZE = 32
+
+# Page attributes which can be given by the nodes of the page tree
+INHERITABLE = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+# ----------------------------- READER CLASS ----------------------------------
+
+
+class MappedReader(PdfFileReader):
+    """ PdfFileReader over a memory mapped file, it must be closed, or used
+    as a context manager, to release the file.
+    """
+
+    def __init__(self, path, strict=False):
+        self._file = open(path, 'rb')
+
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            self._file.close()
+            raise ValueError(u'{} is empty or can not be mapped'.format(
+                os.path.basename(path)))
+
+        try:
+            PdfFileReader.__init__(self, MappedStream(self._map),
+                                   strict=strict)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def page_count(self):
+        """ Return the number of pages, as the root of the page tree says
+        """
+        return int(self.trailer['/Root']['/Pages']['/Count'])
+
+    def page(self, index):
+        """ Return the page in the given position, counting from 0. Unlike
+        getPage, only the nodes of the page tree in the way to the page are
+        parsed, and none of them when the kids of a node are all pages.
+        """
+
+        if not 0 <= index < self.page_count():
+            raise IndexError(u'There is no page {}'.format(index + 1))
+
+        ref = self.trailer['/Root'].raw_get('/Pages')
+        node, inherited = ref.getObject(), {}
+
+        while node.get('/Type') != '/Page':
+            for attr in INHERITABLE:
+                if attr in node:
+                    inherited[attr] = node.raw_get(attr)
+
+            kids = node['/Kids']
+
+            # A node with as many kids as pages has only pages
+            if int(node['/Count']) == len(kids) and \
+                    kids[index].getObject().get('/Type') == '/Page':
+                ref, node = kids[index], kids[index].getObject()
+                break
+
+            for kid in kids:
+                obj = kid.getObject()
+                count = int(obj['/Count']) if obj.get('/Type') == '/Pages' \
+                    else 1
+                if index < count:
+                    ref, node = kid, obj
+                    break
+                index -= count
+            else:
+                raise IndexError(u'The page tree is broken')
+
+        page = PageObject(self, ref)
+        page.update(node)
+        for attr, value in inherited.items():
+            if attr not in page:
+                page[NameObject(attr)] = value
+
+        return page
+
+    def close(self):
+        """ Unmap and close the file, the stream data of the objects read is
+        no longer available.
+        """
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class MappedStream(object):
+    """ Read-only file interface over a memory map, long reads return a
+    buffer over the map instead of a copy. The other methods are those of
+    the map itself, so the many short reads of the parser run in C.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._read = data.read
+        self.readline = data.readline
+        self.seek = data.seek
+        self.tell = data.tell
+
+    def read(self, size=-1):
+        """ Read up to size bytes, or until the end when size is negative
+        """
+
+        if 0 <= size <= VIEW_SIZE:
+            return self._read(size)
+
+        start = self._data.tell()
+        end = len(self._data) if size < 0 else \
+            min(len(self._data), start + size)
+        self._data.seek(end)
+
+        return buffer(self._data, start, end - start)
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" Headings of PDF documents. The content stream of each page is read once,
+only following the text operators and the matrices which change the size of
+the text, so the lines of each page are found with their font size and
+position. Lines whose size is clearly bigger than the size of most of the
+text of the document are its headings, the biggest ones at the first level.
+The headings of a file can be kept in a cache, keyed on its contents.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import collections
+import json
+import math
+import re
+import unicodedata
+
+from PyPDF2.filters import decodeStreamData
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+from lib.cache import ConversionCache
+from lib.pdfreader import MappedReader
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Changes in the way headings are found must change this, cached headings
+# found with other versions are not used
+VERSION = '1'
+
+# Lines this times bigger than the body text are headings
+HEADING_RATIO = 1.2
+
+# Heading levels, the biggest sizes are the first level
+MAX_LEVELS = 2
+
+# Longest heading, longer lines are text written with a big font
+MAX_LENGTH = 120
+
+# Lines repeated in more pages than this fraction are running headers
+MAX_REPEATED = 0.25
+
+# Adjustments of a TJ array, in thousandths of em, wider than a space
+SPACE_WIDTH = -250
+
+# Blanks and comments are skipped before each token
+TOKEN = re.compile(br'''
+    (?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*
+    (?:(?P<string>\()
+  | (?P<hex><[0-9A-Fa-f\x00\t\n\x0c\r ]*>)
+  | (?P<open><<|\[)
+  | (?P<close>>>|\])
+  | (?P<name>/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)
+  | (?P<number>[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))
+  | (?P<operator>[^\x00\t\n\x0c\r ()<>\[\]{}/%]+)
+  | (?P<other>.))?
+''', re.X | re.S)
+
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+# Codecs of the base encodings of simple fonts
+ENCODINGS = {'/WinAnsiEncoding': 'cp1252', '/MacRomanEncoding': 'mac_roman'}
+
+# Names of the glyphs of /Differences which are not a letter or a uniXXXX
+GLYPHS = {
+    'space': u' ', 'hyphen': u'-', 'period': u'.', 'comma': u',',
+    'colon': u':', 'semicolon': u';', 'exclam': u'!', 'question': u'?',
+    'quoteright': u'’', 'quoteleft': u'‘', 'parenleft': u'(',
+    'parenright': u')', 'endash': u'–', 'emdash': u'—',
+    'zero': u'0', 'one': u'1', 'two': u'2', 'three': u'3', 'four': u'4',
+    'five': u'5', 'six': u'6', 'seven': u'7', 'eight': u'8', 'nine': u'9',
+}
+
+ACCENTS = ('acute', 'grave', 'circumflex', 'dieresis', 'tilde', 'cedilla',
+           'ring')
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def find_headings(path, cache=None):
+    """ Return the headings of the PDF in path as (index, level, top, title)
+    tuples, index counts the pages from 0 and top is the position of the top
+    of the heading in its page. The result is kept in cache, a
+    ConversionCache, when it is given.
+    """
+
+    key = None
+    if cache is not None:
+        key = ConversionCache.key(path, 'headings', VERSION)
+        data = cache.fetch_data(key)
+        if data is not None:
+            return [tuple(item) for item in json.loads(data)]
+
+    lines = []
+    with MappedReader(path) as reader:
+        pages = reader.page_count()
+        fonts = {}
+        for index in range(pages):
+            lines.extend([(index,) + line for line in
+                          page_lines(reader.page(index), fonts)])
+
+    headings = _headings(lines, pages)
+
+    if cache is not None:
+        cache.store_data(key, json.dumps(headings))
+
+    return headings
+
+
+def page_lines(page, fonts=None):
+    """ Return the lines of text of a page as (size, top, text) tuples, in
+    the order they are drawn. Text of fonts which can not be decoded is left
+    out. fonts keeps the decoders of the fonts already seen, it can be shared
+    by the pages of a document.
+    """
+
+    fonts = fonts if fonts is not None else {}
+    resources = page['/Resources'] if '/Resources' in page \
+        else DictionaryObject()
+    resources = resources.getObject()
+    font_refs = resources['/Font'] if '/Font' in resources \
+        else DictionaryObject()
+
+    contents = page.raw_get('/Contents') if '/Contents' in page else None
+    contents = contents.getObject() if contents is not None else None
+    if contents is None:
+        return []
+    if not isinstance(contents, ArrayObject):
+        contents = [contents]
+
+    try:
+        data = b'\n'.join([bytes(_decoded(item.getObject()))
+                           for item in contents])
+    except Exception:
+        return [] # Unknown filters
+
+    return _TextState(font_refs, fonts).run(data)
+
+
+# ----------------------------- TEXT STATE ------------------------------------
+
+
+class _TextState(object):
+    """ Follows the text operators of a content stream joining the strings
+    shown on the same line.
+    """
+
+    def __init__(self, font_refs, fonts):
+        self._font_refs = font_refs
+        self._fonts = fonts
+
+        self._ctm = IDENTITY
+        self._stack = []
+        self._tm = IDENTITY
+        self._tlm = IDENTITY
+        self._leading = 0.0
+        self._font = None
+        self._font_size = 0.0
+
+        self._lines = []
+        self._line = None    # [size, baseline, pieces]
+        self._moved = True
+
+    def run(self, data):
+        """ Return the lines of the given content stream
+        """
+
+        for operator, operands in _operations(data):
+            method = OPERATORS.get(operator)
+            if method is not None:
+                try:
+                    method(self, operands)
+                except (IndexError, TypeError, ValueError,
+                        ZeroDivisionError):
+                    pass # Wrong operands are ignored, as readers do
+
+        self._end_line()
+        return self._lines
+
+    # ------------------------- GRAPHICS AND TEXT -----------------------------
+
+    def _save(self, _):
+        self._stack.append(self._ctm)
+
+    def _restore(self, _):
+        if self._stack:
+            self._ctm = self._stack.pop()
+
+    def _concat(self, operands):
+        self._ctm = _multiply(_matrix(operands), self._ctm)
+
+    def _begin(self, _):
+        self._tm = self._tlm = IDENTITY
+        self._moved = True
+
+    def _set_font(self, operands):
+        self._font = self._decoder(operands[-2])
+        self._font_size = float(operands[-1])
+
+    def _set_leading(self, operands):
+        self._leading = float(operands[-1])
+
+    def _move(self, operands):
+        tx, ty = float(operands[-2]), float(operands[-1])
+        self._tlm = self._tm = _multiply((1.0, 0.0, 0.0, 1.0, tx, ty),
+                                         self._tlm)
+        self._moved = True
+
+    def _move_leading(self, operands):
+        self._leading = -float(operands[-1])
+        self._move(operands)
+
+    def _set_matrix(self, operands):
+        self._tlm = self._tm = _matrix(operands)
+        self._moved = True
+
+    def _next_line(self, _):
+        self._move([0.0, -self._leading])
+
+    def _show(self, operands):
+        self._add(self._text(operands[-1]))
+
+    def _next_show(self, operands):
+        self._next_line(operands)
+        self._show(operands)
+
+    def _show_array(self, operands):
+        pieces = []
+        for item in operands[-1]:
+            if isinstance(item, float):
+                if item < SPACE_WIDTH:
+                    pieces.append(u' ')
+            else:
+                pieces.append(self._text(item))
+
+        if None not in pieces:
+            self._add(u''.join(pieces))
+
+    # -------------------------------- LINES ----------------------------------
+
+    def _text(self, data):
+        """ Return a string shown with the current font as unicode text, or
+        None if the font can not be decoded.
+        """
+
+        if self._font is None or not isinstance(data, bytes):
+            return None
+        return self._font(data)
+
+    def _add(self, text):
+        """ Add text to the current line, or start a new line when the size
+        or the baseline of the text are not the ones of the line.
+        """
+
+        if not text:
+            return
+
+        matrix = _multiply(self._tm, self._ctm)
+        size = round(abs(self._font_size) * math.hypot(matrix[2], matrix[3]),
+                     1)
+        baseline = matrix[5]
+
+        line = self._line
+        if line is not None and abs(line[0] - size) < 0.5 and \
+                abs(line[1] - baseline) < size * 0.5:
+            if self._moved and not line[2][-1].endswith(u' ') and \
+                    not text.startswith(u' '):
+                line[2].append(u' ')
+            line[2].append(text)
+        else:
+            self._end_line()
+            self._line = [size, baseline, [text]]
+
+        self._moved = False
+
+    def _end_line(self):
+        """ Keep the current line, if it has some text
+        """
+
+        if self._line is not None:
+            size, baseline, pieces = self._line
+            text = u' '.join(u''.join(pieces).split())
+            if text and size > 0:
+                self._lines.append((size, baseline + size, text))
+        self._line = None
+
+    def _decoder(self, name):
+        """ Return the function decoding the strings of the font with the
+        given name in the resources, or None when it is unknown.
+        """
+
+        if name not in self._font_refs:
+            return None
+
+        ref = self._font_refs.raw_get(name)
+        key = (ref.idnum, ref.generation) if isinstance(ref, IndirectObject) \
+            else id(ref)
+        if key not in self._fonts:
+            try:
+                self._fonts[key] = _font_decoder(ref.getObject())
+            except Exception:
+                self._fonts[key] = None
+
+        return self._fonts[key]
+
+
+OPERATORS = {
+    b'q': _TextState._save, #pylint: disable=W0212
+    b'Q': _TextState._restore, #pylint: disable=W0212
+    b'cm': _TextState._concat, #pylint: disable=W0212
+    b'BT': _TextState._begin, #pylint: disable=W0212
+    b'Tf': _TextState._set_font, #pylint: disable=W0212
+    b'TL': _TextState._set_leading, #pylint: disable=W0212
+    b'Td': _TextState._move, #pylint: disable=W0212
+    b'TD': _TextState._move_leading, #pylint: disable=W0212
+    b'Tm': _TextState._set_matrix, #pylint: disable=W0212
+    b'T*': _TextState._next_line, #pylint: disable=W0212
+    b'Tj': _TextState._show, #pylint: disable=W0212
+    b"'": _TextState._next_show, #pylint: disable=W0212
+    b'"': _TextState._next_show, #pylint: disable=W0212
+    b'TJ': _TextState._show_array, #pylint: disable=W0212
+}
+
+
+# ---------------------------- CONTENT STREAMS --------------------------------
+
+
+def _operations(data):
+    """ Yield the (operator, operands) of a content stream, strings are
+    bytes, numbers are floats, names are strings starting with a slash and
+    arrays are lists. Inline images are skipped.
+    """
+
+    operands, stack = [], []
+    pos, end = 0, len(data)
+
+    while pos < end:
+        match = TOKEN.match(data, pos)
+        kind = match.lastgroup
+        value = match.group(kind) if kind else None
+        pos = match.end()
+
+        if kind is None:
+            break
+        elif kind == 'other':
+            continue
+        elif kind == 'string':
+            value, pos = _literal(data, pos)
+        elif kind == 'hex':
+            value = _hex(value[1:-1])
+        elif kind == 'number':
+            value = float(value)
+        elif kind == 'open':
+            stack.append(operands)
+            operands = []
+            continue
+        elif kind == 'close':
+            value = operands
+            operands = stack.pop() if stack else []
+        elif kind == 'operator':
+            if stack:
+                continue # Operators are not allowed in arrays
+            if value == b'ID':
+                pos = _image_end(data, pos)
+            else:
+                yield value, operands
+            operands = []
+            continue
+
+        operands.append(value)
+
+
+def _literal(data, pos):
+    """ Return the literal string starting at pos, after its opening
+    parenthesis, and the position after it.
+    """
+
+    # Most strings have no escapes nor nested parentheses
+    end = data.find(b')', pos)
+    if end >= 0:
+        value = data[pos:end]
+        if b'\\' not in value and b'(' not in value:
+            return value, end + 1
+
+    result, depth = [], 1
+    while pos < len(data):
+        char = data[pos]
+        pos += 1
+
+        if char == b'\\':
+            char = data[pos:pos + 1]
+            pos += 1
+            if char in ESCAPES:
+                result.append(ESCAPES[char])
+            elif char.isdigit():
+                digits = re.match(br'[0-7]{1,3}', data[pos - 1:pos + 2])
+                if digits:
+                    result.append(chr(int(digits.group(), 8) & 0xff))
+                    pos += len(digits.group()) - 1
+            elif char in (b'\r', b'\n'):
+                if char == b'\r' and data[pos:pos + 1] == b'\n':
+                    pos += 1
+            else:
+                result.append(char)
+            continue
+
+        if char == b'(':
+            depth += 1
+        elif char == b')':
+            depth -= 1
+            if not depth:
+                break
+        result.append(char)
+
+    return b''.join(result), pos
+
+
+def _hex(text):
+    """ Return the bytes of a hexadecimal string
+    """
+
+    text = re.sub(br'[^0-9A-Fa-f]', b'', text)
+    if len(text) % 2:
+        text += b'0'
+    return text.decode('hex')
+
+
+def _image_end(data, pos):
+    """ Return the position after the EI operator of an inline image whose
+    data starts at pos.
+    """
+
+    while True:
+        found = data.find(b'EI', pos)
+        if found < 0:
+            return len(data)
+        pos = found + 2
+        if data[found - 1:found] in b'\x00\t\n\x0c\r ' and \
+                data[pos:pos + 1] in b'\x00\t\n\x0c\r ':
+            return pos
+
+
+def _matrix(operands):
+    """ Return the matrix given by the last six operands
+    """
+    return tuple([float(value) for value in operands[-6:]])
+
+
+def _multiply(first, second):
+    """ Return the product of two transformation matrices
+    """
+
+    a, b, c, d, e, f = first
+    g, h, i, j, k, l = second
+
+    return (a * g + b * i, a * h + b * j,
+            c * g + d * i, c * h + d * j,
+            e * g + f * i + k, e * h + f * j + l)
+
+
+def _decoded(stream):
+    """ Return the decoded data of a stream, it is not kept by the reader
+    """
+
+    if '/Filter' not in stream:
+        return stream._data #pylint: disable=W0212
+    return decodeStreamData(stream)
+
+
+# --------------------------------- FONTS -------------------------------------
+
+
+def _font_decoder(font):
+    """ Return the function decoding the strings shown with a font, from its
+    /ToUnicode map or from its encoding. Composite fonts without a map can
+    not be decoded, None is returned for them.
+    """
+
+    if '/ToUnicode' in font:
+        cmap = _to_unicode(bytes(_decoded(font['/ToUnicode'])))
+        if cmap is not None:
+            return cmap
+
+    if font.get('/Subtype') == '/Type0':
+        return None
+
+    codec, differences = 'cp1252', {}
+    encoding = font['/Encoding'] if '/Encoding' in font else None
+
+    if isinstance(encoding, DictionaryObject):
+        codec = ENCODINGS.get(encoding.get('/BaseEncoding'), codec)
+        code = 0
+        for item in encoding['/Differences'] \
+                if '/Differences' in encoding else []:
+            item = item.getObject()
+            if isinstance(item, (int, long)):
+                code = int(item)
+            else:
+                char = _glyph(item[1:])
+                if char:
+                    differences[chr(code)] = char
+                code += 1
+    elif encoding is not None:
+        codec = ENCODINGS.get(encoding, codec)
+
+    def _decode(data):
+        """ Decode a string of a simple font
+        """
+
+        if not differences:
+            return data.decode(codec, 'ignore')
+        return u''.join([differences.get(char) or char.decode(codec, 'ignore')
+                         for char in data])
+
+    return _decode
+
+
+def _glyph(name):
+    """ Return the character of a glyph name of /Differences
+    """
+
+    if len(name) == 1:
+        return name.decode('latin-1')
+    if name in GLYPHS:
+        return GLYPHS[name]
+    if re.match(r'^uni[0-9A-F]{4}$', name):
+        return unichr(int(name[3:], 16))
+
+    for accent in ACCENTS:
+        if len(name) == len(accent) + 1 and name.endswith(accent):
+            case = 'CAPITAL' if name[0].isupper() else 'SMALL'
+            try:
+                return unicodedata.lookup('LATIN {} LETTER {} WITH {}'.format(
+                    case, name[0].upper(),
+                    'DIAERESIS' if accent == 'dieresis' else
+                    'RING ABOVE' if accent == 'ring' else accent.upper()))
+            except KeyError:
+                return None
+
+    return None
+
+
+def _to_unicode(data):
+    """ Return the function decoding strings with a /ToUnicode CMap, or None
+    when it has no mappings.
+    """
+
+    width = 1
+    spaces = re.search(br'begincodespacerange\s*<([0-9A-Fa-f]+)>', data)
+    if spaces:
+        width = max(1, len(spaces.group(1)) // 2)
+
+    chars, ranges = {}, []
+
+    for section in re.findall(br'beginbfchar(.*?)endbfchar', data, re.S):
+        for source, target in re.findall(
+                br'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]*)>', section):
+            chars[int(source, 16)] = _utf16(target)
+
+    for section in re.findall(br'beginbfrange(.*?)endbfrange', data, re.S):
+        for low, high, target, targets in re.findall(
+                br'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*'
+                br'(?:<([0-9A-Fa-f]*)>|\[([^\]]*)\])', section):
+            low, high = int(low, 16), int(high, 16)
+            if targets:
+                for code, item in enumerate(re.findall(
+                        br'<([0-9A-Fa-f]*)>', targets)):
+                    chars[low + code] = _utf16(item)
+            else:
+                ranges.append((low, high, _utf16(target)))
+
+    if not chars and not ranges:
+        return None
+
+    def _decode(data):
+        """ Decode a string with the CMap
+        """
+
+        result = []
+        for pos in range(0, len(data) - width + 1, width):
+            code = int(data[pos:pos + width].encode('hex'), 16)
+            if code in chars:
+                result.append(chars[code])
+                continue
+            for low, high, target in ranges:
+                if low <= code <= high and target:
+                    result.append(target[:-1] +
+                                  unichr(ord(target[-1]) + code - low))
+                    break
+
+        return u''.join(result)
+
+    return _decode
+
+
+def _utf16(text):
+    """ Return the text of a hexadecimal UTF-16BE string of a CMap
+    """
+    return _hex(text).decode('utf-16-be', 'ignore')
+
+
+# ------------------------------- HEADINGS ------------------------------------
+
+
+def _headings(lines, pages):
+    """ Return the headings among the lines of a document, given as
+    (index, size, top, text) tuples, as find_headings does.
+    """
+
+    # STEP 1: The size of the body text is the one of most characters
+    sizes = collections.Counter()
+    for _, size, _, text in lines:
+        sizes[round(size * 2) / 2] += len(text)
+    if not sizes:
+        return []
+
+    body = sizes.most_common(1)[0][0]
+
+    # STEP 2: Bigger lines, leaving out running headers and long text
+    candidates = [line for line in lines if line[1] >= body * HEADING_RATIO
+                  and len(line[3]) <= MAX_LENGTH and
+                  re.search(r'[^\W\d_]', line[3], re.U)]
+
+    repeated = collections.defaultdict(set)
+    for index, _, _, text in candidates:
+        repeated[text].add(index)
+    limit = max(2, int(pages * MAX_REPEATED))
+    candidates = [line for line in candidates
+                  if len(repeated[line[3]]) <= limit]
+
+    # STEP 3: Headings written in several lines are joined
+    joined = []
+    for index, size, top, text in candidates:
+        if joined and joined[-1][0] == index and \
+                abs(joined[-1][1] - size) < 0.5 and \
+                0 < joined[-1][4] - top <= size * 1.6:
+            joined[-1][2] += u' ' + text
+            joined[-1][4] = top
+        else:
+            joined.append([index, size, text, top, top])
+
+    levels = sorted(set([round(item[1] * 2) / 2 for item in joined]),
+                    reverse=True)[:MAX_LEVELS]
+
+    return [(index, levels.index(round(size * 2) / 2) + 1,
+             round(first, 1), text)
+            for index, size, text, first, _ in joined
+            if round(size * 2) / 2 in levels]
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" PDF incremental updates. The bytes of the original file are kept as they
+are and only the changed objects are appended, followed by a new cross
+reference section whose trailer points to the previous one, so the time and
+the disk writes needed depend on the changes instead of on the size of the
+file. Updating a file in place only appends to it.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import io
+import os
+import shutil
+
+from PyPDF2.generic import (DictionaryObject, IndirectObject, NameObject,
+                            NumberObject, createStringObject)
+
+from lib.pdfreader import MappedReader
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Bytes read from the end of a file looking for its last startxref
+TAIL_SIZE = 4096
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def startxref(path):
+    """ Return the offset of the last cross reference section of a PDF file
+    """
+
+    with open(path, 'rb') as fin:
+        fin.seek(0, os.SEEK_END)
+        fin.seek(max(0, fin.tell() - TAIL_SIZE))
+        tail = fin.read()
+
+    pos = tail.rfind(b'startxref')
+    if pos < 0:
+        raise ValueError(u'startxref not found in {}'.format(
+            os.path.basename(path)))
+
+    return int(tail[pos + len(b'startxref'):].split()[0])
+
+
+def next_number(reader):
+    """ Return the first object number not used by the PDF of the given
+    reader, files with cross reference streams may have no /Size in
+    their trailer.
+    """
+
+    numbers = [int(reader.trailer.get('/Size', 1)) - 1]
+    numbers.extend(reader.xref_objStm.keys())
+    for items in reader.xref.values():
+        numbers.extend(items.keys())
+
+    return max(numbers) + 1
+
+
+def write_update(path, new_path, objects, trailer):
+    """ Write new_path with the original PDF in path followed by an update
+    with the given objects, (number, generation, bytes) tuples, and trailer,
+    which needs at least /Size and /Root. When new_path is path the update is
+    appended to it, and removed again if it can not be completed. A file with
+    several hard links is copied instead so its other names do not change.
+    """
+
+    trailer = DictionaryObject(trailer)
+    trailer[NameObject('/Prev')] = NumberObject(startxref(path))
+
+    in_place = os.path.abspath(path) == os.path.abspath(new_path) and \
+        os.stat(path).st_nlink <= 1
+    target = new_path if in_place else new_path + '.tmp'
+
+    if not in_place:
+        shutil.copyfile(path, target)
+    size = os.path.getsize(target)
+
+    try:
+        with open(target, 'r+b') as fout:
+            fout.seek(0, os.SEEK_END)
+            fout.write(b'\n')
+
+            offsets = {}
+            for number, generation, data in objects:
+                offsets[number] = (fout.tell(), generation)
+                write_object(fout, number, generation, data)
+
+            write_xref(fout, offsets, trailer, first=False)
+
+        if not in_place:
+            if os.path.exists(new_path):
+                os.remove(new_path)
+            os.rename(target, new_path)
+
+    except BaseException:
+        if in_place:
+            with open(target, 'r+b') as fout:
+                fout.truncate(size)
+        elif os.path.exists(target):
+            os.remove(target)
+        raise
+
+    return new_path
+
+
+def set_info(path, new_path, metadata):
+    """ Write new_path with the document information of the PDF in path
+    changed as an incremental update, metadata is a dictionary like
+    {'/Title': u'...'} and empty values are left as they are.
+    """
+
+    with MappedReader(path) as reader:
+        if reader.isEncrypted:
+            raise ValueError(u'Encrypted files can not be updated')
+
+        trailer = DictionaryObject()
+        for key in ('/Root', '/ID'):
+            if key in reader.trailer:
+                trailer[NameObject(key)] = reader.trailer.raw_get(key)
+
+        info = reader.trailer.raw_get('/Info') \
+            if '/Info' in reader.trailer else None
+        size = next_number(reader)
+
+        data = DictionaryObject(info.getObject()) \
+            if info is not None else DictionaryObject()
+
+    for key, value in metadata.items():
+        if value:
+            data[NameObject(key)] = createStringObject(
+                value if isinstance(value, unicode) else
+                value.decode('utf-8', 'ignore'))
+
+    # The old information dictionary is replaced, or a new one is added
+    if isinstance(info, IndirectObject):
+        number, generation = info.idnum, info.generation
+    else:
+        number, generation = size, 0
+        size += 1
+
+    trailer[NameObject('/Info')] = IndirectObject(number, generation, None)
+    trailer[NameObject('/Size')] = NumberObject(size)
+
+    return write_update(path, new_path,
+                        [(number, generation, serialize(data))], trailer)
+
+
+def serialize(obj):
+    """ Return the bytes of an object without its number
+    """
+
+    buf = io.BytesIO()
+    obj.writeToStream(buf, None)
+    return buf.getvalue()
+
+
+def write_object(fout, number, generation, data):
+    """ Write an indirect object
+    """
+
+    fout.write(b'%d %d obj\n' % (number, generation))
+    fout.write(data)
+    fout.write(b'\nendobj\n')
+
+
+def write_xref(fout, offsets, trailer, first=True):
+    """ Write a cross reference table, with one section for each run of
+    consecutive numbers in offsets, {number: (offset, generation)}, and the
+    trailer. Only the first table of a file has the entry of object 0.
+    """
+
+    start = fout.tell()
+    fout.write(b'xref\n')
+    if first:
+        fout.write(b'0 1\n0000000000 65535 f \n')
+
+    numbers = sorted(offsets)
+    begin = 0
+    while begin < len(numbers):
+        end = begin
+        while end + 1 < len(numbers) and \
+                numbers[end + 1] == numbers[end] + 1:
+            end += 1
+
+        fout.write(b'%d %d\n' % (numbers[begin], end - begin + 1))
+        for number in numbers[begin:end + 1]:
+            offset, generation = offsets[number]
+            fout.write(b'%010d %05d n \n' % (offset, generation))
+        begin = end + 1
+
+    fout.write(b'trailer\n')
+    trailer.writeToStream(fout, None)
+    fout.write(b'\nstartxref\n%d\n%%%%EOF\n' % start)
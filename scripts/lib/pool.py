@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" Runs several converters in parallel, each one in its own process and with
+its own user profile folder. The parent process keeps the queue of pending
+files and feeds the idle workers, a worker whose converter crashes or hangs
+is killed and replaced by a new one, so a bad document only fails itself.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import collections
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from lib.converters import new_converter
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Times a worker can fail to start its converter before giving up
+MAX_START_FAILURES = 3
+
+
+# ---------------------------- WORKER FUNCTION --------------------------------
+
+
+def _worker(wid, backend, kind, profile, tasks, results):
+    """ Worker process main function, it starts a converter and converts the
+    files received through tasks until it receives None.
+    """
+
+    # STEP 1: Start the converter or notify the error to the parent
+    converter = new_converter(backend, kind, profile=profile)
+    try:
+        converter.start()
+    except Exception as ex:
+        results.put(('failed', wid, None, _message(ex), 0, None))
+        return
+
+    results.put(('ready', wid, converter.pid, None, 0, None))
+
+    # STEP 2: Convert the files until the parent says stop
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            index, abspath, new_path, fmt, options = task
+            started = time.time()
+            error, output, failure = None, None, None
+
+            try:
+                output = converter.convert(abspath, new_path, fmt, **options)
+            except Exception as ex:
+                error = _message(ex)
+                if not converter.is_alive():
+                    failure = _restart(wid, converter, results)
+
+            seconds = time.time() - started
+            results.put(('done', wid, index, error, seconds, output))
+
+            # STEP 3: Without converter the parent launches a new worker
+            if failure:
+                results.put(('failed', wid, None, failure, 0, None))
+                break
+
+    finally:
+        converter.stop()
+
+
+def _restart(wid, converter, results):
+    """ Start again a converter which has died and send its new pid to the
+    parent, which kills it when the worker hangs. Returns the error message
+    when the converter can not be started.
+    """
+
+    converter.stop()
+    try:
+        converter.start()
+    except Exception as ex:
+        return _message(ex)
+
+    results.put(('ready', wid, converter.pid, None, 0, None))
+    return None
+
+
+def _message(ex):
+    """ Return a printable message for the given exception
+    """
+    return unicode(ex) if unicode(ex) else ex.__class__.__name__
+
+
+# ------------------------------ WORKER CLASS ---------------------------------
+
+
+class Worker(object):
+    """ Parent side of a worker process, it knows which task the worker is
+    doing and since when, and how many times in a row its converter has
+    failed to start.
+    """
+
+    def __init__(self, wid, process, tasks, start_failures=0):
+        self.wid = wid
+        self.process = process
+        self.tasks = tasks
+        self.pid = None
+        self.ready = False
+        self.start_failures = start_failures
+        self.task = None
+        self.started = None
+
+    def assign(self, task):
+        """ Send the given task to the worker
+        """
+        self.task = task
+        self.started = time.time()
+        self.tasks.put(task)
+
+    def release(self):
+        """ Mark the worker as idle
+        """
+        self.task = None
+        self.started = None
+
+    def kill(self):
+        """ Kill the worker process and the converter launched by it, the
+        converters which run the application in another process must report
+        its pid, see Converter.pid, otherwise it would be left running
+        """
+
+        if self.pid:
+            try:
+                os.kill(self.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            except OSError:
+                pass
+
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(5)
+
+
+# ------------------------------- POOL CLASS ----------------------------------
+
+
+class ConverterPool(object):
+    """ Pool of converter processes fed from a shared queue of files
+    """
+
+    def __init__(self, backend, kind, jobs, timeout=None):
+        self._backend = backend
+        self._kind = kind
+        self._jobs = max(1, jobs)
+        self._timeout = timeout
+        self._tmpdir = None
+        self._results = None
+        self._workers = {}
+        self._generation = 0
+
+    def run(self, tasks, batch):
+        """ Convert all the given tasks, tuples (abspath, new_path, fmt,
+        options), and record the result of each one in the given batch.
+        """
+
+        pending = collections.deque(enumerate(tasks))
+        remaining = len(tasks)
+
+        self._tmpdir = tempfile.mkdtemp(prefix='convpool-')
+        self._results = multiprocessing.Queue()
+
+        try:
+            for wid in range(min(self._jobs, remaining)):
+                self._spawn(wid)
+
+            while remaining > 0:
+
+                # STEP 1: Feed the idle workers from the shared queue
+                for worker in self._workers.values():
+                    if worker.ready and worker.task is None and pending:
+                        worker.assign(self._task(pending.popleft()))
+
+                # STEP 2: Collect the next result, if any
+                try:
+                    message = self._results.get(True, 0.5)
+                except Empty:
+                    message = None
+
+                if message:
+                    remaining -= self._handle(message, batch, pending)
+
+                # STEP 3: Replace the crashed and the hung workers
+                remaining -= self._check(batch, pending)
+
+        finally:
+            self._shutdown()
+
+        return batch
+
+    @staticmethod
+    def _task(item):
+        """ Return the task will be sent to worker from a pending item
+        """
+        index, (abspath, new_path, fmt, options) = item
+        return (index, abspath, new_path, fmt, options)
+
+    def _spawn(self, wid, start_failures=0):
+        """ Launch a new worker process with its own profile folder
+        """
+
+        self._generation += 1
+        profile = os.path.join(
+            self._tmpdir, 'worker-{}-{}'.format(wid, self._generation))
+
+        sys.stdout.flush() # Forked children must not inherit pending output
+
+        tasks = multiprocessing.Queue()
+        args = (wid, self._backend, self._kind, profile, tasks, self._results)
+        process = multiprocessing.Process(target=_worker, args=args)
+        process.daemon = True
+        process.start()
+
+        self._workers[wid] = Worker(wid, process, tasks, start_failures)
+
+    def _handle(self, message, batch, pending):
+        """ Process a message sent by a worker, returns the number of tasks
+        which have been finished.
+        """
+
+        kind, wid, value, error, seconds, output = message
+        worker = self._workers.get(wid)
+        if worker is None:
+            return 0 # Message from a worker which has been killed
+
+        if kind == 'ready':
+            worker.ready = True
+            worker.pid = value
+            worker.start_failures = 0
+
+        elif kind == 'failed':
+            # The converter could not be launched, this worker stops after
+            # some attempts and the others go on with the pending files
+            worker.process.join(5)
+            if worker.task:
+                pending.appendleft((worker.task[0], worker.task[1:]))
+            if worker.start_failures + 1 < MAX_START_FAILURES:
+                self._spawn(wid, worker.start_failures + 1)
+            else:
+                del self._workers[wid]
+                if not self._workers:
+                    return self._abort(batch, pending, error)
+
+        elif kind == 'done' and worker.task and worker.task[0] == value:
+            batch.append(worker.task[1], error, seconds, output)
+            worker.release()
+            return 1
+
+        return 0
+
+    def _check(self, batch, pending):
+        """ Kill and replace the workers which have died or exceeded the
+        timeout doing its current task. Returns the number of tasks which have
+        been marked as failed.
+        """
+
+        failed = 0
+        now = time.time()
+
+        for wid, worker in list(self._workers.items()):
+            if worker.task is None:
+                # A worker which dies without telling why, before starting its
+                # converter for instance, fails like one which can not start
+                # it. The ones which exit normally have sent their message.
+                if not worker.process.is_alive() and worker.process.exitcode:
+                    failed += self._handle(
+                        ('failed', wid, None, u'converter crashed', 0, None),
+                        batch, pending)
+                continue
+
+            if not worker.process.is_alive():
+                error = u'converter crashed'
+            elif self._timeout and now - worker.started > self._timeout:
+                error = u'converter timed out after {} seconds'.format(
+                    self._timeout)
+            else:
+                continue
+
+            worker.kill()
+            batch.append(worker.task[1], error, now - worker.started)
+            failed += 1
+
+            del self._workers[wid]
+            if pending:
+                self._spawn(wid)
+
+        return failed
+
+    def _abort(self, batch, pending, error):
+        """ Mark all pending tasks as failed
+        """
+
+        aborted = 0
+        while pending:
+            _, (abspath, _, _, _) = pending.popleft()
+            batch.append(abspath, error, 0)
+            aborted += 1
+
+        return aborted
+
+    def _shutdown(self):
+        """ Stop all workers and remove the profile folders
+        """
+
+        for worker in self._workers.values():
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+
+        for worker in self._workers.values():
+            worker.process.join(30)
+            if worker.process.is_alive():
+                worker.kill()
+
+        self._workers = {}
+
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
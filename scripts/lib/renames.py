@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Bulk renames. A plan maps every file to its new name before anything is
+renamed, so it can be shown as a dry run, checked for collisions and written
+to a journal which undoes it later. It is applied in two phases: each file is
+first moved to a temporary name in its own folder and then to its new name,
+so a new name can be the old name of another file of the plan. When a rename
+fails the files already renamed are moved back.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import binascii
+import json
+import os
+import re
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Temporary names of the first phase, unique for each process and file
+TEMPORARY = '.rename-{}-{}.tmp'
+
+DIGITS = re.compile(r'([0-9]+)')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def list_files(folder, regex=None, exclude=None):
+    """ Return the names of the files in folder which match the given
+    compiled regex, in natural order: file2 goes before file10. Folders and
+    the names in exclude are left out. The folder is read just once.
+    """
+
+    exclude = set(exclude or [])
+
+    def _wanted(name):
+        """ Return True when the name is not excluded and matches regex
+        """
+        return name not in exclude and (regex is None or regex.match(name))
+
+    # Without scandir every name which is wanted needs a stat call
+    if scandir is not None:
+        names = [entry.name for entry in scandir(folder)
+                 if _wanted(entry.name) and entry.is_file()]
+    else:
+        names = [name for name in os.listdir(folder) if _wanted(name) and
+                 os.path.isfile(os.path.join(folder, name))]
+
+    return sorted(names, key=natural_key)
+
+
+def walk_tree(folder):
+    """ Return the entries under folder, the folder itself left out, as
+    (depth, dirpath, name, is_dir) tuples: the names in folder have depth 1,
+    the names in its subfolders 2 and so on. Every folder is read just once
+    and links to folders are not followed.
+    """
+
+    result = []
+    pending = [(1, folder)]
+
+    while pending:
+        depth, dirpath = pending.pop()
+
+        if scandir is not None:
+            entries = [(entry.name, entry.is_dir(follow_symlinks=False))
+                       for entry in scandir(dirpath)]
+        else:
+            entries = []
+            for name in os.listdir(dirpath):
+                path = os.path.join(dirpath, name)
+                entries.append((name, os.path.isdir(path) and
+                                not os.path.islink(path)))
+
+        for name, is_dir in entries:
+            result.append((depth, dirpath, name, is_dir))
+            if is_dir:
+                pending.append((depth + 1, os.path.join(dirpath, name)))
+
+    return result
+
+
+def natural_key(name):
+    """ Return the sort key of a name comparing its numbers by their value
+    and the rest of it ignoring case.
+    """
+
+    # Numbers are always in the odd positions of the split name
+    parts = DIGITS.split(name.lower())
+    parts[1::2] = [int(part) for part in parts[1::2]]
+    return parts
+
+
+def read_plan(path):
+    """ Return the plan saved in a journal by RenamePlan.write
+    """
+
+    with open(path, 'rb') as fin:
+        data = json.loads(fin.read().decode('utf-8'))
+
+    return RenamePlan([(_path(old), _path(new))
+                       for old, new in data['renames']])
+
+
+# ------------------------------ PLAN CLASS -----------------------------------
+
+
+class RenamePlan(object):
+    """ Renames of several files, pairs of absolute paths (path, new_path).
+    Files whose new path is the old one are left out.
+    """
+
+    def __init__(self, renames):
+        self._renames = [(old, new) for old, new in renames if old != new]
+
+    @property
+    def renames(self):
+        """ Return the list of (path, new_path) which will be renamed
+        """
+        return self._renames
+
+    def reverse(self):
+        """ Return the plan which undoes this one
+        """
+        return RenamePlan([(new, old)
+                           for old, new in reversed(self._renames)])
+
+    def check(self):
+        """ Raise ValueError when two files would get the same name, or only
+        their case would be different in a system which ignores it, or a file
+        would take the name of a file which is not renamed.
+        """
+
+        sources = set([_absolute(old) for old, _ in self._renames])
+        targets = set()
+        folders = {}
+
+        for old, new in self._renames:
+            target = _absolute(new)
+            dirname = os.path.dirname(target)
+            if dirname not in folders:
+                folders[dirname] = _ignores_case(dirname)
+            if folders[dirname]:
+                target = target.lower()
+
+            if target in targets:
+                raise ValueError(u'Several files would be renamed to {}'
+                                 .format(_unicode(new)))
+            targets.add(target)
+
+            # Names changing only their case are the same file in some systems
+            if os.path.lexists(new) and _absolute(new) not in sources and \
+                    not _same_file(old, new):
+                raise ValueError(u'{} already exists'.format(_unicode(new)))
+
+    def apply(self):
+        """ Rename the files, see the module description
+        """
+
+        self.check()
+
+        moves = []
+        temporary = [os.path.join(os.path.dirname(old),
+                                  TEMPORARY.format(os.getpid(), index))
+                     for index, (old, _) in enumerate(self._renames)]
+
+        try:
+            # STEP 1: Every file leaves its name free
+            for (old, _), tmppath in zip(self._renames, temporary):
+                os.rename(old, tmppath)
+                moves.append((old, tmppath))
+
+            # STEP 2: Every file takes its new name
+            for (_, new), tmppath in zip(self._renames, temporary):
+                os.rename(tmppath, new)
+                moves.append((tmppath, new))
+
+        except BaseException:
+            for old, new in reversed(moves):
+                try:
+                    os.rename(new, old)
+                except OSError:
+                    pass
+            raise
+
+    def write(self, path):
+        """ Save the plan in a JSON journal, see read_plan. Paths are kept as
+        they are, the ones which are not UTF-8 text are written in hex.
+        """
+
+        data = json.dumps({'renames': [(_text(old), _text(new))
+                                       for old, new in self._renames]},
+                          indent=1, ensure_ascii=False)
+
+        tmppath = path + '.tmp'
+        with open(tmppath, 'wb') as fout:
+            fout.write(data.encode('utf-8'))
+
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmppath, path)
+
+
+def _absolute(path):
+    """ Return the path in the case the system uses
+    """
+    return os.path.normcase(path)
+
+
+def _ignores_case(folder):
+    """ Return True when the system which keeps folder ignores the case of
+    the names, it is found looking for the folder, or the first one of its
+    parents with letters in its name, with the case of its name swapped.
+    """
+
+    while True:
+        name = os.path.basename(folder)
+        if name.swapcase() != name:
+            swapped = os.path.join(os.path.dirname(folder), name.swapcase())
+            try:
+                return os.path.samefile(folder, swapped)
+            except (AttributeError, OSError):
+                break
+
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+
+    return os.path.normcase('A') == 'a'
+
+
+def _same_file(path, other):
+    """ Return True when both paths are the same file
+    """
+
+    try:
+        return os.path.samefile(path, other)
+    except (AttributeError, OSError):
+        return _absolute(path).lower() == _absolute(other).lower()
+
+
+def _text(path):
+    """ Return the given path as it is written in a journal, unicode text
+    or {'hex': bytes} when the path is not UTF-8 text.
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    try:
+        return path.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'hex': binascii.hexlify(path).decode('ascii')}
+
+
+def _path(item):
+    """ Return the path written in a journal by _text
+    """
+
+    if isinstance(item, dict):
+        return binascii.unhexlify(item['hex'])
+
+    return item if os.path.supports_unicode_filenames else \
+        item.encode('utf-8')
+
+
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'ignore') if path else u''
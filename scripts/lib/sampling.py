@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Random choice of files in one pass. Files are read one by one from the
+folders and only the k files chosen until then are kept, so memory does not
+grow with the number of files. This needs scandir, from the scandir package
+in Python 2.7, without it the names of each folder are read at once. Each
+file gets a random key, weighted by its size or its age when asked, and the
+k largest keys win: this is reservoir sampling, as Efraimidis and Spirakis
+described it for weighted samples, and every file has the same chance
+without weights.
+
+Files chosen before can be left out keeping their digests in a state file,
+so runs do not repeat files until every one has been chosen.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+SIZE = 'size'
+AGE = 'age'
+WEIGHTS = (SIZE, AGE)
+
+# Length of the digests kept in the state file
+DIGEST_SIZE = 16
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def iter_files(folder, regex=None, recursive=False, with_stat=True):
+    """ Yield (path, stat) for the files in folder whose name matches the
+    given compiled regex, and in its subfolders when recursive is True. stat
+    is None unless with_stat is True. Without scandir the names of each
+    folder are read at once.
+    """
+
+    pending = [folder]
+
+    while pending:
+        dirpath = pending.pop()
+
+        if scandir is not None:
+            for entry in scandir(dirpath):
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file() and \
+                        (regex is None or regex.match(entry.name)):
+                    yield entry.path, entry.stat() if with_stat else None
+            continue
+
+        for name in os.listdir(dirpath):
+            path = os.path.join(dirpath, name)
+            if recursive and os.path.isdir(path) and \
+                    not os.path.islink(path):
+                pending.append(path)
+            elif (regex is None or regex.match(name)) and \
+                    os.path.isfile(path):
+                yield path, os.stat(path) if with_stat else None
+
+
+def sample_files(files, count=1, weight=None, rng=None, exclude=None):
+    """ Return count paths chosen from files, (path, stat) tuples as
+    iter_files yields them, in the order they were found. Larger, or older,
+    files are more likely to be chosen with weight SIZE, or AGE, which need
+    the stat of each file. Paths whose digest is in exclude are never
+    chosen.
+    """
+
+    rng = rng or random.Random()
+    now = time.time()
+    reservoir = []
+
+    for index, (path, stat) in enumerate(files):
+        if exclude and digest(path) in exclude:
+            continue
+
+        if weight == SIZE:
+            value = stat.st_size
+        elif weight == AGE:
+            value = now - stat.st_mtime
+        else:
+            value = 1.0
+
+        # The key u ** (1 / w) compared through its logarithm, files which
+        # weigh nothing are only chosen when there are not enough other
+        # ones, and then the draw alone decides
+        draw = 1.0 - rng.random()
+        key = math.log(draw) / value if value > 0 else float('-inf')
+
+        item = (key, draw, index, path)
+        if len(reservoir) < count:
+            heapq.heappush(reservoir, item)
+        elif item > reservoir[0]:
+            heapq.heapreplace(reservoir, item)
+
+    return [item[3] for item in sorted(reservoir, key=lambda x: x[2])]
+
+
+def digest(path):
+    """ Return the digest kept in the state file for a path
+    """
+
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+
+    return hashlib.sha1(path).hexdigest()[:DIGEST_SIZE]
+
+
+# ------------------------------ STATE CLASS ----------------------------------
+
+
+class ChoiceState(object):
+    """ Digests of the files chosen in previous runs, and of the ones chosen
+    by the last run, kept in a JSON file
+    """
+
+    def __init__(self, path):
+        self._path = os.path.abspath(path)
+        self.chosen = set()
+        self.last = set()
+
+        if os.path.isfile(self._path):
+            with open(self._path, 'rb') as fin:
+                data = json.loads(fin.read().decode('utf-8'))
+
+            # Older state files only have the list of chosen files
+            if isinstance(data, list):
+                data = {'chosen': data}
+            self.chosen = set(data.get('chosen', []))
+            self.last = set(data.get('last', []))
+
+    def add(self, paths):
+        """ Remember the given paths as chosen, and as the ones chosen by the
+        last run
+        """
+        self.last = set([digest(path) for path in paths])
+        self.chosen.update(self.last)
+
+    def reset(self, keep_last=True):
+        """ Forget every file chosen before, except the ones chosen by the
+        last run when keep_last is True so they do not come up again at once
+        """
+        self.chosen = set(self.last) if keep_last else set()
+
+    def save(self):
+        """ Write the state file
+        """
+
+        tmppath = self._path + '.tmp'
+        with open(tmppath, 'wb') as fout:
+            data = {'chosen': sorted(self.chosen), 'last': sorted(self.last)}
+            fout.write(json.dumps(data).encode('utf-8'))
+
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        os.rename(tmppath, self._path)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Exports selected sheets and named ranges of workbooks to PDF. Each part of
+a workbook is exported to its own PDF and the parts are joined copying their
+objects as they are, so the pages are never rendered or compressed twice.
+
+In split mode every sheet of every workbook is a task of its own, so the
+sheets of a large workbook are rendered by all the available converters at
+the same time and joined when the last one of them has finished.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+
+import xml.etree.ElementTree as ElementTree
+
+from lib.batch import Batch, output_path
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+          'relationships')
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+CELL_TAG = re.compile(br'<(?:\w+:)?c[\s>/]')
+
+BLOCK_SIZE = 64 * 1024
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def select_sheets(names, wanted):
+    """ Return the names of the wanted sheets in workbook order, sheets can be
+    given by name or by their position beginning in 1. All the sheets are
+    returned when nothing is wanted.
+    """
+
+    if not wanted:
+        return list(names)
+
+    selected = set()
+    for item in wanted:
+        if item in names:
+            selected.add(item)
+            continue
+
+        matches = [name for name in names if name.lower() == item.lower()]
+        if matches:
+            selected.add(matches[0])
+        elif item.isdigit() and 0 < int(item) <= len(names):
+            selected.add(names[int(item) - 1])
+        else:
+            raise ValueError(u'Sheet {} not found'.format(item))
+
+    return [name for name in names if name in selected]
+
+
+def export_pdf(new_path, names, sheets, ranges, export_sheets, export_range):
+    """ Export the wanted sheets and named ranges of a workbook to new_path.
+    The workbook has the given sheet names and it is exported through the
+    callbacks export_sheets(path, selected), where selected is None to export
+    the whole workbook, and export_range(path, name). When there are several
+    parts they are exported to temporary files which are joined at the end.
+    """
+
+    # STEP 1: The sheets are one part, each named range is another one
+    parts = []
+    if sheets or not ranges:
+        selected = select_sheets(names, sheets) if sheets else None
+        parts.append((export_sheets, selected))
+    for name in ranges or []:
+        parts.append((export_range, name))
+
+    if len(parts) == 1:
+        parts[0][0](new_path, parts[0][1])
+        return new_path
+
+    # STEP 2: Export each part on its own and join them
+    tmpdir = tempfile.mkdtemp(prefix='xls2pdf-')
+    try:
+        paths = []
+        for index, (export, value) in enumerate(parts):
+            paths.append(os.path.join(tmpdir, 'part-{}.pdf'.format(index)))
+            export(paths[-1], value)
+        join_pdfs(paths, new_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return new_path
+
+
+def join_pdfs(paths, new_path):
+    """ Join the given PDF files in new_path, page contents are copied
+    without decoding them.
+    """
+
+    from lib.pdfmerge import merge_pdfs
+    merge_pdfs(paths, new_path, import_bookmarks=False)
+
+
+def workbook_sheets(abspath):
+    """ Return the names of the visible sheets with cells of the given xls or
+    xlsx workbook, it is read without any office application.
+    """
+    return [name for name, printable in sheet_list(abspath) if printable]
+
+
+def sheet_list(abspath):
+    """ Return every worksheet of the given xls or xlsx workbook in its order,
+    tuples (name, printable) where printable is True for the visible sheets
+    with cells. Positions of sheets count all of them.
+    """
+
+    if os.path.splitext(abspath)[1].lower() == '.xls':
+        return _xls_sheets(abspath)
+
+    return _xlsx_sheets(abspath)
+
+
+def export_split(files, backend, jobs, timeout, options, batch):
+    """ Export the wanted sheets and named ranges of each workbook as separate
+    tasks running in parallel and join the parts of each workbook in its PDF.
+    The result of each workbook is recorded in batch.
+    """
+
+    from lib.converters import SPREADSHEET, run_tasks
+
+    sheets, ranges = options.get('sheets'), options.get('ranges')
+    tmpdir = tempfile.mkdtemp(prefix='xls2pdf-')
+    tasks, parts = [], {}
+
+    try:
+        # STEP 1: One task for each sheet and named range of every workbook
+        for abspath in files:
+            try:
+                names = []
+                if sheets or not ranges:
+                    # Positions count every sheet, as the office does
+                    listed = sheet_list(abspath)
+                    names = select_sheets([name for name, _ in listed],
+                                          sheets)
+                    printable = set([name for name, ok in listed if ok])
+                    names = [name for name in names if name in printable]
+            except Exception as ex:
+                batch.append(abspath, _message(ex), 0)
+                continue
+
+            items = [{'sheets': [name]} for name in names] + \
+                [{'ranges': [name]} for name in ranges or []]
+            if not items:
+                batch.append(abspath, u'The workbook has nothing to print', 0)
+                continue
+
+            parts[abspath] = []
+            for item in items:
+                path = os.path.join(tmpdir, 'part-{}.pdf'.format(len(tasks)))
+                parts[abspath].append(path)
+                tasks.append((abspath, path, 'pdf', item))
+
+        # STEP 2: Render all parts, the first error of a workbook fails it
+        rendered = run_tasks(tasks, backend, SPREADSHEET, jobs, timeout,
+                             Batch(quiet=True))
+
+        errors, seconds = {}, {}
+        for abspath, error, elapsed, _, _ in rendered.results:
+            seconds[abspath] = seconds.get(abspath, 0) + elapsed
+            if error and abspath not in errors:
+                errors[abspath] = error
+
+        # STEP 3: Join the parts of each workbook
+        for abspath in files:
+            if abspath not in parts:
+                continue
+            if abspath in errors:
+                batch.append(abspath, errors[abspath], seconds[abspath])
+                continue
+
+            started = time.time()
+            new_path = output_path(abspath, '.pdf')
+            try:
+                join_pdfs(parts[abspath], new_path)
+                error = None
+            except Exception as ex:
+                error = _message(ex)
+
+            batch.append(abspath, error, seconds.get(abspath, 0) +
+                         time.time() - started, new_path)
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return batch
+
+
+def _message(ex):
+    """ Return a printable message for the given exception
+    """
+    return unicode(ex) if unicode(ex) else ex.__class__.__name__
+
+
+# ----------------------------- SHEET LISTING ---------------------------------
+
+
+def _xls_sheets(abspath):
+    """ Return the worksheets of an xls workbook, see sheet_list
+    """
+
+    from lib.biff import Workbook
+
+    workbook = Workbook(abspath)
+    try:
+        return [(sheet.name, sheet.state == 0 and
+                 _xls_has_cells(workbook, sheet))
+                for sheet in workbook.sheets if sheet.is_worksheet]
+    finally:
+        workbook.close()
+
+
+def _xls_has_cells(workbook, sheet):
+    """ Check if an xls sheet has at least one cell, it stops reading the
+    sheet at the first row.
+    """
+
+    for event in workbook.rows(sheet):
+        if event[0] == 'row':
+            return True
+
+    return False
+
+
+def _xlsx_sheets(abspath):
+    """ Return the worksheets of an xlsx workbook, see sheet_list
+    """
+
+    with zipfile.ZipFile(abspath) as zin:
+        root = ElementTree.fromstring(zin.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(
+            zin.read('xl/_rels/workbook.xml.rels'))
+
+        targets = {}
+        for rel in rels.findall('{%s}Relationship' % NS_PKG_REL):
+            if rel.get('Type', '').endswith('/worksheet'):
+                target = rel.get('Target', '')
+                targets[rel.get('Id')] = target.lstrip('/') \
+                    if target.startswith('/') else \
+                    posixpath.normpath(posixpath.join('xl', target))
+
+        sheets = []
+        for sheet in root.iter('{%s}sheet' % NS_MAIN):
+            target = targets.get(sheet.get('{%s}id' % NS_REL))
+            if target:
+                sheets.append((sheet.get('name'),
+                               sheet.get('state', 'visible') == 'visible' and
+                               _xlsx_has_cells(zin, target)))
+
+    return sheets
+
+
+def _xlsx_has_cells(zin, path):
+    """ Check if an xlsx sheet has at least one cell, the raw XML is scanned
+    until the first cell is found.
+    """
+
+    tail = b''
+    with zin.open(path) as fin:
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            if not block:
+                return False
+            if CELL_TAG.search(tail + block):
+                return True
+            tail = block[-8:]
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0913,R0914
+""" Page thumbnails of PDF documents. Pages are rendered to small PNG images
+by a local renderer, poppler (pdftoppm), MuPDF (mutool) or Ghostscript, in
+several processes at once, each one rendering a run of pages. Thumbnails can
+be kept in a cache keyed on the digest of the page, so pages which have not
+changed, in this file or in any other, are not rendered again. A contact
+sheet, an HTML page with every thumbnail linked to its page, shows them all.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import cgi
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib
+
+from lib.cache import ConversionCache
+from lib.pdfmerge import page_digests
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+RENDERERS = ('pdftoppm', 'mutool', 'gs')
+
+# Executable names of each renderer
+RENDERER_NAMES = {
+    'pdftoppm': ('pdftoppm', 'pdftoppm.exe'),
+    'mutool': ('mutool', 'mutool.exe'),
+    'gs': ('gs', 'gswin64c.exe', 'gswin32c.exe'),
+}
+
+DEFAULT_DPI = 20
+
+# Pages rendered by each task at most, smaller runs keep every process busy
+PAGES_PER_TASK = 25
+
+CONTACT_SHEET = u'index.html'
+
+HTML = u'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em; background: #eee; }}
+div {{ display: flex; flex-wrap: wrap; gap: 1em; }}
+figure {{ margin: 0; text-align: center; }}
+img {{ border: 1px solid #999; background: #fff; }}
+figcaption {{ font-size: small; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{summary}</p>
+<div>
+{figures}
+</div>
+</body>
+</html>
+'''
+
+FIGURE = (u'<figure><a href="{href}#page={number}"><img src="{src}" '
+          u'alt="{number}" loading="lazy"></a>'
+          u'<figcaption>{number}</figcaption></figure>')
+
+MISSING = u'<figure><figcaption>{number} [FAILED]</figcaption></figure>'
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def find_renderer(name=None):
+    """ Return the name and the executable path of the renderer, the given
+    one or the first one of RENDERERS found in PATH.
+    """
+
+    for renderer in [name] if name else RENDERERS:
+        for folder in os.environ.get('PATH', '').split(os.pathsep):
+            for executable in RENDERER_NAMES[renderer]:
+                path = os.path.join(folder, executable)
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    return renderer, path
+
+    raise ValueError(u'{} has not been found, thumbnails need poppler '
+                     u'(pdftoppm), MuPDF (mutool) or Ghostscript (gs)'
+                     .format(name or u'No PDF renderer'))
+
+
+def render_thumbnails(path, folder, jobs=1, dpi=DEFAULT_DPI, cache=None,
+                      renderer=None):
+    """ Write a thumbnail of each page of the PDF in path in folder, named
+    page-0001.png and so on. Pages found in cache, a ConversionCache, are
+    taken from it and the others are rendered by jobs processes. It returns
+    a list with a tuple (number, new_path, error, cached) for each page.
+    """
+
+    name, executable = find_renderer(renderer)
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # STEP 1: Pages with the same digest look the same
+    digests = page_digests(path)
+    width = max(4, len(str(len(digests))))
+    results = {}
+    pending = []
+
+    for index, digest in enumerate(digests):
+        number = index + 1
+        new_path = os.path.join(folder, 'page-{:0{}d}.png'.format(number,
+                                                                 width))
+        key = None
+        if cache is not None and digest:
+            key = ConversionCache.content_key(digest, 'thumbnail', name, dpi)
+            if cache.fetch(key, new_path):
+                results[number] = (number, new_path, None, True)
+                continue
+
+        pending.append((number, new_path, key))
+
+    # STEP 2: Runs of pages are rendered in parallel
+    tasks = [(name, executable, path, dpi, chunk[0][0], chunk[-1][0])
+             for chunk in _chunks(pending, jobs)]
+    paths = dict([(number, (new_path, key))
+                  for number, new_path, key in pending])
+
+    tmpdir = tempfile.mkdtemp(prefix='thumbnails-')
+    tasks = [task + (os.path.join(tmpdir, str(index)),)
+             for index, task in enumerate(tasks)]
+
+    try:
+        for first, last, rendered, error in _run(tasks, jobs):
+
+            # STEP 3: Thumbnails are moved to their place and cached
+            for number in range(first, last + 1):
+                new_path, key = paths[number]
+                if number not in rendered:
+                    results[number] = (number, new_path,
+                                       error or u'page not rendered', False)
+                    continue
+
+                if os.path.exists(new_path):
+                    os.remove(new_path)
+                shutil.move(rendered[number], new_path)
+                if key is not None:
+                    cache.store(key, new_path)
+                results[number] = (number, new_path, None, False)
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return [results[number] for number in sorted(results)]
+
+
+def write_contact_sheet(path, results, new_path):
+    """ Write an HTML page in new_path showing the thumbnails of the PDF in
+    path, results are given as render_thumbnails returns them. Each one links
+    to its page of the document.
+    """
+
+    dirname = os.path.dirname(os.path.abspath(new_path))
+    href = _url(os.path.relpath(os.path.abspath(path), dirname))
+    title = os.path.basename(path)
+    if not isinstance(title, unicode):
+        title = title.decode('utf-8', 'ignore')
+
+    figures = []
+    for number, thumbnail, error, _ in results:
+        if error:
+            figures.append(MISSING.format(number=number))
+        else:
+            src = _url(os.path.relpath(thumbnail, dirname))
+            figures.append(FIGURE.format(href=href, src=src, number=number))
+
+    failed = len([item for item in results if item[2]])
+    summary = u'{} pages'.format(len(results))
+    if failed:
+        summary += u', {} could not be rendered'.format(failed)
+
+    with open(new_path, 'wb') as fout:
+        fout.write(HTML.format(title=cgi.escape(title, True),
+                              summary=summary,
+                              figures=u'\n'.join(figures)).encode('utf-8'))
+
+    return new_path
+
+
+# ------------------------------- RENDERING -----------------------------------
+
+
+def _chunks(pending, jobs):
+    """ Split the pending pages in runs of consecutive pages, no longer than
+    needed to give some runs to each process.
+    """
+
+    size = max(1, min(PAGES_PER_TASK, -(-len(pending) // max(1, jobs * 2))))
+
+    chunk = []
+    for item in pending:
+        if chunk and (item[0] != chunk[-1][0] + 1 or len(chunk) >= size):
+            yield chunk
+            chunk = []
+        chunk.append(item)
+
+    if chunk:
+        yield chunk
+
+
+def _run(tasks, jobs):
+    """ Yield (first, last, rendered, error) for each task, rendered by jobs
+    processes at once.
+    """
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _render(task)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap_unordered(_render, tasks):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _render(task):
+    """ Render a run of pages in its own folder, it returns the first and
+    the last pages, a dictionary with the image of each page rendered and
+    the error, if any.
+    """
+
+    name, executable, path, dpi, first, last, folder = task
+    os.makedirs(folder)
+    error = None
+    started = time.time()
+
+    if name == 'pdftoppm':
+        args = [executable, '-png', '-r', str(dpi), '-f', str(first),
+                '-l', str(last), path, os.path.join(folder, 'page')]
+        offset = 0
+    elif name == 'mutool':
+        args = [executable, 'draw', '-q', '-r', str(dpi),
+                '-o', os.path.join(folder, 'page-%d.png'), path,
+                '{}-{}'.format(first, last)]
+        offset = 0
+    else:
+        args = [executable, '-q', '-dBATCH', '-dNOPAUSE', '-dSAFER',
+                '-sDEVICE=png16m', '-r{}'.format(dpi),
+                '-dFirstPage={}'.format(first), '-dLastPage={}'.format(last),
+                '-sOutputFile=' + os.path.join(folder, 'page-%d.png'), path]
+        offset = first - 1 # Ghostscript counts the images it writes
+
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        _, stderr = process.communicate()
+        if process.returncode:
+            error = stderr.decode('utf-8', 'ignore').strip() or \
+                u'{} failed after {:.1f} seconds'.format(
+                    name, time.time() - started)
+    except Exception as ex:
+        error = unicode(ex) or ex.__class__.__name__
+
+    rendered = {}
+    for filename in os.listdir(folder):
+        match = re.match(r'^page-0*([0-9]+)\.png$', filename)
+        if match:
+            rendered[int(match.group(1)) + offset] = os.path.join(folder,
+                                                                  filename)
+
+    return first, last, rendered, error
+
+
+def _url(path):
+    """ Return a relative path as an URL which can be written in HTML
+    """
+
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+
+    return cgi.escape('/'.join([urllib.quote(item)
+                                for item in path.split(os.sep)]), True)
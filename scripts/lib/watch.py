@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" Watches a set of folders and converts every new or changed document as
+soon as it has been completely written. The converter is started only once
+and it is kept running while the folders are being watched.
+
+Changes are detected through inotify in Linux, in other systems the folders
+are scanned periodically.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from lib.batch import Batch, output_path
+from lib.converters import new_converter
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def new_watcher(folders):
+    """ Return the best watcher available for the current system
+    """
+
+    try:
+        return InotifyWatcher(folders)
+    except (AttributeError, OSError):
+        return PollingWatcher(folders)
+
+
+def watch_folders(folders, extensions, backend, kind, fmt, delay=0.5):
+    """ Converts the documents with one of the given extensions which are
+    written in the given folders until the user press Ctrl+C.
+    """
+
+    Watch(folders, extensions, backend, kind, fmt, delay).run()
+
+
+# ---------------------------- INOTIFY WATCHER --------------------------------
+
+
+class InotifyWatcher(object):
+    """ Reports the files changed in the watched folders using inotify, new
+    sub-folders are also watched.
+    """
+
+    def __init__(self, folders):
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), u'inotify is not available')
+
+        self._folders = {}
+        for folder in folders:
+            self._add_tree(folder)
+
+    def close(self):
+        """ Release the inotify descriptor
+        """
+        os.close(self._fd)
+
+    def changes(self, timeout):
+        """ Wait up to timeout seconds and return the set of changed files
+        """
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as ex:
+            if ex.errno == errno.EINTR:
+                return set()
+            raise
+
+        changed, offset = set(), 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events have been lost, report everything in the folders
+                for folder in list(self._folders.values()):
+                    changed.update(_list_files(folder))
+                continue
+
+            if mask & IN_IGNORED:
+                self._folders.pop(wd, None)
+                continue
+
+            folder = self._folders.get(wd)
+            if folder is None or not name:
+                continue
+
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                    changed.update(_list_files(path, True))
+            else:
+                changed.add(path)
+
+        return changed
+
+    def _add_tree(self, folder):
+        """ Watch the given folder and all its sub-folders
+        """
+
+        for root, dirs, _ in os.walk(folder):
+            dirs[:] = [item for item in dirs if not item.startswith('.')]
+            path = root.encode('utf-8') if isinstance(root, unicode) else root
+            wd = self._libc.inotify_add_watch(self._fd, path, WATCH_MASK)
+            if wd >= 0:
+                self._folders[wd] = root
+
+
+# ---------------------------- POLLING WATCHER --------------------------------
+
+
+class PollingWatcher(object):
+    """ Reports the files changed in the watched folders comparing the size
+    and modification time of the files between two scans.
+    """
+
+    def __init__(self, folders):
+        self._folders = folders
+        self._state = self._scan()
+
+    def close(self):
+        """ Nothing to release
+        """
+        pass
+
+    def changes(self, timeout):
+        """ Wait timeout seconds and return the set of changed files
+        """
+
+        time.sleep(timeout)
+
+        state = self._scan()
+        changed = set([path for path, stat in state.items()
+                       if self._state.get(path) != stat])
+        self._state = state
+
+        return changed
+
+    def _scan(self):
+        """ Return a dictionary with the size and mtime of every file
+        """
+
+        state = {}
+        for folder in self._folders:
+            for path in _list_files(folder, True):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (stat.st_size, stat.st_mtime)
+
+        return state
+
+
+def _list_files(folder, recursive=False):
+    """ Return the paths of the files in the given folder
+    """
+
+    result = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [item for item in dirs if not item.startswith('.')]
+        result.extend([os.path.join(root, name) for name in files])
+        if not recursive:
+            break
+
+    return result
+
+
+# ------------------------------ WATCH CLASS ----------------------------------
+
+
+class Watch(object):
+    """ Converts the documents written in the watched folders once they have
+    not changed during delay seconds.
+    """
+
+    def __init__(self, folders, extensions, backend, kind, fmt, delay=0.5):
+        self._folders = [os.path.abspath(folder) for folder in folders]
+        self._extensions = tuple([ext.lower() for ext in extensions])
+        self._backend = backend
+        self._kind = kind
+        self._fmt = fmt
+        self._delay = delay
+        self._pending = {}
+        self._converter = None
+
+    def run(self):
+        """ Watch the folders until the user press Ctrl+C
+        """
+
+        batch = Batch()
+        watcher = new_watcher(self._folders)
+        self._start()
+
+        print u'Watching {} (Ctrl+C to stop)'.format(u', '.join(
+            [_unicode(folder) for folder in self._folders]))
+
+        try:
+            # STEP 1: Convert the documents which are older than their outputs
+            for folder in self._folders:
+                for path in _list_files(folder, True):
+                    if self._accepts(path) and self._outdated(path):
+                        self._convert(path, batch)
+
+            # STEP 2: Wait for changes and convert the documents once they
+            # have not been changed during delay seconds
+            while True:
+                now = time.time()
+                for path in watcher.changes(self._delay / 2.0):
+                    if self._accepts(path):
+                        self._pending[path] = (now, _size(path))
+
+                self._flush(batch)
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            watcher.close()
+            if self._converter:
+                self._converter.stop()
+
+        if batch.results:
+            batch.summary()
+
+    def _flush(self, batch):
+        """ Convert the pending documents which are not being written
+        """
+
+        now = time.time()
+
+        for path, (changed, size) in list(self._pending.items()):
+            if now - changed < self._delay:
+                continue
+
+            current = _size(path)
+            if current is None:
+                del self._pending[path] # It has been removed or renamed
+            elif current != size:
+                self._pending[path] = (now, current) # It is still growing
+            else:
+                del self._pending[path]
+                self._convert(path, batch)
+
+    def _convert(self, path, batch):
+        """ Convert one document, the converter is restarted if it has died
+        """
+
+        if not self._converter.is_alive():
+            self._converter.stop()
+            self._start()
+
+        new_path = output_path(path, '.' + self._fmt)
+        batch.run(path, self._converter.convert, path, new_path, self._fmt)
+
+    def _start(self):
+        """ Launch the converter will be used for all the documents
+        """
+
+        self._converter = new_converter(self._backend, self._kind)
+        self._converter.start()
+
+    def _accepts(self, path):
+        """ Check if the given path is a document which must be converted
+        """
+
+        name = os.path.basename(path)
+        if name.startswith(u'~$') or name.startswith(u'.'):
+            return False
+
+        return os.path.splitext(name)[1].lower() in self._extensions
+
+    def _outdated(self, path):
+        """ Check if the output of the given document is missing or older
+        """
+
+        new_path = output_path(path, '.' + self._fmt)
+        try:
+            return os.path.getmtime(new_path) < os.path.getmtime(path)
+        except OSError:
+            return True
+
+
+def _size(path):
+    """ Return the size of path or None if it does not exist
+    """
+
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'ignore')
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902
+""" PDF watermarks. The input document is parsed just once and every object
+but its pages is serialized once, keeping its number, so each stamped copy is
+written joining those bytes with its own pages. The background page and the
+text stamp are Form XObjects, every page references them through two small
+content streams drawn before and after its own contents, which are not parsed
+at all, so each copy holds only one copy of each stamp.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import csv
+import io
+import multiprocessing
+import os
+import StringIO
+import sys
+import time
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject,
+                            DictionaryObject, IndirectObject, NameObject,
+                            NumberObject, RectangleObject, StreamObject)
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+from lib.batch import Batch
+from lib.pdflinear import linearize_pdf
+from lib.pdfoptimize import optimize_pdf
+from lib.pdfreader import MappedReader
+from lib.pdfupdate import (next_number, serialize, write_object,
+                           write_update, write_xref)
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+
+FONT_NAME = 'Helvetica'
+FONT_SIZE = 30
+
+# Position of the text stamp from the bottom left corner of the page
+TEXT_X = 2.2 * cm
+TEXT_Y = 1.2 * cm - 30
+
+# Names the stamps take in the resources of each page
+BACKGROUND_NAME = NameObject('/WmBackground')
+OVERLAY_NAME = NameObject('/WmOverlay')
+
+# Objects of the input which are not copied, their contents are copied as
+# plain objects
+SKIPPED_TYPES = ('/ObjStm', '/XRef')
+
+# Copies of the input shared by the functions run in the worker processes
+_COPIES = None
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def read_recipients(path):
+    """ Return the rows of a CSV file as dictionaries, the first row has the
+    names of the columns. Values are unicode text.
+    """
+
+    with open(path, 'rb') as fin:
+        data = fin.read()
+
+    if data.startswith(b'\xef\xbb\xbf'):
+        data = data[3:] # UTF-8 byte order mark
+
+    rows = []
+    for row in csv.DictReader(io.BytesIO(data)):
+        rows.append(dict([(key.decode('utf-8', 'ignore').strip(),
+                           (value or '').decode('utf-8', 'ignore').strip())
+                          for key, value in row.items() if key]))
+
+    return rows
+
+
+def recipient_path(template, row):
+    """ Return the absolute path of the copy of a recipient, the template
+    formatted with the values of its row. The path is encoded as the file
+    system expects it, as UTF-8 when its encoding can not write it, such as
+    ASCII under a POSIX locale.
+    """
+
+    if not isinstance(template, unicode):
+        template = template.decode('utf-8', 'ignore')
+
+    path = template.format(**row)
+    try:
+        path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+    except UnicodeEncodeError:
+        path = path.encode('utf-8')
+
+    return os.path.abspath(path)
+
+
+def write_copies(path, background, tasks, jobs=1, batch=None,
+                 incremental=False, level=None, sizes=None, linearize=False):
+    """ Write stamped copies of the PDF in path, tasks are (new_path, text)
+    tuples, see StampedCopies. The input is parsed just once, workers
+    started by fork share it and any other worker parses it when it starts.
+    The result of each copy is recorded in batch, which is returned. When a
+    compression level is given each copy is optimized as it is written, see
+    lib.pdfoptimize, and its size before and after it is kept in sizes,
+    {new_path: (bytes, bytes)}. Copies are linearized at the end when
+    linearize is True, see lib.pdflinear.
+    """
+
+    global _COPIES #pylint: disable=W0603
+
+    _COPIES = StampedCopies(path, background, incremental)
+    batch = batch or Batch()
+    sizes = sizes if sizes is not None else {}
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for new_path, text in tasks:
+            batch.run(new_path, _write, new_path, text, level, linearize,
+                      sizes)
+        return batch
+
+    pool = multiprocessing.Pool(jobs, _init_worker,
+                                (path, background, incremental))
+    try:
+        for new_path, error, seconds, size in pool.imap_unordered(
+                _write_copy, [task + (level, linearize) for task in tasks]):
+            if size:
+                sizes[new_path] = size
+            batch.append(new_path, error, seconds,
+                         None if error else new_path)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        for new_path, _ in tasks:
+            if os.path.exists(new_path + '.tmp'):
+                os.remove(new_path + '.tmp')
+        raise
+
+    pool.join()
+
+    return batch
+
+
+def text_page(text, font=FONT_NAME, size=FONT_SIZE, x=TEXT_X, y=TEXT_Y):
+    """ Return a PDF page with just the given text, it is drawn by reportlab
+    in memory.
+    """
+
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8', 'ignore')
+
+    packet = StringIO.StringIO()
+    can = canvas.Canvas(packet)
+    can.setFont(font, size)
+    can.drawString(x, y, text)
+    can.save()
+    packet.seek(0)
+
+    return PdfFileReader(packet).getPage(0)
+
+
+def page_form(page):
+    """ Return a Form XObject drawing the contents of the given page, it keeps
+    the resources of the page.
+    """
+
+    form = DecodedStreamObject()
+    form.setData(page.getContents().getData() if page.getContents() else '')
+    form = form.flateEncode()
+
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): RectangleObject(page.mediaBox),
+        NameObject('/Resources'): page.get('/Resources', DictionaryObject()),
+    })
+
+    return form
+
+
+# ---------------------------- WATERMARK CLASS --------------------------------
+
+
+class StampedCopies(object):
+    """ Writes stamped copies of the PDF in path, background is the path of a
+    PDF whose first page is drawn below the contents of every page, it can be
+    None. The input is closed as soon as it has been read, so an instance can
+    be shared by forked processes. Incremental copies keep the bytes of the
+    input and append the stamped pages and the stamps, see lib.pdfupdate, so
+    only the pages are read.
+    """
+
+    def __init__(self, path, background=None, incremental=False):
+        self._path = path
+        self._incremental = incremental
+        self._objects = []   # (number, generation, bytes) not changed
+        self._pages = []     # (number, generation, page dictionary)
+        self._shared = []    # (number, bytes) added to every copy
+        self._forms = DictionaryObject()
+        self._trailer = DictionaryObject()
+
+        # STEP 1: Serialize the objects of the input, pages are kept parsed
+        with MappedReader(path) as reader:
+            if reader.isEncrypted:
+                raise ValueError(u'Encrypted files can not be watermarked')
+
+            pages = {}
+            for page in reader.pages:
+                ref = page.indirectRef
+                pages[(ref.idnum, ref.generation)] = page
+
+            if incremental:
+                self._pages = [(number, generation, _prepare(page))
+                               for (number, generation), page
+                               in sorted(pages.items())]
+            else:
+                for generation, numbers in sorted(reader.xref.items()):
+                    for number in sorted(numbers):
+                        self._read(reader, number, generation, pages)
+                for number in sorted(reader.xref_objStm):
+                    self._read(reader, number, 0, pages)
+
+            for key in ('/Root', '/Info', '/ID'):
+                if key in reader.trailer:
+                    self._trailer[NameObject(key)] = reader.trailer.raw_get(key)
+
+            self._next = next_number(reader)
+
+        # STEP 2: Serialize the background and the streams around the pages
+        before = 'q'
+        if background:
+            with MappedReader(background) as reader:
+                page = reader.getPage(0)
+                self._next, objects = _copy(page_form(page), self._next)
+            self._forms[BACKGROUND_NAME] = IndirectObject(objects[0][0], 0,
+                                                          None)
+            self._shared.extend(objects)
+            before = 'q {} Do Q q'.format(BACKGROUND_NAME)
+
+        self._next, objects = _copy(_content(before), self._next)
+        self._before = IndirectObject(objects[0][0], 0, None)
+        self._shared.extend(objects)
+
+    @property
+    def pages(self):
+        """ Return the number of pages of the input
+        """
+        return len(self._pages)
+
+    def write(self, new_path, text=None):
+        """ Write a copy stamped with the given text, or just the background
+        when there is no text. It returns new_path.
+        """
+
+        # STEP 1: The stamp of this copy and the stream which draws it
+        forms = DictionaryObject(self._forms)
+        objects, after = [], 'Q'
+        next_number = self._next
+
+        if text:
+            form = page_form(text_page(text))
+            next_number, objects = _copy(form, next_number)
+            forms[OVERLAY_NAME] = IndirectObject(objects[0][0], 0, None)
+            after = 'Q q {} Do Q'.format(OVERLAY_NAME)
+
+        next_number, stream = _copy(_content(after), next_number)
+        objects.extend(stream)
+        after = IndirectObject(stream[0][0], 0, None)
+
+        pages = [(number, generation,
+                  serialize(_stamped(page, forms, self._before, after)))
+                 for number, generation, page in self._pages]
+        added = [(number, 0, data) for number, data in self._shared + objects]
+
+        trailer = DictionaryObject(self._trailer)
+        trailer[NameObject('/Size')] = NumberObject(next_number)
+
+        if self._incremental:
+            return write_update(self._path, new_path, pages + added, trailer)
+
+        # STEP 2: Write the objects of the input, the new pages and stamps
+        tmppath = new_path + '.tmp'
+        offsets = {}
+
+        try:
+            with open(tmppath, 'wb') as fout:
+                fout.write(HEADER)
+
+                for number, generation, data in self._objects + pages + added:
+                    offsets[number] = (fout.tell(), generation)
+                    write_object(fout, number, generation, data)
+
+                write_xref(fout, offsets, trailer)
+
+            if os.path.exists(new_path):
+                os.remove(new_path)
+            os.rename(tmppath, new_path)
+
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+        return new_path
+
+    def _read(self, reader, number, generation, pages):
+        """ Serialize one object of the input, or keep it if it is a page
+        """
+
+        if (number, generation) in pages:
+            self._pages.append((number, generation,
+                                _prepare(pages[(number, generation)])))
+            return
+
+        try:
+            obj = reader.getObject(IndirectObject(number, generation, reader))
+        except Exception:
+            return # Broken entries are left out, as readers do
+
+        if obj is None:
+            return
+        if isinstance(obj, StreamObject) and obj.get('/Type') in SKIPPED_TYPES:
+            return
+
+        self._objects.append((number, generation, serialize(obj)))
+
+
+def _init_worker(path, background, incremental):
+    """ Parse the input in a worker process which has not inherited it
+    """
+
+    global _COPIES #pylint: disable=W0603
+
+    if _COPIES is None:
+        _COPIES = StampedCopies(path, background, incremental)
+
+
+def _write(new_path, text, level, linearize, sizes):
+    """ Write one copy, optimize it when a compression level is given and
+    then linearize it if asked
+    """
+
+    _COPIES.write(new_path, text)
+    if level is not None:
+        sizes[new_path] = optimize_pdf(new_path, new_path, level)
+    if linearize:
+        linearize_pdf(new_path, new_path)
+
+    return new_path
+
+
+def _write_copy(task):
+    """ Write one copy in a worker process, it returns (new_path, error,
+    seconds, sizes), sizes is None unless it has been optimized.
+    """
+
+    new_path, text, level, linearize = task
+    started = time.time()
+    sizes = {}
+
+    try:
+        _write(new_path, text, level, linearize, sizes)
+        error = None
+    except Exception as ex:
+        error = unicode(ex) or ex.__class__.__name__
+
+    return new_path, error, time.time() - started, sizes.get(new_path)
+
+
+def _prepare(page):
+    """ Return a copy of the page dictionary with its contents as an array
+    and its resources, and the forms in them, as direct dictionaries of its
+    own, so they can be changed without changing those shared with other
+    pages.
+    """
+
+    contents = page.raw_get('/Contents') if '/Contents' in page else None
+    if contents is None:
+        contents = ArrayObject()
+    elif isinstance(contents.getObject(), ArrayObject):
+        contents = ArrayObject(contents.getObject())
+    else:
+        contents = ArrayObject([contents])
+
+    resources = DictionaryObject(page['/Resources']) \
+        if '/Resources' in page else DictionaryObject()
+    resources[NameObject('/XObject')] = DictionaryObject(
+        resources['/XObject']) if '/XObject' in resources \
+        else DictionaryObject()
+
+    result = DictionaryObject(page)
+    result[NameObject('/Contents')] = contents
+    result[NameObject('/Resources')] = resources
+
+    return result
+
+
+def _stamped(page, forms, before, after):
+    """ Return a copy of a prepared page drawing the stamps, its own contents
+    are kept as they are between the two new streams.
+    """
+
+    resources = DictionaryObject(page['/Resources'])
+    resources[NameObject('/XObject')] = DictionaryObject(
+        resources['/XObject'])
+    resources['/XObject'].update(forms)
+
+    result = DictionaryObject(page)
+    result[NameObject('/Contents')] = ArrayObject(
+        [before] + list(page['/Contents']) + [after])
+    result[NameObject('/Resources')] = resources
+
+    return result
+
+
+def _copy(obj, next_number):
+    """ Give numbers to obj and to every object it references, which belong
+    to another document. It returns the next free number and the list of
+    (number, bytes), obj is the first one.
+    """
+
+    numbers, objects = {}, []
+
+    def _remap(value):
+        """ Return a copy of value pointing to the new numbers
+        """
+
+        if isinstance(value, IndirectObject):
+            key = (id(value.pdf), value.idnum, value.generation)
+            if key not in numbers:
+                numbers[key] = _add(value.getObject())
+            return IndirectObject(numbers[key], 0, None)
+
+        if isinstance(value, StreamObject):
+            result = value.__class__()
+            result._data = value._data #pylint: disable=W0212
+        elif isinstance(value, DictionaryObject):
+            result = DictionaryObject()
+        elif isinstance(value, ArrayObject):
+            return ArrayObject([_remap(item) for item in value])
+        else:
+            return value
+
+        for key, item in value.items():
+            result[NameObject(key)] = _remap(item)
+        return result
+
+    def _add(value):
+        """ Number and serialize one object
+        """
+
+        number = next_number + len(objects)
+        objects.append([number, None])
+        objects[number - next_number][1] = serialize(_remap(value))
+        return number
+
+    _add(obj)
+
+    return next_number + len(objects), [tuple(item) for item in objects]
+
+
+def _content(text):
+    """ Return a content stream with the given operators
+    """
+
+    stream = DecodedStreamObject()
+    stream.setData(text)
+    return stream
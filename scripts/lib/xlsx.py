@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903,R0902,R0914
+""" Converts Microsoft Excel 97-2003 workbooks to Office Open XML (xlsx)
+without Excel. Every sheet is read row by row from the BIFF8 records and its
+XML is written to a temporary file as it is read, so the workbook is never
+held in memory; the temporary files are finally packed into the xlsx zip.
+
+Values, formulas, defined names, column widths, row heights, merged cells
+and basic styles (number formats, fonts, fills, borders and alignment) are
+kept, everything else is left behind.
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import codecs
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+
+from lib.batch import temporary_path
+from lib.biff import DEFAULT_PALETTE, Workbook, cell_name
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+          'relationships')
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+NS_TYPES = 'http://schemas.openxmlformats.org/package/2006/content-types'
+
+CT_MAIN = 'application/vnd.openxmlformats-officedocument.spreadsheetml.'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Number formats which have the same meaning in BIFF8 and OOXML
+BUILTIN_FORMATS = set(range(0, 5) + range(9, 23) + range(37, 50))
+
+FILL_PATTERNS = [
+    'none', 'solid', 'mediumGray', 'darkGray', 'lightGray', 'darkHorizontal',
+    'darkVertical', 'darkDown', 'darkUp', 'darkGrid', 'darkTrellis',
+    'lightHorizontal', 'lightVertical', 'lightDown', 'lightUp', 'lightGrid',
+    'lightTrellis', 'gray125', 'gray0625'
+]
+
+BORDER_STYLES = [
+    None, 'thin', 'medium', 'dashed', 'dotted', 'thick', 'double', 'hair',
+    'mediumDashed', 'dashDot', 'mediumDashDot', 'dashDotDot',
+    'mediumDashDotDot', 'slantDashDot'
+]
+
+HORIZONTAL = [None, 'left', 'center', 'right', 'fill', 'justify',
+              'centerContinuous', 'distributed']
+
+VERTICAL = ['top', 'center', None, 'justify', 'distributed']
+
+UNDERLINE = {0x01: 'single', 0x02: 'double', 0x21: 'singleAccounting',
+             0x22: 'doubleAccounting'}
+
+INVALID_XML = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+# ---------------------------- PUBLIC FUNCTIONS -------------------------------
+
+
+def convert_xls(abspath, new_path):
+    """ Convert the xls workbook in abspath to the xlsx new_path, returns the
+    number of formulas which could not be decompiled and have been written
+    only with their values.
+    """
+
+    tmpdir = tempfile.mkdtemp(prefix='xls2xlsx-')
+
+    try:
+        # STEP 1: Read the globals writing the shared strings as they come
+        strings_path = os.path.join(tmpdir, 'sharedStrings.xml')
+        with codecs.open(strings_path, 'w', 'utf-8') as fout:
+            fout.write(XML_HEADER)
+            fout.write(u'<sst xmlns="{}">'.format(NS_MAIN))
+            workbook = Workbook(abspath, lambda text: fout.write(
+                u'<si><t xml:space="preserve">{}</t></si>'.format(_xml(text))))
+            fout.write(u'</sst>')
+
+        try:
+            sheets = [sheet for sheet in workbook.sheets if sheet.is_worksheet]
+            if not sheets:
+                raise ValueError(u'The workbook has no worksheets')
+
+            # STEP 2: Write each sheet to its own temporary file
+            for position, sheet in enumerate(sheets):
+                path = os.path.join(tmpdir, 'sheet{}.xml'.format(position + 1))
+                _write_sheet(workbook, sheet, path)
+
+            # STEP 3: Pack everything
+            _write_package(workbook, sheets, tmpdir, new_path)
+
+        finally:
+            workbook.close()
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return workbook.lost_formulas
+
+
+def _xml(text):
+    """ Escape text to be written inside XML
+    """
+
+    text = text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+    text = text.replace(u'>', u'&gt;').replace(u'"', u'&quot;')
+
+    return INVALID_XML.sub(lambda match: u'_x{:04X}_'.format(
+        ord(match.group(0))), text)
+
+
+def _number(value):
+    """ Return the text of a numeric cell value
+    """
+
+    if value == int(value) and abs(value) < 1e15:
+        return unicode(int(value))
+
+    return unicode(repr(value))
+
+
+# ------------------------------ SHEET WRITER ---------------------------------
+
+
+def _write_sheet(workbook, sheet, path):
+    """ Write the XML of the given sheet in path
+    """
+
+    with codecs.open(path, 'w', 'utf-8') as fout:
+        fout.write(XML_HEADER)
+        fout.write(u'<worksheet xmlns="{}" xmlns:r="{}">'.format(
+            NS_MAIN, NS_REL))
+
+        for event in workbook.rows(sheet):
+
+            if event[0] == 'columns':
+                _write_columns(fout, event[1])
+                fout.write(u'<sheetData>')
+
+            elif event[0] == 'row':
+                _write_row(fout, event[1], event[2], event[3])
+
+            elif event[0] == 'merged':
+                fout.write(u'</sheetData>')
+                if event[1]:
+                    fout.write(u'<mergeCells count="{}">'.format(
+                        len(event[1])))
+                    for first, last, first_col, last_col in event[1]:
+                        fout.write(u'<mergeCell ref="{}:{}"/>'.format(
+                            cell_name(first, first_col),
+                            cell_name(last, last_col)))
+                    fout.write(u'</mergeCells>')
+
+        fout.write(u'</worksheet>')
+
+
+def _write_columns(fout, columns):
+    """ Write the width, style and visibility of the columns
+    """
+
+    if not columns:
+        return
+
+    fout.write(u'<cols>')
+    for first, last, width, xf, hidden in columns:
+        fout.write(u'<col min="{}" max="{}" width="{}" style="{}" '
+                   u'customWidth="1"{}/>'.format(
+                       first + 1, min(last, 0xFF) + 1, width, xf,
+                       u' hidden="1"' if hidden else u''))
+    fout.write(u'</cols>')
+
+
+def _write_row(fout, index, attrs, cells):
+    """ Write a row and its cells
+    """
+
+    # STEP 1: Row attributes
+    extra = u''
+    if attrs:
+        if attrs['custom']:
+            extra += u' ht="{}" customHeight="1"'.format(attrs['height'])
+        if attrs['hidden']:
+            extra += u' hidden="1"'
+        if attrs['xf'] is not None:
+            extra += u' s="{}" customFormat="1"'.format(attrs['xf'])
+
+    fout.write(u'<row r="{}"{}>'.format(index + 1, extra))
+
+    # STEP 2: Cells
+    for col, xf, ctype, value, formula in cells:
+        ref = cell_name(index, col)
+
+        if isinstance(formula, tuple):
+            body = u'<f t="array" ref="{}">{}</f>'.format(
+                formula[0], _xml(formula[1]))
+        elif formula is not None:
+            body = u'<f>{}</f>'.format(_xml(formula))
+        else:
+            body = u''
+
+        if ctype is None:
+            fout.write(u'<c r="{}" s="{}"/>'.format(ref, xf))
+            continue
+
+        if ctype == 'n':
+            fout.write(u'<c r="{}" s="{}">{}<v>{}</v></c>'.format(
+                ref, xf, body, _number(value)))
+        elif ctype == 's':
+            fout.write(u'<c r="{}" s="{}" t="s"><v>{}</v></c>'.format(
+                ref, xf, value))
+        elif ctype == 'b':
+            fout.write(u'<c r="{}" s="{}" t="b">{}<v>{}</v></c>'.format(
+                ref, xf, body, 1 if value else 0))
+        elif ctype == 'e':
+            fout.write(u'<c r="{}" s="{}" t="e">{}<v>{}</v></c>'.format(
+                ref, xf, body, value))
+        elif body:
+            fout.write(u'<c r="{}" s="{}" t="str">{}<v>{}</v></c>'.format(
+                ref, xf, body, _xml(value)))
+        else:
+            fout.write(u'<c r="{}" s="{}" t="inlineStr"><is><t '
+                       u'xml:space="preserve">{}</t></is></c>'.format(
+                           ref, xf, _xml(value)))
+
+    fout.write(u'</row>')
+
+
+# ----------------------------- PACKAGE WRITER --------------------------------
+
+
+def _write_package(workbook, sheets, tmpdir, new_path):
+    """ Write the xlsx zip with the sheets and strings in tmpdir
+    """
+
+    tmppath = temporary_path(new_path)
+
+    try:
+        with zipfile.ZipFile(tmppath, 'w', zipfile.ZIP_DEFLATED,
+                             True) as zout:
+            zout.writestr('[Content_Types].xml', _content_types(len(sheets)))
+            zout.writestr('_rels/.rels', _root_rels())
+            zout.writestr('xl/workbook.xml', _workbook_xml(workbook, sheets))
+            zout.writestr('xl/_rels/workbook.xml.rels',
+                          _workbook_rels(sheets))
+            zout.writestr('xl/styles.xml', _styles_xml(workbook))
+            zout.write(os.path.join(tmpdir, 'sharedStrings.xml'),
+                       'xl/sharedStrings.xml')
+
+            for position in range(len(sheets)):
+                name = 'sheet{}.xml'.format(position + 1)
+                zout.write(os.path.join(tmpdir, name),
+                           'xl/worksheets/' + name)
+
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.rename(tmppath, new_path)
+
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
+def _content_types(count):
+    """ Return [Content_Types].xml
+    """
+
+    parts = [
+        XML_HEADER, '<Types xmlns="{}">'.format(NS_TYPES),
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>',
+        '<Default Extension="xml" ContentType="application/xml"/>',
+        '<Override PartName="/xl/workbook.xml" ContentType="{}'
+        'sheet.main+xml"/>'.format(CT_MAIN),
+        '<Override PartName="/xl/styles.xml" ContentType="{}'
+        'styles+xml"/>'.format(CT_MAIN),
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="{}'
+        'sharedStrings+xml"/>'.format(CT_MAIN)
+    ]
+
+    for position in range(count):
+        parts.append('<Override PartName="/xl/worksheets/sheet{}.xml" '
+                     'ContentType="{}worksheet+xml"/>'.format(
+                         position + 1, CT_MAIN))
+
+    parts.append('</Types>')
+
+    return ''.join(parts)
+
+
+def _root_rels():
+    """ Return _rels/.rels
+    """
+
+    return (XML_HEADER + '<Relationships xmlns="{}"><Relationship Id="rId1" '
+            'Type="{}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'.format(NS_PKG_REL, NS_REL))
+
+
+def _workbook_rels(sheets):
+    """ Return xl/_rels/workbook.xml.rels
+    """
+
+    parts = [XML_HEADER, '<Relationships xmlns="{}">'.format(NS_PKG_REL)]
+
+    for position in range(len(sheets)):
+        parts.append('<Relationship Id="rId{0}" Type="{1}/worksheet" '
+                     'Target="worksheets/sheet{0}.xml"/>'.format(
+                         position + 1, NS_REL))
+
+    count = len(sheets)
+    parts.append('<Relationship Id="rId{}" Type="{}/styles" '
+                 'Target="styles.xml"/>'.format(count + 1, NS_REL))
+    parts.append('<Relationship Id="rId{}" Type="{}/sharedStrings" '
+                 'Target="sharedStrings.xml"/>'.format(count + 2, NS_REL))
+    parts.append('</Relationships>')
+
+    return ''.join(parts)
+
+
+def _workbook_xml(workbook, sheets):
+    """ Return xl/workbook.xml with the sheets and the defined names
+    """
+
+    parts = [XML_HEADER, u'<workbook xmlns="{}" xmlns:r="{}">'.format(
+        NS_MAIN, NS_REL)]
+
+    parts.append(u'<workbookPr{}/>'.format(
+        u' date1904="1"' if workbook.date1904 else u''))
+
+    # STEP 1: Sheets, at least one of them must be visible
+    states = {1: u' state="hidden"', 2: u' state="veryHidden"'}
+    visible = [sheet for sheet in sheets if sheet.state == 0]
+    first = sheets.index(visible[0]) if visible else 0
+
+    parts.append(u'<bookViews><workbookView activeTab="{}"/></bookViews>'
+                 .format(first))
+
+    parts.append(u'<sheets>')
+    for position, sheet in enumerate(sheets):
+        state = states.get(sheet.state, u'') if visible else u''
+        parts.append(u'<sheet name="{}" sheetId="{}"{} r:id="rId{}"/>'.format(
+            _xml(sheet.name), position + 1, state, position + 1))
+    parts.append(u'</sheets>')
+
+    # STEP 2: Defined names, local ones refer to the position of the sheet
+    positions = dict([(sheet.index, position)
+                      for position, sheet in enumerate(sheets)])
+
+    names, seen = [], set()
+    for name in workbook.names:
+        if not name.formula or not name.name:
+            continue
+
+        text = u'_xlnm.' + name.name if name.builtin else name.name
+        scope = positions.get(name.scope) if name.scope is not None else None
+        if (name.scope is not None and scope is None) or \
+                (text, scope) in seen:
+            continue
+        seen.add((text, scope))
+
+        attrs = u''
+        if scope is not None:
+            attrs += u' localSheetId="{}"'.format(scope)
+        if name.hidden or name.name == u'_FilterDatabase':
+            attrs += u' hidden="1"'
+
+        names.append(u'<definedName name="{}"{}>{}</definedName>'.format(
+            _xml(text), attrs, _xml(name.formula)))
+
+    if names:
+        parts.append(u'<definedNames>' + u''.join(names) + u'</definedNames>')
+
+    parts.append(u'</workbook>')
+
+    return u''.join(parts).encode('utf-8')
+
+
+# ------------------------------ STYLES WRITER --------------------------------
+
+
+def _color(workbook, index, tag):
+    """ Return the color element for the given palette index
+    """
+
+    if index < 8:
+        rgb = DEFAULT_PALETTE[index] # Fixed colors, same as the first eight
+    elif index < 64:
+        rgb = workbook.palette[index - 8]
+    else:
+        return u'<{} auto="1"/>'.format(tag)
+
+    return u'<{} rgb="FF{:06X}"/>'.format(tag, rgb)
+
+
+def _styles_xml(workbook):
+    """ Return xl/styles.xml, cellXfs has one entry for each BIFF8 XF record
+    so cells keep the same style index.
+    """
+
+    # STEP 1: Custom number formats
+    formats = [u'<numFmt numFmtId="{}" formatCode="{}"/>'.format(
+        key, _xml(code)) for key, code in sorted(workbook.formats.items())
+               if key not in BUILTIN_FORMATS]
+
+    # STEP 2: Fonts, BIFF8 font indexes skip number 4
+    fonts, font_ids = [], {}
+    for index, font in enumerate(workbook.fonts):
+        if font is None:
+            continue
+        font_ids[index] = len(fonts)
+        fonts.append(u''.join([
+            u'<font>',
+            u'<b/>' if font['bold'] else u'',
+            u'<i/>' if font['italic'] else u'',
+            u'<strike/>' if font['strike'] else u'',
+            u'<u val="{}"/>'.format(UNDERLINE[font['underline']])
+            if font['underline'] in UNDERLINE else u'',
+            u'<sz val="{}"/>'.format(font['size']),
+            _color(workbook, font['color'], u'color'),
+            u'<name val="{}"/>'.format(_xml(font['name'])),
+            u'</font>']))
+
+    if not fonts:
+        fonts.append(u'<font><sz val="10"/><name val="Arial"/></font>')
+
+    # STEP 3: Fills and borders, shared between the XFs which use them
+    fills = [u'<fill><patternFill patternType="none"/></fill>',
+             u'<fill><patternFill patternType="gray125"/></fill>']
+    borders = [u'<border><left/><right/><top/><bottom/><diagonal/></border>']
+    fill_ids, border_ids = {}, {}
+
+    xfs = []
+    for xf in workbook.xfs:
+        fill_id = 0
+        if 0 < xf['pattern'] < len(FILL_PATTERNS):
+            fill = u'<fill><patternFill patternType="{}">{}{}</patternFill>' \
+                   u'</fill>'.format(FILL_PATTERNS[xf['pattern']],
+                                     _color(workbook, xf['fill_color'],
+                                            u'fgColor'),
+                                     _color(workbook, xf['back_color'],
+                                            u'bgColor'))
+            fill_id = fill_ids.setdefault(fill, len(fills))
+            if fill_id == len(fills):
+                fills.append(fill)
+
+        border_id = 0
+        if any(xf['border']):
+            sides = []
+            for tag, style, color in zip((u'left', u'right', u'top',
+                                          u'bottom'), xf['border'],
+                                         xf['border_color']):
+                if style and style < len(BORDER_STYLES):
+                    sides.append(u'<{0} style="{1}">{2}</{0}>'.format(
+                        tag, BORDER_STYLES[style],
+                        _color(workbook, color, u'color')))
+                else:
+                    sides.append(u'<{}/>'.format(tag))
+            border = u'<border>' + u''.join(sides) + u'<diagonal/></border>'
+            border_id = border_ids.setdefault(border, len(borders))
+            if border_id == len(borders):
+                borders.append(border)
+
+        # STEP 4: The cell format itself
+        align = u''
+        horizontal = HORIZONTAL[xf['halign']]
+        vertical = VERTICAL[xf['valign']] if xf['valign'] < len(VERTICAL) \
+            else None
+        if horizontal or vertical or xf['wrap'] or xf['indent']:
+            align = u'<alignment{}{}{}{}/>'.format(
+                u' horizontal="{}"'.format(horizontal) if horizontal else u'',
+                u' vertical="{}"'.format(vertical) if vertical else u'',
+                u' wrapText="1"' if xf['wrap'] else u'',
+                u' indent="{}"'.format(xf['indent']) if xf['indent'] else u'')
+
+        xfs.append(u'<xf numFmtId="{}" fontId="{}" fillId="{}" borderId="{}" '
+                   u'xfId="0" applyNumberFormat="1" applyFont="1" '
+                   u'applyFill="1" applyBorder="1"{}>{}</xf>'.format(
+                       xf['format'], font_ids.get(xf['font'], 0), fill_id,
+                       border_id, u' applyAlignment="1"' if align else u'',
+                       align))
+
+    if not xfs:
+        xfs.append(u'<xf numFmtId="0" fontId="0" fillId="0" borderId="0" '
+                   u'xfId="0"/>')
+
+    # STEP 5: Join everything
+    parts = [XML_HEADER, u'<styleSheet xmlns="{}">'.format(NS_MAIN)]
+    if formats:
+        parts.append(u'<numFmts count="{}">{}</numFmts>'.format(
+            len(formats), u''.join(formats)))
+    parts.append(u'<fonts count="{}">{}</fonts>'.format(
+        len(fonts), u''.join(fonts)))
+    parts.append(u'<fills count="{}">{}</fills>'.format(
+        len(fills), u''.join(fills)))
+    parts.append(u'<borders count="{}">{}</borders>'.format(
+        len(borders), u''.join(borders)))
+    parts.append(u'<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" '
+                 u'fillId="0" borderId="0"/></cellStyleXfs>')
+    parts.append(u'<cellXfs count="{}">{}</cellXfs>'.format(
+        len(xfs), u''.join(xfs)))
+    parts.append(u'<cellStyles count="1"><cellStyle name="Normal" xfId="0" '
+                 u'builtinId="0"/></cellStyles>')
+    parts.append(u'</styleSheet>')
+
+    return u''.join(parts).encode('utf-8')
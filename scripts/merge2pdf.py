@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
 #pylint: disable=I0011,W0703,R0903
-""" Merge serveral PDF files into one file
+""" Converts several documents, workbooks and images to PDF and merges them
+into one file. Files of each kind are converted by a pool of converters into a
+temporary folder and all of them are merged at once by lib.pdfmerge, so no
+application is needed to merge them.
 """
 
 # --------------------------- REQUIRED LIBRARIES ------------------------------
 
 import argparse
 import os
-import win32com.client
+import shutil
+import tempfile
+
+from lib.batch import expand_paths
+from lib.cache import DEFAULT_SIZE, ConversionCache, default_folder
+from lib.converters import (BACKENDS, IMAGE, NATIVE, SPREADSHEET, TEXT,
+                            convert_files, default_backend)
+from lib.images import EXTENSIONS as IMAGE_EXTENSIONS
+from lib.pdfmerge import merge_pdfs
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Extensions of the files which can be merged, by document kind
+KINDS = {
+    TEXT: ('.doc', '.docx', '.odt', '.rtf'),
+    SPREADSHEET: ('.xls', '.xlsx', '.ods'),
+    IMAGE: IMAGE_EXTENSIONS,
+}
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -39,6 +60,10 @@ class App(object):
         self.author = None
         self.subject = None
         self.keywords = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
+        self.cache = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -52,7 +77,9 @@ class App(object):
                             help='Output file path')
 
         parser.add_argument('-f', '--files', nargs='+', type=str, metavar='files',
-                            help='Files will be converted and merged')
+                            help='Files will be converted and merged, in the '
+                            'given order, folders and glob patterns are also '
+                            'allowed')
 
         parser.add_argument('-t', '--title', type=str, metavar='title', default=u'',
                             help='Title will be used')
@@ -66,6 +93,28 @@ class App(object):
         parser.add_argument('-k', '--keywords', type=str, metavar='keywords', default=u'',
                             help='Keywords will be used')
 
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=BACKENDS, default=default_backend(),
+                            help='application used to convert documents and '
+                            'workbooks, images never need one')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
+
+        parser.add_argument('-c', '--cache', type=str, dest='cache',
+                            nargs='?', const=default_folder(), default=None,
+                            help='reuse the previous result of files which '
+                            'have not changed, an optional folder can be given')
+
+        parser.add_argument('--cache-size', type=int, dest='cache_size',
+                            default=DEFAULT_SIZE,
+                            help='maximum size of the cache folder in MB')
+
         args = parser.parse_args()
 
         self.abspath = os.path.abspath(args.file)
@@ -73,67 +122,97 @@ class App(object):
         self.dirname = os.path.dirname(self.abspath)
         self.filename = self.basename and os.path.splitext(self.basename)[0]
 
-        self.files = args.files
+        # Files given several times are merged several times
+        extensions = ('.pdf',) + sum(KINDS.values(), ())
+        self.files = expand_paths(args.files, extensions, unique=False)
 
         self.title = args.title
         self.author = args.author
         self.subject = args.subject
         self.keywords = args.keywords
 
-    def _mergepdf(self):
-        """ Performs the conversion from docx to pdf
-        """
-
-        new_path = os.path.join(self.dirname, self.filename+'.pdf')
-
-        try:
-
-            acrobat = win32com.client.Dispatch('Acroexch.app')
-            outdoc = None
-            pdout = None
-
-            for pdf_file in self.files:
-
-                abspath = os.path.abspath(pdf_file)
-                if os.path.isfile(abspath):
-
-                    if outdoc == None:
-                        outdoc = win32com.client.Dispatch('AcroExch.AVDoc')
-                        outdoc.open(abspath, '')
-                        pdout = outdoc.GetPDDoc()
-                    else:
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
 
-                        avdoc = win32com.client.Dispatch('AcroExch.AVDoc')
-                        avdoc.open(abspath, '')
-                        pddoc = avdoc.GetPDDoc()
+        if args.cache:
+            self.cache = ConversionCache(args.cache, args.cache_size)
 
-                        out_pages = pdout.GetNumPages()
-                        this_pages = pddoc.GetNumPages()
-
-                        pdout.InsertPages(out_pages - 1, pddoc, 0, this_pages, True)
-
-                        avdoc.Close(True)
+    def _convert(self, folder):
+        """ Converts the files which are not PDF documents into the given
+        folder and returns the list of PDF files will be merged, in the same
+        order as the given files. Files can not be converted are left out,
+        files given several times are converted just once.
+        """
 
-            if outdoc != None:
-                pdout.SetInfo('Title', self.title)
-                pdout.SetInfo('Author', self.author)
-                pdout.SetInfo('Subject', self.subject)
-                pdout.SetInfo('Keywords', self.keywords)
+        converted, unique, seen = {}, [], set()
+        for abspath in self.files:
+            if abspath not in seen:
+                seen.add(abspath)
+                unique.append(abspath)
+
+        for kind, extensions in sorted(KINDS.items()):
+            files = [abspath for abspath in unique
+                     if os.path.splitext(abspath)[1].lower() in extensions]
+            if not files:
+                continue
+
+            backend = default_backend(kind, 'pdf') if kind == IMAGE \
+                else self.backend
+            jobs = 1 if backend == NATIVE else self.jobs
+
+            batch = convert_files(files, backend, kind, 'pdf', jobs,
+                                  self.timeout, self.cache, folder=folder,
+                                  quiet=True)
+
+            for abspath, error, _, output, _ in batch.results:
+                if error:
+                    print u'{} [FAILED] {}'.format(
+                        abspath.decode('utf-8', 'ignore'), error)
+                else:
+                    converted[abspath] = output
+
+        paths = []
+        for abspath in self.files:
+            if abspath.lower().endswith('.pdf'):
+                paths.append(abspath)
+            elif abspath in converted:
+                paths.append(converted[abspath])
+            elif not any([abspath.lower().endswith(extension)
+                          for extension in sum(KINDS.values(), ())]):
+                print u'{} [FAILED] Unknown file format'.format(
+                    abspath.decode('utf-8', 'ignore'))
+
+        return paths
+
+    def _merge2pdf(self):
+        """ Performs the conversion of every file and merges the results
+        """
 
-                pdout.SetPageMode(1) # One page
+        new_path = os.path.join(self.dirname, self.filename+'.pdf')
+        folder = tempfile.mkdtemp(prefix='merge2pdf-')
 
-                pdout.Save(1, self.abspath)
+        try:
+            paths = self._convert(folder)
+            if not paths:
+                raise ValueError(u'There are no files to merge')
 
-                outdoc.SetTitle(self.title)
-                outdoc.Close(True)
+            metadata = {
+                u'/Title': self.title,
+                u'/Author': self.author,
+                u'/Subject': self.subject,
+                u'/Keywords': self.keywords
+            }
 
-            acrobat.Exit()
+            merge_pdfs(paths, self.abspath, metadata)
 
         except Exception as ex:
             print ex
         else:
             str_new_path = new_path.decode('utf-8', 'ignore')
             print u'New file %s has been written.' % str_new_path
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -141,9 +220,10 @@ class App(object):
         """
 
         self._argparse()
-        self._mergepdf()
+        self._merge2pdf()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
@@ -8,7 +8,12 @@
 import argparse
 import os
 
-from PyPDF2 import PdfFileMerger, PdfFileReader
+from lib.cache import DEFAULT_SIZE, ConversionCache, default_folder
+from lib.pdfmerge import StreamingMerger, split_selection
+from lib.pdflinear import linearize_pdf
+from lib.pdfoptimize import DEFAULT_LEVEL, optimize_pdf
+from lib.pdftext import find_headings
+from lib.pdfupdate import set_info
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -40,6 +45,11 @@ class App(object):
         self.author = None
         self.subject = None
         self.keywords = None
+        self.incremental = None
+        self.level = None
+        self.linearize = None
+        self.toc = None
+        self.cache = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -54,7 +64,10 @@ class App(object):
 
 
         parser.add_argument('-f', '--files', nargs='+', type=str, metavar='files',
-                            help='PDF files will be merged')
+                            help='PDF files will be merged, some pages can be '
+                            'chosen like book.pdf:3-10,z where z is the last '
+                            'page and r2 the one before it, ranges can go '
+                            'backwards')
 
         parser.add_argument('-t', '--title', type=str, metavar='title', default=u'',
                             help='Title will be used')
@@ -68,8 +81,57 @@ class App(object):
         parser.add_argument('-k', '--keywords', type=str, metavar='keywords', default=u'',
                             help='Keywords will be used')
 
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            dest='incremental',
+                            help='only set the metadata of just one file, it '
+                            'is kept as it is and the changes are appended as '
+                            'an incremental update, the output can be the '
+                            'input itself')
+
+        parser.add_argument('-z', '--optimize', action='store_true',
+                            dest='optimize',
+                            help='join and compress again the content '
+                            'streams of each page and pack the other objects '
+                            'in object streams, it reports the size before '
+                            'and after it')
+
+        parser.add_argument('--level', type=int, dest='level',
+                            choices=range(1, 10), default=DEFAULT_LEVEL,
+                            help='compression level used by --optimize')
+
+        parser.add_argument('--linearize', action='store_true',
+                            dest='linearize',
+                            help='write a linearized file, also known as '
+                            'fast web view, so viewers show the first page '
+                            'before the whole file has been downloaded')
+
+        parser.add_argument('--toc', action='store_true', dest='toc',
+                            help='add a bookmark for each file, with its own '
+                            'bookmarks or, when it has none, the headings '
+                            'found in its pages')
+
+        parser.add_argument('-c', '--cache', type=str, dest='cache',
+                            nargs='?', const=default_folder(), default=None,
+                            help='reuse the headings found before in files '
+                            'which have not changed, an optional folder can '
+                            'be given')
+
+        parser.add_argument('--cache-size', type=int, dest='cache_size',
+                            default=DEFAULT_SIZE,
+                            help='maximum size of the cache folder in MB')
+
         args = parser.parse_args()
 
+        if args.incremental and (len(args.files or []) != 1 or
+                                 split_selection(args.files[0])[1]):
+            parser.error(u'--incremental needs just one whole file')
+
+        if (args.optimize or args.linearize or args.toc) and \
+                args.incremental:
+            parser.error(u'--optimize, --linearize and --toc write the whole '
+                         u'file again, they can not be used with '
+                         u'--incremental')
+
         self.abspath = os.path.abspath(args.file)
         self.basename = os.path.basename(self.abspath)
         self.dirname = os.path.dirname(self.abspath)
@@ -81,33 +143,35 @@ class App(object):
         self.author = args.author
         self.subject = args.subject
         self.keywords = args.keywords
+        self.incremental = args.incremental
+        self.level = args.level if args.optimize else None
+        self.linearize = args.linearize
+        self.toc = args.toc
+
+        if args.cache:
+            self.cache = ConversionCache(args.cache, args.cache_size)
 
     def _mergepdf(self):
-        """ Performs the conversion from docx to pdf
+        """ Performs the merge, or just sets the metadata of one file as an
+        incremental update, see lib.pdfupdate
         """
 
         new_path = os.path.join(self.dirname, self.filename+'.pdf')
 
-        try:
-
-            merger = PdfFileMerger()
-
-            for fname in self.files:
-                print fname
-                fpath = os.path.abspath(fname)
-                ffile = PdfFileReader(open(fpath, 'rb'))
-                merger.append(ffile)
-
-            metadata = {
-                u'/Title': self.title,
-                u'/Author': self.author,
-                u'/Subject': self.subject,
-                u'/Keywords': self.keywords
-            }
+        metadata = {
+            u'/Title': self.title,
+            u'/Author': self.author,
+            u'/Subject': self.subject,
+            u'/Keywords': self.keywords
+        }
 
-            merger.addMetadata(metadata)
+        try:
 
-            merger.write(self.abspath)
+            if self.incremental:
+                set_info(os.path.abspath(self.files[0]), self.abspath,
+                         metadata)
+            else:
+                self._merge(metadata)
 
         except Exception as ex:
             print ex
@@ -115,6 +179,50 @@ class App(object):
             str_new_path = new_path.decode('utf-8', 'ignore')
             print u'New file %s has been written.' % str_new_path
 
+    def _merge(self, metadata):
+        """ Copies every file to the output and closes it before the next
+        one is read, see lib.pdfmerge
+        """
+
+        merger = StreamingMerger(self.abspath)
+
+        try:
+            for fname in self.files:
+                print fname
+                path, selection = split_selection(fname)
+                path = os.path.abspath(path)
+                headings = find_headings(path, self.cache) if self.toc \
+                    else None
+                merger.append(path, selection=selection, headings=headings)
+
+            merger.add_metadata(metadata)
+
+            merger.close()
+
+            if merger.shared_objects:
+                print u'{} repeated objects ({:.1f} KB) have been ' \
+                      u'written once.'.format(merger.shared_objects,
+                                              merger.shared_bytes / 1024.0)
+
+        except BaseException:
+            merger.abort()
+            raise
+
+        finally:
+            if self.cache is not None:
+                self.cache.evict()
+
+        if self.level is not None:
+            before, after = optimize_pdf(self.abspath, self.abspath,
+                                         self.level)
+            print u'Optimized from {} to {} bytes ({:.1f}% smaller).'.format(
+                before, after, 100.0 * (before - after) / (before or 1))
+
+        if self.linearize:
+            linearize_pdf(self.abspath, self.abspath)
+            print u'Linearized for fast web view ({} bytes).'.format(
+                os.path.getsize(self.abspath))
+
     def main(self):
         """ The main application behavior, this method should be used to
         start the application.
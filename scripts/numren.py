@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-#pylint: disable=I0011
+#pylint: disable=I0011,W0703
 """ Renames files with a counter
 """
 
@@ -8,6 +8,15 @@
 import argparse
 import os
 import re
+import sys
+
+from lib.renames import RenamePlan, list_files, read_plan
+
+
+# -------------------------------- CONSTANTS ----------------------------------
+
+# Journal of the last renames, in the folder of the files
+JOURNAL = '.numren.json'
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
 
@@ -34,6 +43,9 @@ class App(object):
         self._digits = None
         self._regex = None
         self._start = None
+        self._dry_run = None
+        self._journal = None
+        self._undo = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -63,40 +75,94 @@ class App(object):
 
         parser.add_argument('-r', '--regex', type=str,
                             dest='regex', default='.*',
-                            help='Folder to choose a random file')
+                            help='Regular expression the names of the files '
+                            'must match')
 
         parser.add_argument('-s', '--start', type=int,
                             dest='start', default=1,
                             help='First value for counter')
 
+        parser.add_argument('-n', '--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only show the new names, nothing is '
+                            'renamed')
+
+        parser.add_argument('-j', '--journal', type=str,
+                            dest='journal', default=None,
+                            help='file where the renames are saved to undo '
+                            'them, {} in the folder by default'.format(JOURNAL))
+
+        parser.add_argument('-u', '--undo', action='store_true',
+                            dest='undo',
+                            help='give back their names to the files renamed '
+                            'the last time, as the journal says')
+
         args = parser.parse_args()
 
+        try:
+            self._regex = re.compile(args.regex)
+        except re.error as ex:
+            parser.error(u'Wrong regular expression {} ({})'.format(
+                args.regex, ex))
+
         self._path = os.path.abspath(args.folder)
         self._prefix = args.prefix
         self._digits = args.digits
-        self._regex = args.regex
         self._start = args.start
+        self._dry_run = args.dry_run
+        self._undo = args.undo
+        self._journal = os.path.abspath(
+            args.journal or os.path.join(self._path, JOURNAL))
+
+    def _plan(self):
+        """ Returns the renames, every file matching the regular expression
+        in natural order gets the next value of the counter, see lib.renames
+        """
+
+        # The journal must not be renamed if it matches the expression
+        exclude = [os.path.basename(self._journal)] \
+            if os.path.dirname(self._journal) == self._path else []
+
+        renames = []
+        names = list_files(self._path, self._regex, exclude)
+
+        for counter, filename in enumerate(names, self._start):
+            ext = os.path.splitext(filename)[1]
+            strn = str(counter).zfill(self._digits)
+            new_name = '{}{}{}'.format(self._prefix, strn, ext)
+            renames.append((os.path.join(self._path, filename),
+                            os.path.join(self._path, new_name)))
+
+        return RenamePlan(renames)
 
 
     def _rename(self):
-        """ Renames the file
+        """ Renames the files, or the ones in the journal back to their old
+        names, and shows the renames
         """
 
         try:
 
-            files = os.listdir(self._path)
-            files = [f for f in files if bool(re.match(self._regex, f))]
+            if self._undo:
+                plan = read_plan(self._journal).reverse()
+            else:
+                plan = self._plan()
+
+            lines = [u'{} ===> {}\n'.format(_unicode(os.path.basename(old)),
+                                            _unicode(os.path.basename(new)))
+                     for old, new in plan.renames]
+            sys.stdout.write(u''.join(lines).encode('utf-8'))
+
+            if self._dry_run:
+                plan.check()
+                return
+
+            plan.apply()
 
-            counter = self._start
-            for filename in files:
-                filepath = os.path.join(self._path, filename)
-                if os.path.isfile(filepath):
-                    ext = os.path.splitext(filename)[1]
-                    strn = str(counter).zfill(self._digits)
-                    new_name = u'{}{}{}'.format(self._prefix, strn, ext)
-                    print u'{} ===> {}'.format(filename, new_name)
-                    os.rename(filepath, new_name)
-                    counter = counter + 1
+            if self._undo:
+                os.remove(self._journal)
+            elif plan.renames:
+                plan.write(self._journal)
 
         except Exception as ex:
             print ex
@@ -111,6 +177,16 @@ class App(object):
         self._rename()
 
 
+def _unicode(path):
+    """ Return the given path as unicode text to be printed
+    """
+
+    if isinstance(path, unicode):
+        return path
+
+    return path.decode('utf-8', 'replace')
+
+
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
 App().main()
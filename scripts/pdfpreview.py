@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#pylint: disable=I0011,W0703,R0903
+""" Writes a thumbnail of every page of a PDF file and a contact sheet
+"""
+
+# --------------------------- REQUIRED LIBRARIES ------------------------------
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from lib.cache import DEFAULT_SIZE, ConversionCache, default_folder
+from lib.thumbnails import (CONTACT_SHEET, DEFAULT_DPI, RENDERERS,
+                            render_thumbnails, write_contact_sheet)
+
+
+# -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
+
+
+class App(object):
+    """ Application main controller, this class has been defined following the
+    singleton pattern to ensures only one object can be instantiated.
+    """
+
+    __instance = None
+
+    def __new__(cls):
+        """ Prevent multiple instances from self (Singleton Pattern)
+        """
+
+        if cls.__instance == None:
+            cls.__instance = object.__new__(cls)
+            cls.__instance.name = "The one"
+        return cls.__instance
+
+    def __init__(self):
+        self.abspath = None
+        self.folder = None
+        self.jobs = None
+        self.dpi = None
+        self.renderer = None
+        self.cache = None
+
+    def _argparse(self):
+        """ Detines an user-friendly command-line interface and proccess its
+        arguments.
+        """
+
+        description = u'Writes a thumbnail of every page of a PDF file and ' \
+                      u'a contact sheet'
+
+        parser = argparse.ArgumentParser(description)
+        parser.add_argument('file', metavar='file', type=str,
+                            help='PDF file path')
+
+        parser.add_argument('-o', '--output', type=str, dest='output',
+                            default=None,
+                            help='folder of the thumbnails and the contact '
+                            'sheet, the name of the file followed by '
+                            '_thumbnails by default')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs',
+                            default=multiprocessing.cpu_count(),
+                            help='number of renderers running in parallel, '
+                            'one for each CPU by default')
+
+        parser.add_argument('--dpi', type=int, dest='dpi',
+                            default=DEFAULT_DPI,
+                            help='resolution of the thumbnails')
+
+        parser.add_argument('--renderer', type=str, dest='renderer',
+                            choices=RENDERERS, default=None,
+                            help='program used to render the pages, the '
+                            'first one found by default')
+
+        parser.add_argument('-c', '--cache', type=str, dest='cache',
+                            nargs='?', const=default_folder(), default=None,
+                            help='reuse the thumbnails of pages which have '
+                            'not changed, an optional folder can be given')
+
+        parser.add_argument('--cache-size', type=int, dest='cache_size',
+                            default=DEFAULT_SIZE,
+                            help='maximum size of the cache folder in MB')
+
+        args = parser.parse_args()
+
+        if args.dpi < 1 or args.jobs < 1:
+            parser.error(u'--dpi and --jobs must be positive')
+
+        self.abspath = os.path.abspath(args.file)
+        self.folder = os.path.abspath(
+            args.output or os.path.splitext(self.abspath)[0] + '_thumbnails')
+
+        self.jobs = args.jobs
+        self.dpi = args.dpi
+        self.renderer = args.renderer
+
+        if args.cache:
+            self.cache = ConversionCache(args.cache, args.cache_size)
+
+    def _preview(self):
+        """ Renders the pages which are not cached, see lib.thumbnails, and
+        writes the contact sheet.
+        """
+
+        started = time.time()
+
+        try:
+            results = render_thumbnails(self.abspath, self.folder, self.jobs,
+                                        self.dpi, self.cache, self.renderer)
+            new_path = write_contact_sheet(
+                self.abspath, results, os.path.join(self.folder,
+                                                    CONTACT_SHEET))
+        except Exception as ex:
+            print ex
+            return
+        finally:
+            if self.cache is not None:
+                self.cache.evict()
+
+        failed = [item for item in results if item[2]]
+        cached = len([item for item in results if item[3]])
+
+        for number, _, error, _ in failed:
+            print u'Page {} [FAILED] {}'.format(number, error)
+
+        print u'{} pages, {} rendered, {} taken from cache, {} failed in ' \
+              u'{:.2f} seconds.'.format(len(results),
+                                        len(results) - cached - len(failed),
+                                        cached, len(failed),
+                                        time.time() - started)
+
+        str_new_path = new_path.decode('utf-8', 'ignore')
+        print u'New file %s has been written.' % str_new_path
+
+    def main(self):
+        """ The main application behavior, this method should be used to
+        start the application.
+        """
+
+        self._argparse()
+        self._preview()
+
+
+# --------------------------- SCRIPT ENTRY POINT ------------------------------
+
+if __name__ == '__main__':
+    App().main()
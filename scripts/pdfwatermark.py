@@ -7,12 +7,10 @@
 
 import argparse
 import os
-import copy
 
-from PyPDF2 import PdfFileWriter, PdfFileReader
-from reportlab.pdfgen import canvas
-import StringIO
-from reportlab.lib.units import cm
+from lib.batch import Batch
+from lib.pdfoptimize import DEFAULT_LEVEL
+from lib.watermark import read_recipients, recipient_path, write_copies
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
 
@@ -37,6 +35,12 @@ class App(object):
         self.input_file = None
         self.watermark_file = None
         self.output_file = None
+        self.text = None
+        self.recipients = None
+        self.jobs = None
+        self.incremental = None
+        self.level = None
+        self.linearize = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -53,54 +57,121 @@ class App(object):
                             help='Watermark PDF file path')
 
         parser.add_argument('output', metavar='output', type=str,
-                            help='Output PDF file path')
-
+                            help='Output PDF file path, with a recipients '
+                            'file it is a template like exam-{name}.pdf')
+
+        parser.add_argument('-t', '--text', type=str, dest='text',
+                            default='Hello world',
+                            help='text stamped on every page, with a '
+                            'recipients file it is a template like {name}')
+
+        parser.add_argument('-r', '--recipients', type=str, dest='recipients',
+                            default=None,
+                            help='CSV file with one recipient per row and the '
+                            'names of the columns in the first one, a copy is '
+                            'written for each recipient')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of copies written in parallel')
+
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            dest='incremental',
+                            help='keep the input as it is and append the '
+                            'stamped pages as an incremental update, the '
+                            'output can be the input itself')
+
+        parser.add_argument('-z', '--optimize', action='store_true',
+                            dest='optimize',
+                            help='join and compress again the content '
+                            'streams of each page and pack the other objects '
+                            'in object streams, it reports the size before '
+                            'and after it')
+
+        parser.add_argument('--level', type=int, dest='level',
+                            choices=range(1, 10), default=DEFAULT_LEVEL,
+                            help='compression level used by --optimize')
+
+        parser.add_argument('--linearize', action='store_true',
+                            dest='linearize',
+                            help='write a linearized file, also known as '
+                            'fast web view, so viewers show the first page '
+                            'before the whole file has been downloaded')
 
         args = parser.parse_args()
 
+        if (args.optimize or args.linearize) and args.incremental:
+            parser.error(u'--optimize and --linearize write the whole file '
+                         u'again, they can not be used with --incremental')
+
         self.input_file = args.input
         self.watermark_file = args.watermark
         self.output_file = args.output
-
-    def _mergepdf(self):
-        """ Performs the conversion from docx to pdf
+        self.text = args.text.decode('utf-8', 'ignore')
+        self.jobs = args.jobs
+        self.incremental = args.incremental
+        self.level = args.level if args.optimize else None
+        self.linearize = args.linearize
+
+        if args.recipients:
+            self.recipients = read_recipients(args.recipients)
+            self._check_templates(parser)
+
+    def _check_templates(self, parser):
+        """ Ensures the templates only use columns of the recipients file and
+        that each recipient gets its own output file.
         """
 
-        try:
-
-            wpath = os.path.abspath(self.watermark_file)
-            wpdf = PdfFileReader(open(wpath, 'rb'))
-            watermark = wpdf.getPage(0)
+        paths = set()
 
-            opath = os.path.abspath(self.output_file)
-            output = PdfFileWriter()
+        for row in self.recipients:
+            try:
+                self.text.format(**row)
+                path = recipient_path(self.output_file, row)
+            except (KeyError, IndexError, ValueError) as ex:
+                parser.error(u'Wrong template, the columns are: {} ({})'
+                             .format(u', '.join(sorted(row)), ex))
 
-            ipath = os.path.abspath(self.input_file)
-            ipdf = PdfFileReader(open(ipath, 'rb'))
+            if path in paths:
+                parser.error(u'Several recipients would be written in {}'
+                             .format(path.decode('utf-8', 'ignore')))
+            paths.add(path)
 
-            for i in xrange(ipdf.getNumPages()):
-                print ipdf.getPage(i).getContents()
-                page = copy.copy(watermark)
-                page.mergePage(ipdf.getPage(i))
+    def _mergepdf(self):
+        """ Performs the watermark, the input is parsed once and the stamps
+        are shared by every page, see lib.watermark
+        """
 
-                packet = StringIO.StringIO()
-                can = canvas.Canvas(packet)
-                can.setFont("Helvetica", 30)
-                can.drawString(2.2*cm, 1.2*cm-30, "Hello world")
-                can.save()
-                packet.seek(0)
-                new_pdf = PdfFileReader(packet)
-                page.mergePage(new_pdf.getPage(0))
+        wpath = os.path.abspath(self.watermark_file)
+        ipath = os.path.abspath(self.input_file)
 
-                output.addPage(page)
+        if self.recipients is None:
+            tasks = [(os.path.abspath(self.output_file), self.text)]
+        else:
+            tasks = [(recipient_path(self.output_file, row),
+                      self.text.format(**row)) for row in self.recipients]
 
-            with open(opath, 'wb') as fout:
-                output.write(fout)
+        sizes = {}
 
+        try:
+            batch = write_copies(ipath, wpath, tasks, self.jobs,
+                                 Batch(quiet=self.recipients is None),
+                                 self.incremental, self.level, sizes,
+                                 self.linearize)
         except Exception as ex:
             print ex
-        else:
-            print u'The file has been watermarked'
+            return
+
+        if self.recipients is None:
+            error = batch.results[0][1]
+            print error if error else u'The file has been watermarked'
+        elif len(batch.results) > 1 or batch.failed:
+            batch.summary()
+
+        if sizes:
+            before = sum([size[0] for size in sizes.values()])
+            after = sum([size[1] for size in sizes.values()])
+            print u'Optimized from {} to {} bytes ({:.1f}% smaller).'.format(
+                before, after, 100.0 * (before - after) / (before or 1))
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -113,4 +184,5 @@ class App(object):
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-#pylint: disable=I0011
+#pylint: disable=I0011,W0703
 """ Choose random file
 """
 
@@ -10,6 +10,8 @@ import os
 import re
 import random
 
+from lib.sampling import WEIGHTS, ChoiceState, iter_files, sample_files
+
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
 
 
@@ -32,6 +34,12 @@ class App(object):
     def __init__(self):
         self._path = None
         self._regex = None
+        self._count = None
+        self._recursive = None
+        self._weight = None
+        self._seed = None
+        self._state = None
+        self._skip = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -54,28 +62,107 @@ class App(object):
 
         parser.add_argument('-r', '--regex', type=str,
                             dest='regex', default='.*',
-                            help='Folder to choose a random file')
+                            help='Regular expression the names of the files '
+                            'must match')
+
+        parser.add_argument('-k', '--count', type=int,
+                            dest='count', default=1,
+                            help='Number of files to choose')
+
+        parser.add_argument('-R', '--recursive', action='store_true',
+                            dest='recursive',
+                            help='Choose among the files of the subfolders too')
+
+        parser.add_argument('-w', '--weight', type=str,
+                            dest='weight', choices=WEIGHTS, default=None,
+                            help='Larger, or older, files are more likely '
+                            'to be chosen')
+
+        parser.add_argument('-s', '--seed', type=int,
+                            dest='seed', default=None,
+                            help='Seed of the random generator, the same '
+                            'seed chooses the same files')
+
+        parser.add_argument('--state', type=str,
+                            dest='state', default=None,
+                            help='File where the chosen files are kept, they '
+                            'are not chosen again until every file has been '
+                            'chosen')
 
         args = parser.parse_args()
 
+        if args.count < 1:
+            parser.error(u'--count must be positive')
+
+        try:
+            self._regex = re.compile(args.regex)
+        except re.error as ex:
+            parser.error(u'Wrong regular expression {} ({})'.format(
+                args.regex, ex))
+
         self._path = os.path.abspath(args.path)
-        self._regex = args.regex
+        self._count = args.count
+        self._recursive = args.recursive
+        self._weight = args.weight
+        self._seed = args.seed
+        self._state = ChoiceState(args.state) if args.state else None
+
+        # The state file must not be chosen if it is in the folder
+        self._skip = set()
+        if args.state:
+            state = os.path.abspath(args.state)
+            if state.startswith(os.path.join(self._path, '')):
+                name = os.path.relpath(state, self._path)
+                self._skip.update([name, name + '.tmp'])
 
 
     def _random_choice(self):
-        """ Main method docstring
+        """ Chooses the files in just one pass over the folder, keeping only
+        the chosen ones in memory, see lib.sampling
         """
 
+        rng = random.Random(self._seed)
+
         try:
-            files = os.listdir(self._path)
-            files = [f for f in files if bool(re.match(self._regex, f))]
+            result = self._sample(rng)
+            if self._state is not None and len(result) < self._count and \
+                    self._state.chosen:
+                # Every file has been chosen, start again without the ones
+                # chosen by the last run, unless there are not enough others
+                self._state.reset()
+                result += self._sample(rng, set(result))
+                if len(result) < self._count and self._state.chosen:
+                    self._state.reset(keep_last=False)
+                    result += self._sample(rng, set(result))
+
+            if self._state is not None:
+                self._state.add(result)
+                self._state.save()
+
         except Exception as ex:
             print ex
         else:
-            result = random.sample(files, 1)
-            if result and len(result) > 0:
+            if result:
                 os.environ["RCHOICE"] = result[0]
-                print result[0]
+            for name in result:
+                print name
+
+    def _sample(self, rng, chosen=None):
+        """ Returns the names, relative to the folder, of the files chosen
+        among the ones which have not been chosen before
+        """
+
+        start = len(os.path.join(self._path, ''))
+        files = ((path[start:], stat) for path, stat in
+                 iter_files(self._path, self._regex, self._recursive,
+                            self._weight is not None)
+                 if path[start:] not in (chosen or ()) and
+                 path[start:] not in self._skip)
+
+        exclude = self._state.chosen if self._state is not None else None
+        count = self._count - len(chosen or ())
+
+        return sample_files(files, count, self._weight, rng, exclude)
 
     def main(self):
         """ The main application behavior, this method should be used to
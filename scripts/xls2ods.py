@@ -6,8 +6,10 @@
 # --------------------------- REQUIRED LIBRARIES ------------------------------
 
 import argparse
-import os
-import win32com.client
+
+from lib.batch import expand_paths
+from lib.converters import SPREADSHEET, backends_for, convert_files, \
+    default_backend
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -30,10 +32,10 @@ class App(object):
         return cls.__instance
 
     def __init__(self):
-        self.abspath = None
-        self.basename = None
-        self.dirname = None
-        self.filename = None
+        self.files = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -43,41 +45,43 @@ class App(object):
         description = u'Convert a Microsoft Excel format to Open Document.'
 
         parser = argparse.ArgumentParser(description)
-        parser.add_argument('file', metavar='file', type=str,
-                            help='path of the .xls file will be converted')
+        parser.add_argument('file', metavar='file', type=str, nargs='*',
+                            help='path of the .xls file will be converted, '
+                            'folders and glob patterns are also allowed')
+
+        parser.add_argument('-l', '--list', type=str, dest='listfile',
+                            metavar='listfile', default=None,
+                            help='text file with one path to convert per line')
+
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=backends_for(SPREADSHEET, 'ods'),
+                            default=default_backend(SPREADSHEET, 'ods'),
+                            help='application used to convert the files')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
 
         args = parser.parse_args()
 
-        self.abspath = os.path.abspath(args.file)
-        self.basename = os.path.basename(self.abspath)
-        self.dirname = os.path.dirname(self.abspath)
-        self.filename = self.basename and os.path.splitext(self.basename)[0]
+        self.files = expand_paths(args.file, ('.xls', '.xlsx'), args.listfile)
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
 
     def _xls2ods(self):
         """ Performs the conversion from Excel to OpenDocument
         """
 
-        new_path = os.path.join(self.dirname, self.filename+'.ods')
-
         try:
-
-            excel_app = win32com.client.gencache.EnsureDispatch('Excel.Application')
-            workbook = excel_app.Workbooks.Open(self.abspath)
-
-            workbook.SaveAs(new_path, FileFormat=60)
-
-            workbook.Close()
-            excel_app.Application.Quit()
-
+            convert_files(self.files, self.backend, SPREADSHEET, 'ods',
+                          self.jobs, self.timeout)
         except Exception as ex:
             print ex
-        else:
-            print u'New file %s has been written.' % new_path
-
-    def _is_file(self):
-        """ Check if given path is a valid file path
-        """
-        return os.path.isfile(self.abspath)
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -85,10 +89,11 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
+        if self.files:
             self._xls2ods()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
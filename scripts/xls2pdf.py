@@ -6,10 +6,11 @@
 
 # --------------------------- REQUIRED LIBRARIES ------------------------------
 
-
 import argparse
-import os
-import win32com.client
+
+from lib.batch import expand_paths
+from lib.cache import DEFAULT_SIZE, ConversionCache, default_folder
+from lib.converters import BACKENDS, SPREADSHEET, convert_files, default_backend
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -32,10 +33,14 @@ class App(object):
         return cls.__instance
 
     def __init__(self):
-        self.abspath = None
-        self.basename = None
-        self.dirname = None
-        self.filename = None
+        self.files = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
+        self.cache = None
+        self.sheets = None
+        self.ranges = None
+        self.split = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -45,42 +50,74 @@ class App(object):
         description = u'Convert a Microsoft Excel XLX format to XLSX document.'
 
         parser = argparse.ArgumentParser(description)
-        parser.add_argument('file', metavar='file', type=str,
-                            help='path of the .xls file will be converted')
+        parser.add_argument('file', metavar='file', type=str, nargs='*',
+                            help='path of the .xls file will be converted, '
+                            'folders and glob patterns are also allowed')
+
+        parser.add_argument('-l', '--list', type=str, dest='listfile',
+                            metavar='listfile', default=None,
+                            help='text file with one path to convert per line')
+
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=BACKENDS, default=default_backend(),
+                            help='application used to convert the files')
+
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
+
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
+
+        parser.add_argument('-c', '--cache', type=str, dest='cache',
+                            nargs='?', const=default_folder(), default=None,
+                            help='reuse the previous result of files which '
+                            'have not changed, an optional folder can be given')
+
+        parser.add_argument('--cache-size', type=int, dest='cache_size',
+                            default=DEFAULT_SIZE,
+                            help='maximum size of the cache folder in MB')
+
+        parser.add_argument('-s', '--sheets', type=str, dest='sheets',
+                            action='append', metavar='sheet', default=None,
+                            help='name or position of a sheet will be '
+                            'exported, it can be given several times, all '
+                            'of them by default')
+
+        parser.add_argument('-r', '--ranges', type=str, dest='ranges',
+                            action='append', metavar='range', default=None,
+                            help='named range will be exported in its own '
+                            'pages, it can be given several times')
+
+        parser.add_argument('--split', action='store_true', dest='split',
+                            help='render each sheet on its own, in parallel '
+                            'when used with -j, and join the results')
 
         args = parser.parse_args()
 
-        self.abspath = os.path.abspath(args.file)
-        self.basename = os.path.basename(self.abspath)
-        self.dirname = os.path.dirname(self.abspath)
-        self.filename = self.basename and os.path.splitext(self.basename)[0]
+        self.files = expand_paths(args.file, ('.xls', '.xlsx'), args.listfile)
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
+        self.sheets = args.sheets
+        self.ranges = args.ranges
+        self.split = args.split
+
+        if args.cache:
+            self.cache = ConversionCache(args.cache, args.cache_size)
 
     def _xls2xlsx(self):
-        """ Performs the conversion from xls to xlsx
+        """ Performs the conversion from xls to pdf
         """
 
-        new_path = os.path.join(self.dirname, self.filename+'.pdf')
-
         try:
-
-            excel_app = win32com.client.gencache.EnsureDispatch('Excel.Application')
-            workbook = excel_app.Workbooks.Open(self.abspath, ReadOnly=1)
-
-            workbook.Sheets.Select()
-            workbook.ActiveSheet.ExportAsFixedFormat(Type=0, Filename=new_path)
-
-            workbook.Close()
-            excel_app.Application.Quit()
-
+            options = {'sheets': self.sheets, 'ranges': self.ranges}
+            convert_files(self.files, self.backend, SPREADSHEET, 'pdf',
+                          self.jobs, self.timeout, self.cache, options,
+                          self.split)
         except Exception as ex:
             print ex
-        else:
-            print u'New file %s has been written.' % new_path
-
-    def _is_file(self):
-        """ Check if given path is a valid file path
-        """
-        return os.path.isfile(self.abspath)
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -88,10 +125,11 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
+        if self.files:
             self._xls2xlsx()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()
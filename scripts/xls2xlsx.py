@@ -7,7 +7,11 @@
 
 import argparse
 import os
-import win32com.client
+
+from lib.batch import expand_paths
+from lib.converters import SPREADSHEET, backends_for, convert_files, \
+    default_backend
+from lib.watch import watch_folders
 
 
 # -------------------------- MAIN SCRIPT BEHAVIOR -----------------------------
@@ -30,10 +34,12 @@ class App(object):
         return cls.__instance
 
     def __init__(self):
-        self.abspath = None
-        self.basename = None
-        self.dirname = None
-        self.filename = None
+        self.files = None
+        self.backend = None
+        self.jobs = None
+        self.timeout = None
+        self.folders = None
+        self.delay = None
 
     def _argparse(self):
         """ Detines an user-friendly command-line interface and proccess its
@@ -43,41 +49,69 @@ class App(object):
         description = u'Convert a Microsoft Excel XLX format to XLSX document.'
 
         parser = argparse.ArgumentParser(description)
-        parser.add_argument(u'file', metavar=u'file', type=str,
-                            help=u'path of the .xls file will be converted')
+        parser.add_argument('file', metavar='file', type=str, nargs='*',
+                            help='path of the .xls file will be converted, '
+                            'folders and glob patterns are also allowed')
 
-        args = parser.parse_args()
+        parser.add_argument('-l', '--list', type=str, dest='listfile',
+                            metavar='listfile', default=None,
+                            help='text file with one path to convert per line')
 
-        self.abspath = os.path.abspath(args.file)
-        self.basename = os.path.basename(self.abspath)
-        self.dirname = os.path.dirname(self.abspath)
-        self.filename = self.basename and os.path.splitext(self.basename)[0]
+        parser.add_argument('-b', '--backend', type=str, dest='backend',
+                            choices=backends_for(SPREADSHEET, 'xlsx'),
+                            default=default_backend(SPREADSHEET, 'xlsx'),
+                            help='application used to convert the files')
 
-    def _xls2xlsx(self):
-        """ Performs the conversion from xls to xlsx
-        """
+        parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                            help='number of converters running in parallel')
 
-        new_path = os.path.join(self.dirname, self.filename+'.xlsx')
+        parser.add_argument('-t', '--timeout', type=int, dest='timeout',
+                            default=300,
+                            help='seconds a parallel converter can spend in '
+                            'one file before it is restarted')
 
-        try:
+        parser.add_argument('-w', '--watch', action='store_true', dest='watch',
+                            help='keep watching the given folders converting '
+                            'new and changed files')
+
+        parser.add_argument('--delay', type=float, dest='delay', default=0.5,
+                            help='seconds a watched file must not change '
+                            'before it is converted')
 
-            excel_app = win32com.client.gencache.EnsureDispatch(u'Excel.Application')
-            workbook = excel_app.Workbooks.Open(self.abspath)
+        args = parser.parse_args()
 
-            workbook.SaveAs(new_path, FileFormat=51)
+        if args.watch:
+            self.folders = args.file or ['.']
+            self.delay = args.delay
+            missing = [path for path in self.folders if not os.path.isdir(path)]
+            if missing:
+                parser.error(u'--watch needs existing folders: {}'.format(
+                    ', '.join(missing).decode('utf-8', 'replace')))
+        else:
+            self.files = expand_paths(args.file, ('.xls',), args.listfile)
+        self.backend = args.backend
+        self.jobs = args.jobs
+        self.timeout = args.timeout
 
-            workbook.Close()
-            excel_app.Application.Quit()
+    def _xls2xlsx(self):
+        """ Performs the conversion from xls to xlsx
+        """
 
+        try:
+            convert_files(self.files, self.backend, SPREADSHEET, 'xlsx',
+                          self.jobs, self.timeout)
         except Exception as ex:
             print ex
-        else:
-            print u'New file %s has been written.' % new_path
 
-    def _is_file(self):
-        """ Check if given path is a valid file path
+    def _watch(self):
+        """ Keeps converting the files written in the watched folders
         """
-        return os.path.isfile(self.abspath)
+
+        try:
+            watch_folders(self.folders, ('.xls',), self.backend, SPREADSHEET, 'xlsx',
+                          self.delay)
+        except Exception as ex:
+            print ex
 
     def main(self):
         """ The main application behavior, this method should be used to
@@ -85,10 +119,13 @@ class App(object):
         """
 
         self._argparse()
-        if self._is_file():
+        if self.folders:
+            self._watch()
+        elif self.files:
             self._xls2xlsx()
 
 
 # --------------------------- SCRIPT ENTRY POINT ------------------------------
 
-App().main()
+if __name__ == '__main__':
+    App().main()